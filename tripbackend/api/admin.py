@@ -1,10 +1,16 @@
 from django.contrib import admin
 from django import forms
 from django.utils.html import format_html
+from . import fulltext, images
 # Import all relevant models
 from .models import Itinerary, ItineraryDay, Stop, Review, ItineraryPhoto
 
 
+def _thumbnail_url(obj):
+    """The small variant from api.images when it exists, else the original upload."""
+    return images.variant_urls(obj.image_variants).get('thumb', {}).get('jpeg') or obj.image.url
+
+
 class ItineraryDayModelChoiceField(forms.ModelChoiceField):
     def label_from_instance(self, obj):
         # Display the itinerary's name along with the day number
@@ -53,8 +59,10 @@ class ItineraryAdmin(admin.ModelAdmin):
     """Admin configuration for Itinerary."""
     list_display = ('name', 'destination', 'user', 'image_thumbnail', 'duration', 'price', 'status', 'rating', 'created_at')
     list_filter = ('status', 'destination', 'user') # Add filters
-    search_fields = ('name', 'destination', 'description', 'user__username') # Allow searching
-    readonly_fields = ('created_at', 'updated_at', 'rating') # Fields not directly editable here
+    # Text search goes through the full-text index (see get_search_results); these
+    # fields are only searched directly when the index is unavailable
+    search_fields = ('name', 'destination', 'description', '=user__username')
+    readonly_fields = ('created_at', 'updated_at', 'rating', 'review_count') # Fields not directly editable here
     fieldsets = (
         (None, {
             'fields': ('name', 'user', 'destination', 'status')
@@ -63,7 +71,7 @@ class ItineraryAdmin(admin.ModelAdmin):
             'fields': ('description', 'duration', ('latitude', 'longitude'), 'price', 'image')
         }),
         ('Read Only Info', {
-            'fields': ('rating', 'created_at', 'updated_at'),
+            'fields': ('rating', 'review_count', 'created_at', 'updated_at'),
             'classes': ('collapse',), # Make this section collapsible
         }),
     )
@@ -71,11 +79,17 @@ class ItineraryAdmin(admin.ModelAdmin):
 
     def image_thumbnail(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height:50px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-height:50px;" />', _thumbnail_url(obj))
         return ""
 
     image_thumbnail.short_description = "Image"
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not fulltext.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        by_creator = queryset.filter(user__username=search_term)
+        return fulltext.filter_queryset(queryset, search_term, rank=False) | by_creator, False
+
 class ReviewAdmin(admin.ModelAdmin):
     """Admin configuration for Review."""
     list_display = ('itinerary', 'user', 'rating', 'created_at')
@@ -99,7 +113,7 @@ class ItineraryPhotoAdmin(admin.ModelAdmin):
 
     def photo_thumbnail(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height:50px;" />', obj.image.url)
+            return format_html('<img src="{}" style="max-height:50px;" />', _thumbnail_url(obj))
         return ""
 
     photo_thumbnail.short_description = "Photo"
@@ -0,0 +1,400 @@
+"""
+Repeatable benchmarks for every endpoint in api.urls.
+
+run() seeds a synthetic catalog (api.seed) in a throwaway test database,
+growing it through the requested sizes, and at each size sends every
+Scenario through the full middleware stack with Django's test client. Each
+request runs inside a transaction that is rolled back afterwards, so write
+endpoints see the same data on every iteration and runs are comparable.
+
+For every scenario it records latency percentiles, the number of queries and
+the DB time (read from api.metrics, which instruments each request) and the
+memory allocated while handling one request (tracemalloc, measured in a
+separate pass because tracing slows everything down). Results are plain
+dicts, written as JSON by the run_benchmarks command and compared with an
+earlier run by compare().
+"""
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import warnings
+from dataclasses import dataclass, field
+from datetime import timedelta
+from io import BytesIO
+
+import django
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, URLResolver
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from . import leaderboards, seed, uploads
+from .bulk import create_days_and_stops, normalize_days
+from .models import Favorite, Itinerary, PasswordResetToken, Review
+
+BENCHMARK_PASSWORD = 'benchmark-Passw0rd'
+
+
+@dataclass
+class Fixtures:
+    """Rows the scenarios need besides the seeded catalog."""
+    owner: User
+    owner_token: str
+    staff_token: str
+    own_itinerary: Itinerary
+    public_itinerary: Itinerary
+    upload_image: bytes
+
+
+@dataclass
+class Scenario:
+    """
+    One request to benchmark. `prepare(fixtures, n)` runs before the n-th
+    request, inside the rolled-back transaction, and returns the request as a
+    dict: path, and optionally data, content_type and extra headers.
+    """
+    url_name: str
+    method: str
+    prepare: object
+    auth: str = None  # None, 'owner' or 'staff'
+    expected_status: tuple = (200,)
+    label: str = field(default='')
+
+    def __post_init__(self):
+        self.label = self.label or f'{self.method} {self.url_name}'
+
+
+def _json(path, payload, **extra):
+    return {'path': path, 'data': json.dumps(payload), 'content_type': 'application/json', **extra}
+
+
+def _png(size=(64, 48)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (40, 120, 200)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _start_upload(f, complete=False):
+    upload = uploads.start_upload(f.owner, 'photo.png', len(f.upload_image), 'image/png')
+    if complete:
+        uploads.append_chunk(upload, 0, BytesIO(f.upload_image), len(f.upload_image))
+    return upload
+
+
+def _review(f):
+    return Review.objects.create(user=f.owner, itinerary=f.public_itinerary, rating=4, comment='Benchmark review')
+
+
+def _batch(f, n, count=20):
+    ids = Itinerary.objects.published().order_by('pk').values_list('pk', flat=True)[:count]
+    return {'path': '/api/itineraries/batch/?ids=' + ','.join(map(str, ids))}
+
+
+def _favorites(f, count=20):
+    """Save the first `count` published itineraries as favorites of the owner; returns their ids."""
+    ids = list(Itinerary.objects.published().order_by('pk').values_list('pk', flat=True)[:count])
+    Favorite.objects.bulk_create([Favorite(user=f.owner, itinerary_id=pk) for pk in ids], ignore_conflicts=True)
+    return ids
+
+
+def _favorites_page(f, n):
+    _favorites(f)
+    return {'path': '/api/user/favorites/'}
+
+
+def _reset_token(f):
+    return PasswordResetToken.objects.create(user=f.owner, expires_at=timezone.now() + timedelta(hours=24))
+
+
+def _days_payload():
+    return [
+        {'day_number': number, 'title': f'Day {number}', 'description': 'Benchmark day',
+         'stops': [{'name': f'Stop {order}', 'stop_type': 'activity', 'location_name': 'Somewhere',
+                    'latitude': 48.85 + order / 1000, 'longitude': 2.35, 'order': order} for order in range(5)]}
+        for number in range(1, 4)
+    ]
+
+
+SCENARIOS = [
+    Scenario('register', 'POST', lambda f, n: _json('/api/register/', {
+        'email': f'bench-register-{n}@example.com', 'first_name': 'Bench', 'last_name': 'Mark',
+        'password': BENCHMARK_PASSWORD, 'password2': BENCHMARK_PASSWORD}), expected_status=(201,)),
+    Scenario('login', 'POST', lambda f, n: _json('/api/login/', {
+        'email': f.owner.username, 'password': BENCHMARK_PASSWORD})),
+    Scenario('request-password-reset', 'POST', lambda f, n: _json('/api/password-reset/', {
+        'email': f.owner.email})),
+    Scenario('validate-reset-token', 'GET', lambda f, n: {
+        'path': f'/api/password-reset/validate/{_reset_token(f).token}/'}),
+    Scenario('confirm-password-reset', 'POST', lambda f, n: _json('/api/password-reset/confirm/', {
+        'token': str(_reset_token(f).token), 'password': BENCHMARK_PASSWORD})),
+    Scenario('itinerary-list', 'GET', lambda f, n: {'path': '/api/itineraries/'}),
+    Scenario('itinerary-list', 'GET', lambda f, n: {'path': '/api/itineraries/?stream=1'},
+             label='GET itinerary-list stream'),
+    Scenario('itinerary-export', 'GET', lambda f, n: {'path': '/api/itineraries/export/'}),
+    Scenario('itinerary-search', 'GET', lambda f, n: {
+        'path': '/api/itineraries/search/?q=paris&min_duration=2&sort=rating'}, label='GET itinerary-search text'),
+    Scenario('itinerary-search', 'GET', lambda f, n: {
+        'path': '/api/itineraries/search/?max_price=1000&sort=price'}, label='GET itinerary-search filters'),
+    Scenario('itinerary-batch', 'GET', _batch),
+    Scenario('nearby-itineraries', 'GET', lambda f, n: {
+        'path': '/api/itineraries/nearby/?lat=48.8566&lng=2.3522&radius=10'}),
+    Scenario('public-itinerary-detail', 'GET', lambda f, n: {'path': f'/api/itineraries/{f.public_itinerary.pk}/'}),
+    Scenario('similar-itineraries', 'GET', lambda f, n: {
+        'path': f'/api/itineraries/{f.public_itinerary.pk}/similar/'}),
+    Scenario('itinerary-day-route', 'GET', lambda f, n: {
+        'path': f'/api/itineraries/{f.public_itinerary.pk}/days/1/route/'}),
+    Scenario('itinerary-reviews', 'GET', lambda f, n: {'path': f'/api/itineraries/{f.public_itinerary.pk}/reviews/'}),
+    Scenario('itinerary-reviews', 'POST', lambda f, n: _json(
+        f'/api/itineraries/{f.public_itinerary.pk}/reviews/', {'rating': 5, 'comment': 'Great trip'}),
+        auth='owner', expected_status=(201,)),
+    Scenario('itineraries-by-creator', 'GET', lambda f, n: {
+        'path': f'/api/itineraries/creator/{f.public_itinerary.user_id}/'}),
+    Scenario('leaderboard-list', 'GET', lambda f, n: {'path': '/api/leaderboards/'}),
+    Scenario('user-itineraries', 'GET', lambda f, n: {'path': '/api/user/itineraries/'}, auth='owner'),
+    Scenario('user-itineraries', 'POST', lambda f, n: _json('/api/user/itineraries/', {
+        'name': 'Benchmark trip', 'description': 'Created by the benchmark', 'destination': 'Paris, France',
+        'duration': 3, 'price': '500.00', 'days': json.dumps(_days_payload())}),
+        auth='owner', expected_status=(201,)),
+    Scenario('itinerary-detail', 'GET', lambda f, n: {'path': f'/api/user/itineraries/{f.own_itinerary.pk}/'},
+             auth='owner'),
+    Scenario('itinerary-detail', 'PUT', lambda f, n: _json(f'/api/user/itineraries/{f.own_itinerary.pk}/', {
+        'name': 'Benchmark trip (edited)', 'days_json': json.dumps(_days_payload())}), auth='owner'),
+    Scenario('itinerary-detail', 'DELETE', lambda f, n: {'path': f'/api/user/itineraries/{f.own_itinerary.pk}/'},
+             auth='owner', expected_status=(204,)),
+    Scenario('publish-itinerary', 'POST', lambda f, n: {
+        'path': f'/api/user/itineraries/{f.own_itinerary.pk}/publish/'}, auth='owner'),
+    Scenario('itinerary-photos', 'POST', lambda f, n: _json(
+        f'/api/user/itineraries/{f.own_itinerary.pk}/photos/',
+        {'uploads': [{'id': str(_start_upload(f, complete=True).pk), 'caption': 'Benchmark'}]}),
+        auth='owner', expected_status=(201,)),
+    Scenario('user-favorites', 'GET', _favorites_page, auth='owner'),
+    Scenario('user-favorites', 'POST', lambda f, n: _json('/api/user/favorites/', {
+        'itinerary': f.public_itinerary.pk}), auth='owner', expected_status=(201,)),
+    Scenario('import-favorites', 'POST', lambda f, n: _json('/api/user/favorites/import/', {
+        'itineraries': list(Itinerary.objects.published().order_by('-pk').values_list('pk', flat=True)[:50])}),
+        auth='owner'),
+    Scenario('user-favorite-detail', 'GET', lambda f, n: {'path': f'/api/user/favorites/{_favorites(f, 1)[0]}/'},
+             auth='owner'),
+    Scenario('user-favorite-detail', 'DELETE', lambda f, n: {
+        'path': f'/api/user/favorites/{_favorites(f, 1)[0]}/'}, auth='owner', expected_status=(204,)),
+    Scenario('upload-list', 'POST', lambda f, n: _json('/api/uploads/', {
+        'filename': 'photo.png', 'size': 1024, 'content_type': 'image/png'}), auth='owner', expected_status=(201,)),
+    Scenario('upload-detail', 'GET', lambda f, n: {'path': f'/api/uploads/{_start_upload(f).pk}/'}, auth='owner'),
+    Scenario('upload-detail', 'PUT', lambda f, n: {
+        'path': f'/api/uploads/{_start_upload(f).pk}/', 'data': f.upload_image,
+        'content_type': 'application/octet-stream', 'HTTP_UPLOAD_OFFSET': '0'}, auth='owner'),
+    Scenario('review-detail', 'PUT', lambda f, n: _json(f'/api/reviews/{_review(f).pk}/', {'rating': 3}),
+             auth='owner'),
+    Scenario('review-detail', 'DELETE', lambda f, n: {'path': f'/api/reviews/{_review(f).pk}/'},
+             auth='owner', expected_status=(204,)),
+    Scenario('metrics', 'GET', lambda f, n: {'path': '/api/internal/metrics/'}, auth='staff'),
+]
+
+
+def url_names(patterns=None):
+    """Names of all URL patterns under api.urls."""
+    from . import urls
+
+    names = set()
+    for pattern in urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            names |= url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def uncovered_url_names():
+    return sorted(url_names() - {scenario.url_name for scenario in SCENARIOS})
+
+
+def create_fixtures():
+    owner = User.objects.create_user('bench-owner@example.com', 'bench-owner@example.com', BENCHMARK_PASSWORD,
+                                     first_name='Bench', last_name='Owner')
+    staff = User.objects.create_user('bench-staff@example.com', 'bench-staff@example.com', BENCHMARK_PASSWORD,
+                                     is_staff=True)
+    own_itinerary = Itinerary.objects.create(
+        user=owner, name='Benchmark trip', description='Owned by the benchmark user', destination='Paris, France',
+        duration=3, price=500)
+    create_days_and_stops([(own_itinerary, normalize_days(_days_payload()))])
+    # A typical published itinerary: the one with the median number of reviews
+    published = Itinerary.objects.published().exclude(user=owner).order_by('review_count', 'pk')
+    public_itinerary = published[published.count() // 2]
+    leaderboards.refresh()
+    return Fixtures(
+        owner=owner,
+        owner_token=Token.objects.create(user=owner).key,
+        staff_token=Token.objects.create(user=staff).key,
+        own_itinerary=own_itinerary,
+        public_itinerary=public_itinerary,
+        upload_image=_png(),
+    )
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def _send(client, scenario, fixtures, n):
+    request = scenario.prepare(fixtures, n)
+    path = request.pop('path')
+    data = request.pop('data', '')
+    content_type = request.pop('content_type', 'application/octet-stream')
+    if scenario.auth:
+        token = fixtures.owner_token if scenario.auth == 'owner' else fixtures.staff_token
+        request['HTTP_AUTHORIZATION'] = f'Token {token}'
+    start = time.perf_counter()
+    response = client.generic(scenario.method, path, data, content_type, **request)
+    # A streaming response does its work while the body is read
+    size = sum(len(chunk) for chunk in response.streaming_content) if response.streaming else len(response.content)
+    return response, time.perf_counter() - start, size
+
+
+def measure(scenario, fixtures, iterations=20, warmup=3, allocation_iterations=3):
+    """Benchmark one scenario; returns a dict of results."""
+    client = Client()
+    latencies, queries, db_times, sizes, statuses = [], [], [], [], set()
+    for n in range(warmup + iterations):
+        with transaction.atomic():
+            response, elapsed, size = _send(client, scenario, fixtures, n)
+            transaction.set_rollback(True)
+        if n < warmup:
+            continue
+        latencies.append(elapsed)
+        statuses.add(response.status_code)
+        metrics = response.wsgi_request.metrics
+        queries.append(metrics.queries)
+        db_times.append(metrics.db_time)
+        sizes.append(size)
+
+    peaks = []
+    tracemalloc.start()
+    try:
+        for n in range(allocation_iterations):
+            with transaction.atomic():
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                _send(client, scenario, fixtures, warmup + iterations + n)
+                peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+                transaction.set_rollback(True)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'scenario': scenario.label,
+        'url_name': scenario.url_name,
+        'method': scenario.method,
+        'status': sorted(statuses),
+        'ok': statuses <= set(scenario.expected_status),
+        'iterations': iterations,
+        'latency_ms': {
+            'min': round(min(latencies) * 1000, 3),
+            'mean': round(statistics.fmean(latencies) * 1000, 3),
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'max': round(max(latencies) * 1000, 3),
+        },
+        'queries': max(queries),
+        'db_ms': round(statistics.fmean(db_times) * 1000, 3),
+        'response_bytes': max(sizes),
+        'alloc_peak_kib': round(statistics.median(peaks) / 1024, 1) if peaks else None,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, scenarios=None, iterations=20, warmup=3, allocation_iterations=3, seed_options=None,
+        use_cache=False, progress=None):
+    """
+    Benchmark `scenarios` (default: all) at each catalog size in `sizes`, in a
+    fresh test database. `seed_options` are passed to seed.seed_catalog().
+    Without `use_cache` the response cache is replaced by a dummy cache, so
+    the numbers measure the views rather than cache hits.
+    """
+    scenarios = SCENARIOS if scenarios is None else scenarios
+    temp_dir = tempfile.mkdtemp(prefix='benchmarks-')
+    test_settings = {
+        'MEDIA_ROOT': os.path.join(temp_dir, 'media'),
+        'UPLOAD_TEMP_DIR': os.path.join(temp_dir, 'uploads'),
+        'IMAGE_VARIANT_WORKERS': 0,
+    }
+    if not use_cache:
+        test_settings['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+    results = {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'cache': use_cache,
+            'uncovered': uncovered_url_names(),
+        },
+        'sizes': [],
+    }
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(**test_settings), warnings.catch_warnings():
+            # request_password_reset stores a naive expiry time; don't warn on every iteration
+            warnings.filterwarnings('ignore', message=r'.*received a naive datetime', category=RuntimeWarning)
+            seeded = 0
+            fixtures = None
+            for size in sorted(sizes):
+                seed.seed_catalog(size - seeded, seed=size, **(seed_options or {}))
+                seeded = size
+                if fixtures is None:
+                    fixtures = create_fixtures()
+                entry = {'itineraries': size, 'results': []}
+                for scenario in scenarios:
+                    result = measure(scenario, fixtures, iterations, warmup, allocation_iterations)
+                    entry['results'].append(result)
+                    if progress:
+                        progress(size, result)
+                results['sizes'].append(entry)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+def compare(baseline, current):
+    """
+    Rows of (size, scenario, baseline p50, current p50, change in %, baseline
+    queries, current queries) for the scenarios present in both runs.
+    """
+    def index(results):
+        return {(entry['itineraries'], result['scenario']): result
+                for entry in results['sizes'] for result in entry['results']}
+
+    before = index(baseline)
+    rows = []
+    for key, result in index(current).items():
+        if key not in before:
+            continue
+        old_p50, new_p50 = before[key]['latency_ms']['p50'], result['latency_ms']['p50']
+        change = (new_p50 - old_p50) / old_p50 * 100 if old_p50 else 0.0
+        rows.append((*key, old_p50, new_p50, round(change, 1), before[key]['queries'], result['queries']))
+    return rows
@@ -0,0 +1,247 @@
+"""
+Helpers for writing itinerary days and stops in bulk.
+
+Nested day/stop payloads arrive from the create/edit pages as JSON. They are
+normalized here into the shape ItineraryDaySerializer validates, and validated
+days are written with one bulk_create per table rather than one INSERT per row,
+and edits are applied as a diff against the stored days with bulk_update.
+bulk_create/bulk_update bypass Model.save() and signals, so these helpers fill
+in the stop geohash themselves and callers must refresh the full-text index.
+Both also store the route of every day whose stops they wrote (see api.routes).
+"""
+import json
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+
+from . import routes
+from .geo import geohash_for
+from .models import ItineraryDay, Stop
+
+COORDINATE_QUANTUM = Decimal('0.000001')
+
+DAY_UPDATE_FIELDS = ('title', 'description')
+STOP_UPDATE_FIELDS = (
+    'name', 'description', 'stop_type', 'location_name',
+    'latitude', 'longitude', 'geohash', 'order',
+)
+# bulk_update does not fill auto_now fields; apply_days_diff stamps these itself
+AUTO_NOW_FIELDS = ('updated_at',)
+# Fields a stop needs when it is inserted rather than updated in place
+STOP_REQUIRED_FIELDS = ('name', 'latitude', 'longitude')
+
+
+def _round_coordinate(value):
+    # Coordinates are stored with 6 decimal places; round longer values from
+    # the map widgets instead of rejecting them
+    if value in (None, ''):
+        return value
+    try:
+        return str(Decimal(str(value)).quantize(COORDINATE_QUANTUM))
+    except (InvalidOperation, ValueError):
+        return value
+
+
+def normalize_stop(stop_data):
+    stop_data = dict(stop_data)
+    if 'location_name' not in stop_data and 'address' in stop_data:
+        stop_data['location_name'] = stop_data.pop('address')
+    for field in ('latitude', 'longitude'):
+        if field in stop_data:
+            stop_data[field] = _round_coordinate(stop_data[field])
+    return stop_data
+
+
+def normalize_days(days_data):
+    """
+    Normalize a list of day dicts for validation: stops sent as a JSON string
+    are decoded, `address` is accepted for `location_name`, and coordinates are
+    rounded. A day without a `stops` key is left without one. Raises ValueError
+    if the payload is not a list of objects.
+    """
+    if not isinstance(days_data, list):
+        raise ValueError("Expected a list of days.")
+    days = []
+    for day_data in days_data:
+        if not isinstance(day_data, dict):
+            raise ValueError("Each day must be an object.")
+        day_data = dict(day_data)
+        if 'stops' not in day_data:
+            days.append(_with_default_title(day_data))
+            continue
+        stops_data = day_data.pop('stops') or []
+        if isinstance(stops_data, str):
+            try:
+                stops_data = json.loads(stops_data)
+            except json.JSONDecodeError:
+                raise ValueError(f"Invalid stops JSON for day {day_data.get('day_number', 'N/A')}.")
+        if not isinstance(stops_data, list) or not all(isinstance(stop, dict) for stop in stops_data):
+            raise ValueError(f"Stops for day {day_data.get('day_number', 'N/A')} must be a list of objects.")
+        day_data['stops'] = [normalize_stop(stop) for stop in stops_data]
+        days.append(_with_default_title(day_data))
+    return days
+
+
+def _with_default_title(day_data):
+    if not day_data.get('title') and day_data.get('day_number') is not None:
+        day_data['title'] = f"Day {day_data['day_number']}"
+    return day_data
+
+
+def build_stop(day, stop_data):
+    stop_data = dict(stop_data)
+    if 'location_name' not in stop_data:
+        lat = stop_data.get('latitude', '0')
+        lng = stop_data.get('longitude', '0')
+        stop_data['location_name'] = f"Location: {lat}, {lng}"
+    stop = Stop(itinerary_day=day, **stop_data)
+    stop.geohash = geohash_for(stop.latitude, stop.longitude)
+    return stop
+
+
+def create_days_and_stops(itinerary_days, batch_size=None):
+    """
+    Insert validated days and their stops for any number of itineraries.
+
+    `itinerary_days` is an iterable of (itinerary, days) pairs where `days` is
+    validated ItineraryDaySerializer data. Runs one bulk INSERT for the days and
+    one for the stops (per batch_size rows). Returns (days, stops) created.
+    """
+    days = []
+    stops_per_day = []
+    for itinerary, days_data in itinerary_days:
+        for day_data in days_data:
+            day_data = dict(day_data)
+            stops_data = day_data.pop('stops', None) or []
+            stops_per_day.append(stops_data)
+            days.append(ItineraryDay(itinerary=itinerary, **day_data, **routes.route_fields(stops_data)))
+    ItineraryDay.objects.bulk_create(days, batch_size=batch_size)
+
+    stops = [
+        build_stop(day, stop_data)
+        for day, stops_data in zip(days, stops_per_day)
+        for stop_data in stops_data
+    ]
+    Stop.objects.bulk_create(stops, batch_size=batch_size)
+    return days, stops
+
+
+@dataclass
+class DaysDiff:
+    """Counts of the rows written by apply_days_diff()."""
+    days_created: int = 0
+    days_updated: int = 0
+    days_deleted: int = 0
+    stops_created: int = 0
+    stops_updated: int = 0
+    stops_deleted: int = 0
+
+
+def _assign(instance, values, fields):
+    changed = False
+    for field in fields:
+        if field in values and getattr(instance, field) != values[field]:
+            setattr(instance, field, values[field])
+            changed = True
+    return changed
+
+
+def apply_days_diff(itinerary, days_data, batch_size=None):
+    """
+    Make the itinerary's stored days and stops match `days_data`.
+
+    `days_data` is validated ItineraryDaySerializer data in partial mode, with
+    each stop's `id` kept. It lists every day the itinerary should have: days
+    are matched to stored ones by day_number, stored days missing from the
+    list are deleted along with their stops. A day that carries a `stops` list
+    gets exactly those stops: entries whose id names a stop of this itinerary
+    update it in place (it may move between days), the rest are inserted, and
+    the day's other stops are deleted. A day without `stops` keeps its stops.
+
+    The stored rows are loaded once and the changes applied with at most one
+    bulk INSERT, one bulk UPDATE and one DELETE per table, whatever the number
+    of rows, and the routes of the days whose stops changed are refreshed in
+    one more pass. Call inside transaction.atomic(). Raises ValueError if a stop to
+    insert lacks one of STOP_REQUIRED_FIELDS. Returns a DaysDiff.
+    """
+    stored_days = {day.day_number: day for day in ItineraryDay.objects.filter(itinerary=itinerary)}
+    stored_stops = {stop.pk: stop for stop in Stop.objects.filter(itinerary_day__itinerary=itinerary)}
+
+    new_days, changed_days, submitted = [], [], []
+    for day_data in days_data:
+        day_data = dict(day_data)
+        stops_data = day_data.pop('stops', None)
+        day = stored_days.pop(day_data['day_number'], None)
+        if day is None:
+            day = ItineraryDay(itinerary=itinerary, **day_data)
+            new_days.append(day)
+        elif _assign(day, day_data, DAY_UPDATE_FIELDS):
+            changed_days.append(day)
+        submitted.append((day, stops_data))
+
+    # Days are created first so new stops can point at them
+    ItineraryDay.objects.bulk_create(new_days, batch_size=batch_size)
+
+    new_stops, changed_stops, kept_stop_ids, replaced_day_ids, moved_from_day_ids = [], [], set(), set(), set()
+    for day, stops_data in submitted:
+        if stops_data is None:
+            kept_stop_ids.update(pk for pk, stop in stored_stops.items() if stop.itinerary_day_id == day.pk)
+            continue
+        replaced_day_ids.add(day.pk)
+        for stop_data in stops_data:
+            stop_data = dict(stop_data)
+            stop = stored_stops.get(stop_data.pop('id', None))
+            if stop is None or stop.pk in kept_stop_ids:
+                missing = [field for field in STOP_REQUIRED_FIELDS if stop_data.get(field) in (None, '')]
+                if missing:
+                    raise ValueError(
+                        f"New stop on day {day.day_number} is missing: {', '.join(missing)}.")
+                new_stops.append(build_stop(day, stop_data))
+                continue
+            kept_stop_ids.add(stop.pk)
+            moved = stop.itinerary_day_id != day.pk
+            if moved:
+                moved_from_day_ids.add(stop.itinerary_day_id)
+            stop.itinerary_day_id = day.pk
+            if _assign(stop, stop_data, STOP_UPDATE_FIELDS) or moved:
+                stop.geohash = geohash_for(stop.latitude, stop.longitude)
+                changed_stops.append(stop)
+
+    removed_stop_ids = [
+        pk for pk, stop in stored_stops.items()
+        if pk not in kept_stop_ids and stop.itinerary_day_id in replaced_day_ids
+    ]
+    removed_day_ids = [day.pk for day in stored_days.values()]
+
+    now = timezone.now()
+    for row in changed_days + changed_stops:
+        row.updated_at = now
+    if changed_days:
+        ItineraryDay.objects.bulk_update(changed_days, DAY_UPDATE_FIELDS + AUTO_NOW_FIELDS, batch_size=batch_size)
+    if changed_stops:
+        Stop.objects.bulk_update(
+            changed_stops, ('itinerary_day',) + STOP_UPDATE_FIELDS + AUTO_NOW_FIELDS, batch_size=batch_size)
+    Stop.objects.bulk_create(new_stops, batch_size=batch_size)
+    if removed_stop_ids:
+        Stop.objects.filter(pk__in=removed_stop_ids).delete()
+    if removed_day_ids:
+        # Deleting a day cascades to any of its stops that were not moved away
+        ItineraryDay.objects.filter(pk__in=removed_day_ids).delete()
+
+    route_day_ids = (replaced_day_ids | moved_from_day_ids | {day.pk for day in new_days}) - set(removed_day_ids)
+    if route_day_ids:
+        routes.refresh_days(route_day_ids, batch_size=batch_size)
+
+    return DaysDiff(
+        days_created=len(new_days), days_updated=len(changed_days), days_deleted=len(removed_day_ids),
+        stops_created=len(new_stops), stops_updated=len(changed_stops), stops_deleted=len(removed_stop_ids),
+    )
+
+
+def default_days(duration):
+    """Placeholder days for an itinerary created without a day plan."""
+    return [
+        {'day_number': day_number, 'title': f"Day {day_number}", 'description': ""}
+        for day_number in range(1, duration + 1)
+    ]
@@ -0,0 +1,105 @@
+"""
+Conditional GET (ETag / Last-Modified) for itinerary documents.
+
+Validators come from one aggregate query over the itinerary row and its
+children instead of from the serialized response, so a client holding a
+current copy gets a 304 before the nested document is fetched or serialized.
+Each child table contributes its newest timestamp and its row count; the count
+catches deletions, which leave no newer timestamp behind.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .models import Itinerary, ItineraryDay, ItineraryPhoto, Review, Stop
+
+# (model, lookup from the child to the itinerary, timestamp field) per child table
+CHILD_TABLES = {
+    'days': (ItineraryDay, 'itinerary', 'updated_at'),
+    'stops': (Stop, 'itinerary_day__itinerary', 'updated_at'),
+    'photos': (ItineraryPhoto, 'itinerary', 'uploaded_at'),
+    'reviews': (Review, 'itinerary', 'updated_at'),
+}
+DOCUMENT = ('days', 'stops', 'photos', 'reviews')
+REVIEWS = ('reviews',)
+ROUTES = ('days', 'stops')
+
+
+def _child_stats(name):
+    model, lookup, timestamp = CHILD_TABLES[name]
+    children = model.objects.filter(**{lookup: OuterRef('pk')}).order_by().values(lookup)
+    return {
+        f'{name}_updated': Subquery(children.annotate(latest=Max(timestamp)).values('latest')),
+        f'{name}_count': Subquery(children.annotate(total=Count('pk')).values('total'),
+                                  output_field=IntegerField()),
+    }
+
+
+def itinerary_validators(pk, children=DOCUMENT, published=False):
+    """
+    Return (etag, last_modified) for an itinerary and the given child tables,
+    or None if there is no such itinerary. last_modified is a datetime or None.
+    """
+    queryset = Itinerary.objects.published() if published else Itinerary.objects.all()
+    annotations = {}
+    for name in children:
+        annotations.update(_child_stats(name))
+    row = queryset.filter(pk=pk).annotate(**annotations).values('updated_at', *annotations).first()
+    if row is None:
+        return None
+
+    timestamps = [row['updated_at']] + [row[f'{name}_updated'] for name in children]
+    last_modified = max((value for value in timestamps if value is not None), default=None)
+    fingerprint = '|'.join(str(row[key]) for key in sorted(row))
+    etag = '"%s"' % hashlib.sha1(f'{pk}|{fingerprint}'.encode('utf-8')).hexdigest()
+    return etag, last_modified
+
+
+def not_modified_response(request, etag, last_modified):
+    """A 304 response if the request's validators match, else None."""
+    return get_conditional_response(
+        request, etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def set_validators(response, etag, last_modified, private=False):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Let clients keep a copy but revalidate it on every use
+    if private:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_itinerary(children=DOCUMENT, published=False, private=False):
+    """
+    Answer conditional GETs of a function-based itinerary view (URL kwarg `pk`)
+    with 304 when nothing in `children` changed. Place directly above the view
+    function; other methods pass through untouched.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            validators = itinerary_validators(kwargs['pk'], children, published)
+            if validators is None:
+                # Let the view produce its own 404
+                return view(request, *args, **kwargs)
+
+            not_modified = not_modified_response(request, *validators)
+            if not_modified is not None:
+                return set_validators(not_modified, *validators, private=private)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                set_validators(response, *validators, private=private)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,88 @@
+"""
+Streaming serialization of the published catalog.
+
+The whole catalog is never held in memory: rows are read with
+QuerySet.iterator(chunk_size), related days, stops and photos are prefetched
+one chunk at a time, and output is produced incrementally, flushed in
+buffers of about STREAM_BUFFER_SIZE bytes. Used by the streaming mode of
+itinerary_list (one JSON array), the NDJSON export endpoint and the
+export_catalog command (one full itinerary document per line).
+"""
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Itinerary
+
+CHUNK_SIZE = 500
+STREAM_BUFFER_SIZE = 64 * 1024
+
+_encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def catalog_queryset():
+    """Published itineraries newest first, the order of the paginated list."""
+    return Itinerary.objects.published().order_by('-created_at', '-id')
+
+
+def summary_rows(chunk_size=CHUNK_SIZE):
+    """Listing-card rows (see ItinerarySummarySerializer) of the whole published catalog."""
+    from .serializers import ItinerarySummarySerializer
+
+    serializer = ItinerarySummarySerializer()
+    for row in catalog_queryset().summaries().iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(row)
+
+
+def documents(chunk_size=CHUNK_SIZE, request=None):
+    """
+    Full itinerary documents (ItinerarySerializer: days, stops, photo URLs,
+    rating aggregates) of the whole published catalog.
+    """
+    from .serializers import ItinerarySerializer
+
+    serializer = ItinerarySerializer(context={'request': request})
+    # With chunk_size, iterator() runs the prefetches once per chunk
+    for itinerary in catalog_queryset().with_details().iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(itinerary)
+
+
+def _buffered(pieces):
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= STREAM_BUFFER_SIZE:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def json_array(items):
+    """Encode `items` as one JSON array, yielding bytes as it goes."""
+    def pieces():
+        yield '['
+        for index, item in enumerate(items):
+            yield ',' if index else ''
+            yield _encoder.encode(item)
+        yield ']'
+    return _buffered(pieces())
+
+
+def ndjson(items):
+    """Encode `items` as newline-delimited JSON, one item per line, yielding bytes."""
+    return _buffered(_encoder.encode(item) + '\n' for item in items)
+
+
+def write_ndjson(file, chunk_size=CHUNK_SIZE):
+    """Write every published itinerary document to a binary file; returns the number written."""
+    count = 0
+
+    def counted():
+        nonlocal count
+        for document in documents(chunk_size=chunk_size):
+            count += 1
+            yield document
+
+    for data in ndjson(counted()):
+        file.write(data)
+    return count
@@ -0,0 +1,182 @@
+"""
+Full-text index over itinerary content, backed by an SQLite FTS5 table.
+
+The api_itinerary_fts table holds one document per itinerary (rowid = itinerary
+id) with the itinerary's name, destination and description, the titles of its
+days and the names/locations of its stops. api.signals keeps it in sync on
+save/delete; code that writes days or stops with bulk_create/bulk_update must
+call index_itineraries() itself.
+
+On other database backends every function falls back to icontains filters.
+"""
+import re
+import threading
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'api_itinerary_fts'
+FTS_COLUMNS = ('name', 'destination', 'description', 'day_titles', 'stop_text')
+# bm25 weights, in FTS_COLUMNS order: matches in the name count most
+FTS_WEIGHTS = (10.0, 8.0, 2.0, 3.0, 4.0)
+
+CREATE_FTS_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    f"USING fts5({', '.join(FTS_COLUMNS)}, tokenize='porter unicode61')"
+)
+DROP_FTS_TABLE_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_local = threading.local()
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """
+    Turn free text typed by a user into an FTS5 MATCH expression: every word
+    must match, as a prefix. Returns None when the text has no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(query or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _documents(itinerary_ids):
+    from .models import Itinerary, ItineraryDay, Stop
+
+    documents = {
+        row['id']: {
+            'name': row['name'],
+            'destination': row['destination'],
+            'description': row['description'],
+            'day_titles': [],
+            'stop_text': [],
+        }
+        for row in Itinerary.objects.filter(id__in=itinerary_ids).values('id', 'name', 'destination', 'description')
+    }
+    for itinerary_id, title in ItineraryDay.objects.filter(itinerary_id__in=documents).values_list(
+            'itinerary_id', 'title'):
+        documents[itinerary_id]['day_titles'].append(title)
+    for itinerary_id, name, location_name in Stop.objects.filter(
+            itinerary_day__itinerary_id__in=documents).values_list(
+            'itinerary_day__itinerary_id', 'name', 'location_name'):
+        documents[itinerary_id]['stop_text'].extend((name, location_name))
+    return documents
+
+
+@contextmanager
+def deferred_indexing():
+    """
+    Collect index_itineraries()/index_days() calls made inside the block and
+    index each itinerary once on exit, e.g. while saving an itinerary and then
+    its days.
+    """
+    if getattr(_local, 'pending', None) is not None:
+        yield
+        return
+    _local.pending = pending = set()
+    _local.pending_days = pending_days = set()
+    try:
+        yield
+    finally:
+        _local.pending = _local.pending_days = None
+    if pending_days:
+        pending.update(_itineraries_for_days(pending_days))
+    index_itineraries(pending)
+
+
+def _itineraries_for_days(day_ids):
+    from .models import ItineraryDay
+
+    return ItineraryDay.objects.filter(pk__in=day_ids).values_list('itinerary_id', flat=True).distinct()
+
+
+def index_days(day_ids):
+    """(Re)index the itineraries owning the given days, e.g. after a stop changed."""
+    pending_days = getattr(_local, 'pending_days', None)
+    if pending_days is not None:
+        pending_days.update(day_ids)
+        return
+    index_itineraries(_itineraries_for_days(set(day_ids)))
+
+
+def index_itineraries(itinerary_ids):
+    """(Re)index the given itineraries, dropping entries for ones that no longer exist."""
+    pending = getattr(_local, 'pending', None)
+    if pending is not None:
+        pending.update(itinerary_ids)
+        return
+    itinerary_ids = list(set(itinerary_ids))
+    if not itinerary_ids or not is_available():
+        return
+    documents = _documents(itinerary_ids)
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(itinerary_ids))
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", itinerary_ids)
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s, %s)",
+            [
+                (itinerary_id, doc['name'], doc['destination'], doc['description'],
+                 '\n'.join(doc['day_titles']), '\n'.join(doc['stop_text']))
+                for itinerary_id, doc in documents.items()
+            ],
+        )
+
+
+def remove_itineraries(itinerary_ids):
+    itinerary_ids = list(set(itinerary_ids))
+    if not itinerary_ids or not is_available():
+        return
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(itinerary_ids))
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", itinerary_ids)
+
+
+def rebuild_index(batch_size=1000):
+    """Rebuild the whole index from the Itinerary, ItineraryDay and Stop tables."""
+    from .models import Itinerary
+
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    ids = list(Itinerary.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        index_itineraries(ids[start:start + batch_size])
+
+
+def _rank_sql():
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return (
+        f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = api_itinerary.id"
+    )
+
+
+def filter_queryset(queryset, query, rank=True):
+    """
+    Restrict an Itinerary queryset to rows matching `query`.
+
+    With rank=True the rows are annotated with `search_rank` (lower is more
+    relevant) and ordered by it.
+    """
+    expression = match_expression(query)
+    if expression is None:
+        return queryset.none()
+    if not is_available():
+        return queryset.filter(
+            Q(name__icontains=query) | Q(destination__icontains=query) | Q(description__icontains=query)
+        )
+    queryset = queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression])
+    )
+    if rank:
+        queryset = queryset.annotate(search_rank=RawSQL(_rank_sql(), [expression])).order_by('search_rank', 'id')
+    return queryset
+
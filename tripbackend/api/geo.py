@@ -0,0 +1,149 @@
+"""
+Geohash helpers used to index Itinerary and Stop coordinates.
+
+Both models store a geohash of their coordinates in an indexed column. A
+radius query is answered by covering the query's bounding box with a small
+set of coarser geohash cells, fetching rows whose geohash falls in one of
+those prefixes (an index range scan each), pruning by the exact bounding box
+and finally ranking the survivors by haversine distance.
+"""
+import math
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+# Upper bound on the number of prefix ranges a single radius query scans
+MAX_COVER_CELLS = 32
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate pair as a geohash string of the given length."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude = float(latitude)
+    longitude = float(longitude)
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_for(latitude, longitude):
+    """Geohash to store for a model row; blank when coordinates are missing."""
+    if latitude is None or longitude is None:
+        return ''
+    return encode_geohash(latitude, longitude)
+
+
+def cell_size(precision):
+    """Return (height, width) in degrees of a geohash cell of the given length."""
+    total_bits = 5 * precision
+    lat_bits = total_bits // 2
+    lng_bits = total_bits - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometres between two points."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (float(lat1), float(lng1), float(lat2), float(lng2)))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Return (south, north, lng_ranges) enclosing a circle of radius_km.
+
+    lng_ranges is a list of (west, east) pairs; it has two entries when the
+    box crosses the antimeridian and spans every longitude near the poles.
+    """
+    latitude = float(latitude)
+    longitude = float(longitude)
+    delta_lat = radius_km / KM_PER_DEGREE_LAT
+    south = latitude - delta_lat
+    north = latitude + delta_lat
+    if south <= -90 or north >= 90:
+        return max(south, -90.0), min(north, 90.0), [(-180.0, 180.0)]
+
+    delta_lng = delta_lat / math.cos(math.radians(latitude))
+    west = longitude - delta_lng
+    east = longitude + delta_lng
+    if delta_lng >= 180:
+        return south, north, [(-180.0, 180.0)]
+    if west < -180:
+        return south, north, [(west + 360, 180.0), (-180.0, east)]
+    if east > 180:
+        return south, north, [(west, 180.0), (-180.0, east - 360)]
+    return south, north, [(west, east)]
+
+
+def _steps(start, stop, step):
+    value = start
+    while value < stop:
+        yield value
+        value += step
+    yield stop
+
+
+def _cover(south, north, lng_ranges, precision):
+    height, width = cell_size(precision)
+    cells = set()
+    for west, east in lng_ranges:
+        for lat in _steps(south, north, height):
+            for lng in _steps(west, east, width):
+                cells.add(encode_geohash(lat, lng, precision))
+    return cells
+
+
+def covering_cells(south, north, lng_ranges):
+    """
+    Return the set of geohash prefixes covering a bounding box, using the
+    finest precision that needs at most MAX_COVER_CELLS cells.
+    """
+    best = {''}
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        estimate = sum(
+            (math.ceil((north - south) / height) + 1) * (math.ceil((east - west) / width) + 1)
+            for west, east in lng_ranges
+        )
+        if estimate > MAX_COVER_CELLS:
+            break
+        best = _cover(south, north, lng_ranges, precision)
+    return best
+
+
+def geohash_prefix_ranges(prefixes):
+    """
+    Turn geohash prefixes into half-open (low, high) string ranges so that
+    prefix matching can use the column's index. Every geohash character sorts
+    below '~', so prefix + '~' bounds all hashes starting with prefix.
+    """
+    return [(prefix, prefix + '~') for prefix in sorted(prefixes) if prefix]
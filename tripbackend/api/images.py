@@ -0,0 +1,212 @@
+"""
+Resized variants of itinerary cover images and photos.
+
+Every uploaded image gets a small set of derivatives (see VARIANTS), each
+encoded as WebP and JPEG, stored next to the original under `variants/`. The
+storage names are recorded in the model's `image_variants` JSON field:
+
+    {"source": "itineraries/rome.png",
+     "thumb": {"width": 160, "height": 160, "webp": "...", "jpeg": "..."}, ...}
+
+`source` is the image the variants were made from, so a replaced image is
+detected by comparing it with the current file name. An image that cannot be
+decoded is recorded as {"source": ..., "error": ...} and not tried again
+until it is replaced (or the backfill command runs with --force). Variants are generated
+after the upload's transaction commits, on a small thread pool, so requests
+never wait on image decoding; until then `image_variants` is empty and
+clients fall back to the original.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height, crop). Cropped variants are cut to exactly that box,
+# the others are scaled down to fit inside it and never scaled up.
+VARIANTS = {
+    'thumb': (160, 160, True),
+    'card': (640, 400, True),
+    'full': (1600, 1600, False),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANT_DIRECTORY = 'variants'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS, thread_name_prefix='image-variants')
+        return _executor
+
+
+def variant_name(source, variant, extension):
+    directory, filename = os.path.split(source)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, VARIANT_DIRECTORY, f'{stem}_{variant}.{extension}')
+
+
+def _resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((width, height), Image.Resampling.LANCZOS)
+    return resized
+
+
+def _encode(image, image_format, options):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha channel: flatten transparent areas onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def generate_variants(source, storage=default_storage):
+    """
+    Write every variant of the stored image `source` and return the
+    `image_variants` mapping describing them. Raises OSError (including
+    PIL.UnidentifiedImageError) if the file cannot be read as an image, and
+    PIL.Image.DecompressionBombError if it is too large to decode.
+    """
+    with storage.open(source, 'rb') as file:
+        with Image.open(file) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'RGBA'):
+                original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+            original.load()
+
+    variants = {'source': source}
+    for variant, (width, height, crop) in VARIANTS.items():
+        resized = _resize(original, width, height, crop)
+        entry = {'width': resized.width, 'height': resized.height}
+        for extension, (image_format, options) in FORMATS.items():
+            name = variant_name(source, variant, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            entry[extension] = storage.save(name, ContentFile(_encode(resized, image_format, options)))
+        variants[variant] = entry
+    return variants
+
+
+def delete_variants(variants, storage=default_storage):
+    for variant in VARIANTS:
+        for extension in FORMATS:
+            name = (variants or {}).get(variant, {}).get(extension)
+            if name and storage.exists(name):
+                storage.delete(name)
+
+
+def needs_variants(instance):
+    return bool(instance.image) and (instance.image_variants or {}).get('source') != instance.image.name
+
+
+def process(model, pk):
+    """
+    Generate variants for one row and store them, or the error if the image
+    cannot be decoded. Skips rows whose image was removed or replaced
+    meanwhile; returns True if variants were written.
+    """
+    from . import response_cache
+    from .models import Itinerary, ItineraryPhoto
+
+    row = model.objects.filter(pk=pk).first()
+    if row is None or not needs_variants(row):
+        return False
+    source = row.image.name
+    try:
+        variants = generate_variants(source)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning("Could not generate variants for %s %s (%s): %s", model.__name__, pk, source, e)
+        variants = {'source': source, 'error': str(e)}
+
+    now = timezone.now()
+    updated = model.objects.filter(pk=pk, image=source).update(image_variants=variants)
+    if not updated:
+        # The image changed while the variants were being generated
+        delete_variants(variants)
+        return False
+    delete_variants({key: value for key, value in (row.image_variants or {}).items()
+                     if key != 'source' and value != variants.get(key)})
+
+    # update() skips signals and auto_now: touch the itinerary so ETags and
+    # cached responses pick up the new URLs
+    if model is ItineraryPhoto:
+        Itinerary.objects.filter(pk=row.itinerary_id).update(updated_at=now)
+        response_cache.invalidate(itineraries=[row.itinerary_id])
+    else:
+        Itinerary.objects.filter(pk=pk).update(updated_at=now)
+        response_cache.invalidate(summaries=[pk], creators=[row.user_id] if row.user_id else [])
+    if 'error' in variants:
+        return False
+    logger.info("Generated image variants for %s %s", model.__name__, pk)
+    return True
+
+
+def _run(model, pk):
+    close_old_connections()
+    try:
+        process(model, pk)
+    except Exception:
+        logger.exception("Image variant job failed for %s %s", model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule(instances):
+    """
+    Generate variants for the given Itinerary/ItineraryPhoto instances once the
+    current transaction commits: on the worker pool, or inline when
+    settings.IMAGE_VARIANT_WORKERS is 0.
+    """
+    jobs = [(type(instance), instance.pk) for instance in instances if needs_variants(instance)]
+    if not jobs:
+        return
+
+    def submit():
+        for model, pk in jobs:
+            if settings.IMAGE_VARIANT_WORKERS:
+                _get_executor().submit(_run, model, pk)
+            else:
+                process(model, pk)
+
+    transaction.on_commit(submit)
+
+
+def variant_urls(variants, request=None):
+    """
+    Map `image_variants` to public URLs for API responses, e.g.
+    {"card": {"width": 640, "height": 400, "webp": url, "jpeg": url}}.
+    """
+    urls = {}
+    for variant in VARIANTS:
+        entry = (variants or {}).get(variant)
+        if not entry:
+            continue
+        urls[variant] = dict(entry)
+        for extension in FORMATS:
+            if entry.get(extension):
+                url = default_storage.url(entry[extension])
+                urls[variant][extension] = request.build_absolute_uri(url) if request else url
+    return urls
@@ -0,0 +1,285 @@
+"""
+Bulk import of itinerary documents from partner catalogs.
+
+Sources are read as a stream, one itinerary per NDJSON line or CSV row, and
+handled a batch at a time, so memory stays flat however large the file is:
+
+- NDJSON lines have the shape written by the export_catalog command
+  (ItinerarySerializer with nested days and stops); read-only fields such as
+  id, rating and created_at are ignored.
+- CSV rows have one column per itinerary field and a `days` column holding
+  the days and stops as JSON, as the create page sends them. Empty cells are
+  treated as missing.
+
+The creator is named by `creator` (a username or email) or by the `username`
+of an exported `user` object. Each batch resolves its creators in one query
+and is validated with one reused set of serializer fields, then written with
+bulk_create in its own transaction. bulk_create skips model save() and
+signals, so this module sets geohashes, indexes the itineraries for full-text
+search and invalidates cached responses itself.
+
+After each committed batch the position reached is saved to an optional
+checkpoint file; running the same import again resumes after it. Documents
+that fail validation are skipped and written to an optional NDJSON error
+report, one {"line": ..., "errors": ...} object per document. A batch's errors
+are written once it has committed, so a batch that is rolled back and
+imported again on resume is reported once.
+"""
+import csv
+import io
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from . import fulltext, response_cache
+from .bulk import create_days_and_stops, default_days
+from .geo import geohash_for
+from .models import Itinerary
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+FORMATS = ('ndjson', 'csv')
+# Output of ItinerarySerializer that an import cannot set; image is a URL there
+IGNORED_FIELDS = ('id', 'user', 'creator', 'rating', 'review_count', 'rating_histogram', 'created_at',
+                  'updated_at', 'photos', 'image', 'image_variants')
+
+
+class CatalogImportError(ValueError):
+    """The import cannot start, e.g. the checkpoint belongs to another source."""
+
+
+@dataclass
+class ImportResult:
+    imported: int = 0
+    failed: int = 0
+    days: int = 0
+    stops: int = 0
+    creators_created: int = 0
+    # Line (CSV: last physical line of the row) of the last document handled
+    line: int = 0
+
+
+def detect_format(path):
+    return 'csv' if str(path).lower().endswith('.csv') else 'ndjson'
+
+
+def read_ndjson(file):
+    """Yield (line number, document) from a binary or text NDJSON stream; blank lines are skipped."""
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            document = json.loads(line)
+        except ValueError as e:
+            yield number, {'_error': f"Invalid JSON: {e}"}
+            continue
+        if not isinstance(document, dict):
+            document = {'_error': "Expected a JSON object."}
+        yield number, document
+
+
+def read_csv(file):
+    """Yield (line number, document) from a CSV stream with a header row."""
+    if not isinstance(file, io.TextIOBase):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(file)
+    for row in reader:
+        document = {key: value for key, value in row.items() if key and value not in (None, '')}
+        if isinstance(document.get('days'), str):
+            try:
+                document['days'] = json.loads(document['days'])
+            except ValueError:
+                document['_error'] = "Invalid days JSON."
+        yield reader.line_num, document
+
+
+def _creator_name(document):
+    creator = document.get('creator')
+    if creator is None and isinstance(document.get('user'), dict):
+        creator = document['user'].get('username')
+    return str(creator).strip() if creator not in (None, '') else None
+
+
+class Checkpoint:
+    """
+    The line reached in a source and the totals so far, saved as JSON after
+    each committed batch. A resumed import carries on from both.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source) if source != '-' else source
+        self.result = ImportResult()
+        if path and os.path.exists(path):
+            with open(path) as file:
+                state = json.load(file)
+            if state.pop('source', None) != self.source:
+                raise CatalogImportError(f"Checkpoint {path} is not for {self.source}.")
+            self.result = ImportResult(**state)
+
+    @property
+    def line(self):
+        return self.result.line
+
+    def save(self, result):
+        if not self.path:
+            return
+        # Write then rename, so an interrupted import never leaves half a checkpoint
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'source': self.source, **asdict(result)}, file)
+        os.replace(temporary, self.path)
+
+
+class Importer:
+    def __init__(self, default_creator=None, create_creators=False, batch_size=BATCH_SIZE, dry_run=False,
+                 errors=None):
+        from .serializers import ItineraryDaySerializer, ItinerarySerializer
+
+        self.default_creator = default_creator
+        self.create_creators = create_creators
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.errors = errors
+        # Unbound serializers are reused for every document: building one per
+        # document would deep-copy all of its fields each time
+        self.serializer = ItinerarySerializer()
+        self.days_serializer = ItineraryDaySerializer(many=True)
+        self.password = make_password(None)  # unusable, for created creators
+        self.batch_errors = []
+
+    def run(self, records, checkpoint=None, progress=None):
+        result = checkpoint.result if checkpoint else ImportResult()
+        resume_after = result.line
+        batch = []
+        for number, document in records:
+            if number <= resume_after:
+                continue
+            batch.append((number, document))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch, result)
+                self._committed(batch, result, checkpoint, progress)
+                batch = []
+        if batch:
+            self.import_batch(batch, result)
+            self._committed(batch, result, checkpoint, progress)
+        return result
+
+    def _committed(self, batch, result, checkpoint, progress):
+        result.line = batch[-1][0]
+        if self.errors is not None:
+            self.errors.writelines(
+                json.dumps({'line': number, 'errors': errors}, default=str) + '\n'
+                for number, errors in self.batch_errors)
+            self.errors.flush()
+        if checkpoint and not self.dry_run:
+            checkpoint.save(result)
+        if progress:
+            progress(result)
+
+    def _report(self, number, errors, result):
+        result.failed += 1
+        self.batch_errors.append((number, errors))
+
+    def _resolve_creators(self, batch, result):
+        names = {_creator_name(document) or self.default_creator for _, document in batch} - {None}
+        users = {}
+        if names:
+            for user in User.objects.filter(Q(username__in=names) | Q(email__in=names)).only(
+                    'id', 'username', 'email'):
+                users[user.email] = users.get(user.email, user)
+                users[user.username] = user  # a username match wins over an email match
+        missing = names - users.keys()
+        if missing and self.create_creators and not self.dry_run:
+            User.objects.bulk_create(
+                [User(username=name, email=name if '@' in name else '', password=self.password)
+                 for name in sorted(missing)],
+                batch_size=self.batch_size, ignore_conflicts=True,
+            )
+            for user in User.objects.filter(username__in=missing).only('id', 'username'):
+                users[user.username] = user
+                result.creators_created += 1
+        elif missing and self.create_creators:
+            users.update((name, None) for name in missing)
+        return users
+
+    def validate(self, document):
+        """Validated itinerary fields and days of one document; raises ValidationError."""
+        if '_error' in document:
+            raise serializers.ValidationError({'non_field_errors': [document['_error']]})
+        data = {key: value for key, value in document.items() if key not in IGNORED_FIELDS and key != 'days'}
+        attrs = self.serializer.run_validation(data)
+        days = document.get('days')
+        if days is None:
+            attrs['days'] = default_days(attrs.get('duration', 0))
+        else:
+            attrs['days'] = self.serializer.validate_days_data(days, days_serializer=self.days_serializer)
+        return attrs
+
+    def import_batch(self, batch, result):
+        self.batch_errors = []
+        with transaction.atomic():
+            users = self._resolve_creators(batch, result)
+            valid = []
+            for number, document in batch:
+                name = _creator_name(document) or self.default_creator
+                if name is None:
+                    self._report(number, {'creator': ["No creator given."]}, result)
+                    continue
+                if name not in users:
+                    self._report(number, {'creator': [f"Unknown user {name!r}."]}, result)
+                    continue
+                try:
+                    attrs = self.validate(document)
+                except serializers.ValidationError as e:
+                    self._report(number, e.detail, result)
+                    continue
+                valid.append((users[name], attrs))
+
+            if self.dry_run or not valid:
+                result.imported += len(valid)
+                return
+
+            itineraries, itinerary_days = [], []
+            for user, attrs in valid:
+                days = attrs.pop('days')
+                itinerary = Itinerary(user=user, **attrs)
+                itinerary.geohash = geohash_for(itinerary.latitude, itinerary.longitude)
+                itineraries.append(itinerary)
+                itinerary_days.append((itinerary, days))
+            Itinerary.objects.bulk_create(itineraries, batch_size=self.batch_size)
+            days, stops = create_days_and_stops(itinerary_days, batch_size=self.batch_size)
+
+            ids = [itinerary.pk for itinerary in itineraries]
+            fulltext.index_itineraries(ids)
+            response_cache.invalidate(summaries=ids)
+
+        result.imported += len(itineraries)
+        result.days += len(days)
+        result.stops += len(stops)
+        logger.info("Imported %d itineraries (%d days, %d stops) up to line %d",
+                    len(itineraries), len(days), len(stops), batch[-1][0])
+
+
+def import_catalog(file, format='ndjson', checkpoint=None, **options):
+    """
+    Import every itinerary document in `file`, a binary stream of the given
+    format. `checkpoint` is a Checkpoint to resume from and save to; the other
+    options are those of Importer, plus `progress(result)`, called after each
+    batch. Returns the ImportResult.
+    """
+    if format not in FORMATS:
+        raise CatalogImportError(f"Unknown format {format!r}; expected one of {', '.join(FORMATS)}.")
+    progress = options.pop('progress', None)
+    records = read_csv(file) if format == 'csv' else read_ndjson(file)
+    if checkpoint and checkpoint.line:
+        logger.info("Resuming import of %s after line %d", checkpoint.source, checkpoint.line)
+    return Importer(**options).run(records, checkpoint=checkpoint, progress=progress)
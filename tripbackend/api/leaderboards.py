@@ -0,0 +1,259 @@
+"""
+Precomputed leaderboards for the home page.
+
+Three kinds of boards rank published itineraries:
+
+trending   reviews of the last TRENDING_WINDOW, each worth
+           0.5 ** (age / TRENDING_HALF_LIFE), summed per itinerary: a
+           time-decayed review velocity
+top_rated  the Bayesian average (C * m + rating_total) / (C + review_count),
+           which pulls itineraries with few reviews towards the catalog mean m
+           (C is PRIOR_REVIEWS)
+newest     the latest itineraries of each of the NEWEST_DESTINATIONS
+           destinations with the most published itineraries
+
+refresh() is meant to run periodically (see the refresh_leaderboards
+command). Each board is stored as ordered LeaderboardEntry rows carrying the
+card data of their itinerary, so /api/leaderboards/ is one small query
+whatever the size of the catalog. Boards whose inputs did not change are
+skipped: top rated is recomputed only when a digest of the review and
+itinerary tables differs from the one stored with the board, newest only for
+destinations with itineraries saved since the last run or with entries
+missing. Trending scores decay with time, so trending is recomputed on every
+run, from the reviews in its window alone.
+
+Between runs api.signals calls refresh_entries() when an itinerary on a board
+is saved or reviewed, so its card shows the current name, rating and status.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import timedelta
+
+import numpy as np
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Max, Sum, Window
+from django.db.models.functions import Cast, RowNumber
+from django.utils import timezone
+
+from . import response_cache
+from .models import Itinerary, Leaderboard, LeaderboardEntry, Review
+from .serializers import ItinerarySummarySerializer
+
+TRENDING = 'trending'
+TOP_RATED = 'top_rated'
+NEWEST = 'newest'
+
+BOARD_SIZE = 12
+TRENDING_WINDOW = timedelta(days=14)
+TRENDING_HALF_LIFE = timedelta(days=3)
+# Weight of the catalog mean in a top rated score, as a number of reviews
+PRIOR_REVIEWS = 5
+NEWEST_DESTINATIONS = 12
+NEWEST_SIZE = 6
+# Itineraries saved this long before the last run are checked again
+REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+@dataclass
+class RefreshResult:
+    """Counts of the boards handled by refresh()."""
+    refreshed: int = 0
+    unchanged: int = 0
+    removed: int = 0
+
+
+def _summaries(ids):
+    """Card data of the published itineraries among `ids`, by id, as stored in LeaderboardEntry.summary."""
+    rows = list(Itinerary.objects.published().filter(pk__in=ids).summaries())
+    data = json.loads(json.dumps(ItinerarySummarySerializer(rows, many=True).data, cls=DjangoJSONEncoder))
+    return {summary['id']: summary for summary in data}
+
+
+def _digest(*values):
+    return hashlib.blake2b(json.dumps(values, cls=DjangoJSONEncoder).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def trending(now=None, size=BOARD_SIZE):
+    """[(itinerary id, score)] of the published itineraries reviewed most lately, best first."""
+    now = now or timezone.now()
+    rows = list(Review.objects.filter(
+        created_at__gte=now - TRENDING_WINDOW, itinerary__status='published',
+    ).values_list('itinerary_id', 'created_at'))
+    if not rows:
+        return []
+    itinerary_ids, created = zip(*rows)
+    ages = now.timestamp() - np.array([moment.timestamp() for moment in created])
+    ids, inverse = np.unique(np.array(itinerary_ids, dtype=np.int64), return_inverse=True)
+    scores = np.bincount(inverse, weights=0.5 ** (ages / TRENDING_HALF_LIFE.total_seconds()))
+    # Highest score first, ties to the older itinerary
+    top = np.lexsort((ids, -scores))[:size]
+    return [(int(ids[i]), round(float(scores[i]), 4)) for i in top]
+
+
+def _catalog_state():
+    """Aggregates of the published itineraries, and a digest of everything top rated depends on."""
+    state = Itinerary.objects.published().aggregate(
+        count=Count('id'), updated=Max('updated_at'), reviews=Sum('review_count'), ratings=Sum('rating_total'))
+    reviews = Review.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return state, _digest(state, reviews)
+
+
+def top_rated(state=None, size=BOARD_SIZE):
+    """[(itinerary id, Bayesian average)] of the best rated published itineraries, best first."""
+    state = state or _catalog_state()[0]
+    if not state['reviews']:
+        return []
+    mean = state['ratings'] / state['reviews']
+    score = (PRIOR_REVIEWS * mean + Cast('rating_total', FloatField())) / (PRIOR_REVIEWS + F('review_count'))
+    rows = Itinerary.objects.published().filter(review_count__gt=0).annotate(
+        score=Cast(score, FloatField())).order_by('-score', '-review_count', 'pk').values_list('pk', 'score')[:size]
+    return [(pk, round(value, 4)) for pk, value in rows]
+
+
+def top_destinations(count=NEWEST_DESTINATIONS):
+    """[(destination, published itineraries)] of the destinations with the most published itineraries."""
+    return list(Itinerary.objects.published().order_by().values('destination').annotate(
+        itineraries=Count('id')).order_by('-itineraries', 'destination').values_list(
+        'destination', 'itineraries')[:count])
+
+
+def newest(destinations, size=NEWEST_SIZE):
+    """{destination: [(itinerary id, created_at timestamp)]} of the latest itineraries per destination."""
+    position = Window(RowNumber(), partition_by=F('destination'),
+                      order_by=[F('created_at').desc(nulls_last=True), F('id').desc()])
+    rows = Itinerary.objects.published().filter(destination__in=destinations).annotate(
+        position=position).filter(position__lte=size).values_list('destination', 'pk', 'created_at', 'position')
+    boards = {destination: [] for destination in destinations}
+    for destination, pk, created_at, position in sorted(rows, key=lambda row: (row[0], row[3])):
+        boards[destination].append((pk, created_at.timestamp() if created_at else 0.0))
+    return boards
+
+
+def _store(kind, key, ranked, signature='', rank=0):
+    """Replace the entries of a board with `ranked` [(itinerary id, score)]."""
+    board, _ = Leaderboard.objects.get_or_create(kind=kind, key=key)
+    summaries = _summaries([pk for pk, _ in ranked])
+    board.entries.all().delete()
+    LeaderboardEntry.objects.bulk_create([
+        LeaderboardEntry(leaderboard=board, position=position, itinerary_id=pk, score=score, summary=summaries[pk])
+        for position, (pk, score) in enumerate(((pk, score) for pk, score in ranked if pk in summaries), 1)
+    ])
+    board.rank, board.signature, board.refreshed_at = rank, signature, timezone.now()
+    board.save()
+    return board
+
+
+def _bump():
+    response_cache.bump_versions([response_cache.version_key(response_cache.LEADERBOARDS)])
+
+
+def refresh(full=False, now=None):
+    """
+    Recompute the boards whose inputs changed since the last run (all of them
+    with full=True), in one transaction. Returns a RefreshResult.
+    """
+    result = RefreshResult()
+    with transaction.atomic():
+        # Trending is stored on every run, so its refresh time marks the last run
+        last_run = Leaderboard.objects.filter(kind=TRENDING, key='').values_list('refreshed_at', flat=True).first()
+        _store(TRENDING, '', trending(now))
+        result.refreshed += 1
+
+        state, signature = _catalog_state()
+        board = Leaderboard.objects.filter(kind=TOP_RATED, key='').first()
+        if full or board is None or board.signature != signature:
+            _store(TOP_RATED, '', top_rated(state), signature)
+            result.refreshed += 1
+        else:
+            result.unchanged += 1
+
+        destinations = top_destinations()
+        stored = {board.key: board for board in Leaderboard.objects.filter(kind=NEWEST).annotate(
+            entry_count=Count('entries'))}
+        removed = [board.pk for key, board in stored.items() if key not in dict(destinations)]
+        Leaderboard.objects.filter(pk__in=removed).delete()
+        result.removed = len(removed)
+        full = full or last_run is None
+        changed = set()
+        if not full:
+            changed = set(Itinerary.objects.filter(
+                updated_at__gte=last_run - REFRESH_OVERLAP, destination__in=[key for key, _ in destinations],
+            ).values_list('destination', flat=True).distinct())
+        stale = [
+            destination for destination, count in destinations
+            if full or destination not in stored or destination in changed
+            # Entries were removed since: unpublished or deleted itineraries
+            or stored[destination].entry_count < min(count, NEWEST_SIZE)
+        ]
+        boards = newest(stale) if stale else {}
+        moved = []
+        for rank, (destination, _) in enumerate(destinations):
+            if destination in boards:
+                _store(NEWEST, destination, boards[destination], rank=rank)
+                result.refreshed += 1
+            else:
+                result.unchanged += 1
+                if stored[destination].rank != rank:
+                    stored[destination].rank = rank
+                    moved.append(stored[destination])
+        Leaderboard.objects.bulk_update(moved, ['rank'])
+        transaction.on_commit(_bump)
+    return result
+
+
+def refresh_entries(itinerary_ids):
+    """
+    Update the card data of the given itineraries on every board they are on,
+    dropping them from boards they no longer belong on (unpublished, or moved
+    to another destination). Returns the number of entries changed.
+    """
+    entries = list(LeaderboardEntry.objects.filter(itinerary_id__in=itinerary_ids).select_related('leaderboard'))
+    if not entries:
+        return 0
+    summaries = _summaries({entry.itinerary_id for entry in entries})
+    removed, updated = [], []
+    for entry in entries:
+        summary = summaries.get(entry.itinerary_id)
+        if summary is None or (entry.leaderboard.kind == NEWEST and summary['destination'] != entry.leaderboard.key):
+            removed.append(entry.pk)
+        elif summary != entry.summary:
+            entry.summary = summary
+            updated.append(entry)
+    with transaction.atomic():
+        LeaderboardEntry.objects.filter(pk__in=removed).delete()
+        LeaderboardEntry.objects.bulk_update(updated, ['summary'])
+    if removed or updated:
+        transaction.on_commit(_bump)
+    return len(removed) + len(updated)
+
+
+def schedule_refresh(itinerary_ids):
+    """Refresh the entries of these itineraries once the current transaction commits."""
+    itinerary_ids = list(itinerary_ids)
+    transaction.on_commit(lambda: refresh_entries(itinerary_ids))
+
+
+def invalidate():
+    """Drop cached leaderboard responses once the current transaction commits."""
+    transaction.on_commit(_bump)
+
+
+def boards():
+    """The stored boards as served by /api/leaderboards/, read with one query."""
+    data = {TRENDING: [], TOP_RATED: [], NEWEST: [], 'refreshed_at': None}
+    newest_boards = {}
+    rows = LeaderboardEntry.objects.order_by(
+        'leaderboard__kind', 'leaderboard__rank', 'leaderboard__key', 'position',
+    ).values_list('leaderboard__kind', 'leaderboard__key', 'leaderboard__refreshed_at', 'score', 'summary')
+    for kind, key, refreshed_at, score, summary in rows:
+        item = {**summary, 'score': score}
+        if kind == NEWEST:
+            newest_boards.setdefault(key, []).append(item)
+        else:
+            data[kind].append(item)
+        if data['refreshed_at'] is None or refreshed_at > data['refreshed_at']:
+            data['refreshed_at'] = refreshed_at
+    data[NEWEST] = [{'destination': key, 'itineraries': items} for key, items in newest_boards.items()]
+    return data
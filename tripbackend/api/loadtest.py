@@ -0,0 +1,433 @@
+"""
+Concurrent HTTP load generator for the API.
+
+Virtual users run a weighted mix of actions (MIX) against a running server:
+browsing the catalog, searching, opening itineraries and their reviews,
+posting reviews, editing their own itinerary and logging in. Requests go over
+raw asyncio streams with keep-alive connections, one per worker, so the
+generator itself needs nothing beyond the standard library and stays cheap
+next to the server under test.
+
+Two traffic models:
+
+- closed (no rate): `concurrency` workers each start their next action as soon
+  as the previous one finished;
+- open (`rate` actions per second): actions arrive at Poisson-distributed
+  times and queue for the `concurrency` workers. The first request of an
+  action is timed from its scheduled arrival, so time spent waiting for a
+  free worker shows up in the latencies instead of being hidden.
+
+prepare_context() creates the load-test users (with tokens and one itinerary
+each) in the database the server uses and samples published itineraries from
+the seeded catalog (see api.seed); start_server() runs the app under Django's
+threaded WSGI development server or, when installed, uvicorn for ASGI.
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlencode, urlsplit
+
+from .benchmarks import percentile
+
+LOADTEST_PASSWORD = 'loadtest-Passw0rd'
+SEARCH_TERMS = ('paris', 'rome', 'tokyo', 'food', 'budget', 'museum', 'beach', 'weekend', 'lisbon', 'castle')
+
+
+class HTTPError(Exception):
+    pass
+
+
+@dataclass
+class VirtualUser:
+    email: str
+    token: str
+    itinerary_id: int
+
+
+@dataclass
+class Context:
+    """What the actions need to know about the dataset on the server."""
+    itinerary_ids: list
+    creator_ids: list
+    users: list
+    password: str = LOADTEST_PASSWORD
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection over asyncio streams."""
+
+    def __init__(self, host, port, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.reader = self.writer = None
+
+    async def request(self, method, path, body=b'', headers=None):
+        """Send a request and return (status, headers, body); reconnects once if the connection went stale."""
+        for attempt in (1, 2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.timeout)
+            try:
+                return await asyncio.wait_for(self._exchange(method, path, body, headers or {}), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError, HTTPError):
+                await self.close()
+                if attempt == 2:
+                    raise
+
+    async def _exchange(self, method, path, body, headers):
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HTTPError("Connection closed by the server")
+        try:
+            status = int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise HTTPError(f"Malformed status line: {status_line!r}")
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if method == 'HEAD' or status in (204, 304):
+            content = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            content = await self._read_chunked()
+        elif 'content-length' in response_headers:
+            content = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            content = await self.reader.read()
+            response_headers['connection'] = 'close'
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response_headers, content
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # Skip trailers up to the blank line
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readexactly(2)
+
+
+@dataclass
+class EndpointStats:
+    latencies: list = field(default_factory=list)
+    statuses: dict = field(default_factory=dict)
+    errors: int = 0
+
+    def summary(self, elapsed):
+        count = len(self.latencies)
+        result = {
+            'requests': count,
+            'errors': self.errors,
+            'error_rate': round(self.errors / count, 4) if count else 0.0,
+            'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+            'statuses': {str(status): n for status, n in sorted(self.statuses.items(), key=lambda item: str(item[0]))},
+        }
+        if count:
+            result['latency_ms'] = {
+                name: round(percentile(self.latencies, percent) * 1000, 2)
+                for name, percent in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))
+            }
+        return result
+
+
+class Recorder:
+    def __init__(self):
+        self.endpoints = {}
+
+    def record(self, label, latency, status, ok):
+        stats = self.endpoints.setdefault(label, EndpointStats())
+        stats.latencies.append(latency)
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if not ok:
+            stats.errors += 1
+
+    def report(self, elapsed):
+        total = EndpointStats()
+        for stats in self.endpoints.values():
+            total.latencies += stats.latencies
+            total.errors += stats.errors
+            for status, n in stats.statuses.items():
+                total.statuses[status] = total.statuses.get(status, 0) + n
+        return {
+            'elapsed_s': round(elapsed, 2),
+            'total': total.summary(elapsed),
+            'endpoints': {label: stats.summary(elapsed) for label, stats in sorted(self.endpoints.items())},
+        }
+
+
+class Session:
+    """A worker's connection plus the bookkeeping for the requests it sends."""
+
+    def __init__(self, connection, recorder, rng):
+        self.connection = connection
+        self.recorder = recorder
+        self.rng = rng
+        self.started_at = None  # arrival time of the current action in the open model
+
+    async def call(self, label, method, path, payload=None, token=None, expected=(200,)):
+        headers = {'Accept': 'application/json'}
+        body = b''
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        start, self.started_at = self.started_at or time.perf_counter(), None
+        try:
+            status, _, content = await self.connection.request(method, path, body, headers)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPError):
+            self.recorder.record(label, time.perf_counter() - start, 'error', ok=False)
+            return None, None
+        self.recorder.record(label, time.perf_counter() - start, status, ok=status in expected)
+        try:
+            return status, json.loads(content) if content else None
+        except ValueError:
+            return status, None
+
+
+def _path(url):
+    parts = urlsplit(url)
+    return f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+async def browse_list(session, context):
+    status, data = await session.call('GET itinerary-list', 'GET', '/api/itineraries/')
+    if status == 200 and data.get('next') and session.rng.random() < 0.5:
+        await session.call('GET itinerary-list (page 2)', 'GET', _path(data['next']))
+
+
+async def search(session, context):
+    query = urlencode({'q': session.rng.choice(SEARCH_TERMS), 'sort': session.rng.choice(('rating', 'price'))})
+    await session.call('GET itinerary-search', 'GET', f'/api/itineraries/search/?{query}')
+
+
+async def open_detail(session, context):
+    pk = session.rng.choice(context.itinerary_ids)
+    await session.call('GET public-itinerary-detail', 'GET', f'/api/itineraries/{pk}/')
+    if session.rng.random() < 0.5:
+        await session.call('GET itinerary-reviews', 'GET', f'/api/itineraries/{pk}/reviews/')
+
+
+async def browse_creator(session, context):
+    creator = session.rng.choice(context.creator_ids)
+    await session.call('GET itineraries-by-creator', 'GET', f'/api/itineraries/creator/{creator}/')
+
+
+async def post_review(session, context):
+    user = session.rng.choice(context.users)
+    pk = session.rng.choice(context.itinerary_ids)
+    status, data = await session.call(
+        'POST itinerary-reviews', 'POST', f'/api/itineraries/{pk}/reviews/',
+        {'rating': session.rng.randint(1, 5), 'comment': 'Load test review'}, user.token, expected=(201,))
+    if status == 201:
+        # Remove it again, so the user can review this itinerary next time
+        await session.call('DELETE review-detail', 'DELETE', f"/api/reviews/{data['id']}/", token=user.token,
+                           expected=(204,))
+
+
+async def edit_itinerary(session, context):
+    user = session.rng.choice(context.users)
+    days = [{'day_number': number, 'title': f'Day {number}', 'description': 'Edited by the load test',
+             'stops': [{'name': f'Stop {order}', 'stop_type': 'activity', 'location_name': 'Somewhere',
+                        'latitude': 48.85 + session.rng.random() / 100, 'longitude': 2.35, 'order': order}
+                       for order in range(session.rng.randint(1, 5))]}
+            for number in (1, 2)]
+    await session.call('PUT itinerary-detail', 'PUT', f'/api/user/itineraries/{user.itinerary_id}/',
+                       {'name': f'Load test trip {session.rng.randint(1, 1000)}', 'days_json': json.dumps(days)},
+                       user.token)
+
+
+async def login(session, context):
+    user = session.rng.choice(context.users)
+    await session.call('POST login', 'POST', '/api/login/', {'email': user.email, 'password': context.password})
+
+
+# action: relative weight
+MIX = {
+    'list': (browse_list, 30),
+    'search': (search, 15),
+    'detail': (open_detail, 25),
+    'creator': (browse_creator, 7),
+    'review': (post_review, 8),
+    'edit': (edit_itinerary, 10),
+    'login': (login, 5),
+}
+
+
+def parse_mix(text):
+    """Weights from "list=30,detail=25,...": the named actions only, with these weights."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in MIX:
+            raise ValueError(f"Unknown action '{name}'; choose from {', '.join(MIX)}")
+        weights[name] = float(weight) if weight else MIX[name][1]
+    if not weights or sum(weights.values()) <= 0:
+        raise ValueError("The mix needs at least one action with a positive weight")
+    return weights
+
+
+async def run(url, context, concurrency=10, duration=30.0, rate=None, weights=None, seed=None):
+    """
+    Send traffic for `duration` seconds and return the report (see
+    Recorder.report). `rate` switches to the open model, in actions/second.
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    weights = weights or {name: weight for name, (_, weight) in MIX.items()}
+    names = list(weights)
+    recorder = Recorder()
+    master = random.Random(seed)
+    start = time.perf_counter()
+    deadline = start + duration
+    arrivals = asyncio.Queue() if rate else None
+    unstarted = 0
+
+    async def worker(rng):
+        nonlocal unstarted
+        session = Session(Connection(host, port), recorder, rng)
+        try:
+            while True:
+                if arrivals is not None:
+                    scheduled = await arrivals.get()
+                    if scheduled is None:
+                        return
+                    if time.perf_counter() >= deadline:
+                        # Arrived in time but no worker was free before the end of the run
+                        unstarted += 1
+                        continue
+                    session.started_at = scheduled
+                elif time.perf_counter() >= deadline:
+                    return
+                action = MIX[rng.choices(names, [weights[name] for name in names])[0]][0]
+                await action(session, context)
+        finally:
+            await session.connection.close()
+
+    async def schedule():
+        rng = random.Random(master.random())
+        next_arrival = time.perf_counter()
+        while next_arrival < deadline:
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            arrivals.put_nowait(next_arrival)
+            next_arrival += rng.expovariate(rate)
+        for _ in range(concurrency):
+            arrivals.put_nowait(None)
+
+    tasks = [worker(random.Random(master.random())) for _ in range(concurrency)]
+    if arrivals is not None:
+        tasks.append(schedule())
+    await asyncio.gather(*tasks)
+    report = recorder.report(time.perf_counter() - start)
+    report['config'] = {'url': url, 'concurrency': concurrency, 'duration_s': duration, 'rate': rate,
+                        'model': 'open' if rate else 'closed', 'mix': weights}
+    if arrivals is not None:
+        # Actions that never started because the workers could not keep up
+        report['unstarted_actions'] = unstarted
+    return report
+
+
+def prepare_context(users=20, sample=1000):
+    """
+    Create (or reuse) `users` load-test users with tokens and one draft
+    itinerary each, and sample published itineraries to read and review.
+    """
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+
+    from .bulk import create_days_and_stops, normalize_days
+    from .models import Itinerary
+
+    published = list(Itinerary.objects.published().order_by('?').values_list('pk', 'user_id')[:sample])
+    if not published:
+        raise ValueError("There are no published itineraries; seed the catalog first (manage.py seed_catalog)")
+
+    virtual_users = []
+    for n in range(users):
+        email = f'loadtest-{n}@example.com'
+        user, created = User.objects.get_or_create(
+            username=email, defaults={'email': email, 'first_name': 'Load', 'last_name': f'Test {n}'})
+        if created or not user.check_password(LOADTEST_PASSWORD):
+            user.set_password(LOADTEST_PASSWORD)
+            user.save(update_fields=['password'])
+        itinerary = Itinerary.objects.filter(user=user).order_by('pk').first()
+        if itinerary is None:
+            itinerary = Itinerary.objects.create(
+                user=user, name=f'Load test trip {n}', description='Edited by the load test',
+                destination='Paris, France', duration=2, price=100)
+            create_days_and_stops([(itinerary, normalize_days(
+                [{'day_number': 1, 'title': 'Day 1', 'description': '', 'stops': []}]))])
+        token, _ = Token.objects.get_or_create(user=user)
+        virtual_users.append(VirtualUser(email=email, token=token.key, itinerary_id=itinerary.pk))
+
+    return Context(
+        itinerary_ids=[pk for pk, _ in published],
+        creator_ids=sorted({user_id for _, user_id in published if user_id is not None}),
+        users=virtual_users,
+    )
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server='wsgi', port=None, timeout=30):
+    """
+    Start the app in a subprocess on 127.0.0.1 and wait until it accepts
+    connections: 'wsgi' runs Django's threaded WSGI server (runserver without
+    the autoreloader), 'asgi' runs tripbackend.asgi under uvicorn. Returns
+    (process, url).
+    """
+    from django.conf import settings
+
+    port = port or free_port()
+    if server == 'asgi':
+        command = [sys.executable, '-m', 'uvicorn', 'tripbackend.asgi:application',
+                   '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    else:
+        command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+    process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=os.environ.copy(),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The {server} server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The {server} server did not start within {timeout}s")
@@ -0,0 +1,184 @@
+"""
+Logging building blocks referenced from settings.LOGGING.
+
+- RedactingFilter masks credentials (passwords, tokens, ...) in log records.
+- SamplingFilter lets through a fraction of the records of the logger it is
+  attached to; payload dumps go to the `api.payloads` logger, sampled this way.
+- QueueFileHandler hands records to a background thread that writes them to a
+  rotating file, so request threads never wait on disk I/O. Its queue is
+  bounded: when the writer falls behind, records are dropped and counted
+  instead of blocking or growing memory.
+- JsonFormatter renders one JSON object per line, including `extra` fields.
+- RequestLogMiddleware writes one line per request to `api.requests`.
+
+Log calls on hot paths use lazy %-style arguments, so nothing is formatted
+unless a handler actually emits the record.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import threading
+import time
+from collections.abc import Mapping
+
+REDACTED = '***'
+SENSITIVE_KEYS = ('password', 'token', 'secret', 'authorization', 'api_key', 'apikey', 'cookie', 'sessionid')
+_SENSITIVE_TEXT = re.compile(
+    r"""(?P<key>["']?[\w-]*(?:%s)[\w-]*["']?\s*[:=]\s*(?:\[\s*)?)(?P<quote>["']?)(?P<value>(?:Token\s+)?[^"',\s\]}]+)"""
+    % '|'.join(SENSITIVE_KEYS),
+    re.IGNORECASE,
+)
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def is_sensitive(key):
+    key = str(key).lower()
+    return any(word in key for word in SENSITIVE_KEYS)
+
+
+def redact(value):
+    """Copy of `value` with the values of sensitive keys masked, recursing into containers."""
+    if hasattr(value, 'lists') and callable(value.lists):
+        # QueryDict: keep the multi-value shape readable
+        return {key: REDACTED if is_sensitive(key) else redact(values if len(values) > 1 else values[0])
+                for key, values in value.lists()}
+    if isinstance(value, Mapping):
+        return {key: REDACTED if is_sensitive(key) else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(item) for item in value)
+    return value
+
+
+def redact_text(text):
+    """Mask values following sensitive names in free text, e.g. password=..., "token": "..."."""
+    return _SENSITIVE_TEXT.sub(lambda match: f"{match['key']}{match['quote']}{REDACTED}", text)
+
+
+class RedactingFilter(logging.Filter):
+    """Mask credentials in a record's arguments and rendered message. Attach to handlers."""
+
+    def filter(self, record):
+        if record.args:
+            if isinstance(record.args, Mapping):
+                record.args = redact(record.args)
+            else:
+                record.args = tuple(redact(arg) for arg in record.args)
+        message = record.getMessage()
+        redacted = redact_text(message)
+        if redacted != message:
+            record.msg, record.args = redacted, None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Pass roughly `rate` (0..1) of the records, e.g. to keep a trickle of full
+    payload dumps in production. Records at WARNING and above always pass.
+    """
+
+    def __init__(self, rate=1.0, name=''):
+        super().__init__(name)
+        self.rate = float(rate)
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class QueueFileHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking handler writing to a RotatingFileHandler on a listener thread.
+
+    The target handler does the formatting, so give the formatter to this
+    handler in LOGGING; it is passed on. Records that do not fit in the queue
+    are dropped; `dropped` counts them and the next record that fits carries a
+    note with the count.
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, queue_size=10000, encoding='utf-8'):
+        super().__init__(queue.Queue(queue_size))
+        self.target = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        self.listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=False)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener.start()
+        atexit.register(self.close)
+
+    def setFormatter(self, formatter):
+        self.target.setFormatter(formatter)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+            return
+        if self.dropped:
+            with self._dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            note = logging.LogRecord(record.name, logging.WARNING, record.pathname, record.lineno,
+                                     'Log queue full: dropped %d records', (dropped,), None)
+            try:
+                self.queue.put_nowait(self.prepare(note))
+            except queue.Full:
+                with self._dropped_lock:
+                    self.dropped += dropped
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        self.target.close()
+        super().close()
+
+
+class RequestLogMiddleware:
+    """One log line per request on `api.requests`, with the details as structured fields."""
+
+    logger = logging.getLogger('api.requests')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        if self.logger.isEnabledFor(logging.INFO):
+            duration_ms = round((time.perf_counter() - start) * 1000, 1)
+            user = getattr(request, 'user', None)
+            # Filled in by api.metrics.MetricsMiddleware when it is installed
+            metrics = getattr(request, 'metrics', None)
+            self.logger.info(
+                '%s %s %s %.1fms', request.method, request.path, response.status_code, duration_ms,
+                extra={
+                    'method': request.method,
+                    'path': request.path,
+                    'status': response.status_code,
+                    'duration_ms': duration_ms,
+                    'user_id': user.pk if user is not None and user.is_authenticated else None,
+                    'bytes': len(response.content) if not response.streaming else None,
+                    'queries': metrics.queries if metrics else None,
+                    'db_ms': round(metrics.db_time * 1000, 1) if metrics else None,
+                },
+            )
+        return response
@@ -0,0 +1,25 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from api import export
+
+
+class Command(BaseCommand):
+    help = ("Write every published itinerary (days, stops, photo URLs, rating aggregates) as NDJSON, "
+            "one document per line, in constant memory.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help="File to write; standard output when omitted.")
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE,
+                            help="Itineraries fetched (with their days, stops and photos) per round trip.")
+
+    def handle(self, *args, **options):
+        if options['output']:
+            with open(options['output'], 'wb') as file:
+                count = export.write_ndjson(file, chunk_size=options['chunk_size'])
+            self.stderr.write(self.style.SUCCESS(f"Exported {count} itineraries to {options['output']}."))
+        else:
+            count = export.write_ndjson(sys.stdout.buffer, chunk_size=options['chunk_size'])
+            sys.stdout.flush()
+            self.stderr.write(self.style.SUCCESS(f"Exported {count} itineraries."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api import images
+from api.models import Itinerary, ItineraryPhoto
+
+
+class Command(BaseCommand):
+    help = "Generate resized image variants for itinerary covers and photos that do not have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Regenerate variants even where they are up to date.")
+
+    def handle(self, *args, **options):
+        generated = failed = 0
+        for model in (Itinerary, ItineraryPhoto):
+            rows = model.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image', 'image_variants')
+            for row in rows.iterator():
+                if options['force']:
+                    model.objects.filter(pk=row.pk).update(image_variants={})
+                elif not images.needs_variants(row):
+                    continue
+                if images.process(model, row.pk):
+                    generated += 1
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {generated} images ({failed} skipped)."))
@@ -0,0 +1,64 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import importer
+
+
+class Command(BaseCommand):
+    help = ("Import itineraries with their days and stops from an NDJSON (as written by export_catalog) "
+            "or CSV file, in batches, resuming from a checkpoint when given one.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import; '-' reads NDJSON or CSV from standard input.")
+        parser.add_argument('--format', choices=importer.FORMATS,
+                            help="Input format; guessed from the file extension when omitted.")
+        parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE,
+                            help="Itineraries validated and written per transaction.")
+        parser.add_argument('--checkpoint',
+                            help="File recording the progress; an interrupted import resumes from it.")
+        parser.add_argument('--errors', help="Write the documents that failed, with their errors, to this NDJSON file.")
+        parser.add_argument('--creator', help="Username or email of the creator of documents that name none.")
+        parser.add_argument('--create-creators', action='store_true',
+                            help="Create accounts (that cannot log in) for creators that do not exist.")
+        parser.add_argument('--dry-run', action='store_true', help="Validate only; write nothing.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        path = options['path']
+        format = options['format'] or importer.detect_format(path)
+        try:
+            checkpoint = importer.Checkpoint(options['checkpoint'], path)
+        except importer.CatalogImportError as e:
+            raise CommandError(e)
+        if checkpoint.line:
+            self.stdout.write(f"Resuming after line {checkpoint.line}.")
+
+        start = time.perf_counter()
+
+        def progress(result):
+            self.stdout.write(f"  line {result.line}: {result.imported} imported, {result.failed} failed")
+
+        # Resumed imports add to the report of the earlier runs
+        errors = open(options['errors'], 'a' if checkpoint.line else 'w') if options['errors'] else None
+        source = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        try:
+            result = importer.import_catalog(
+                source, format=format, checkpoint=checkpoint, default_creator=options['creator'],
+                create_creators=options['create_creators'], batch_size=options['batch_size'],
+                dry_run=options['dry_run'], errors=errors,
+                progress=progress if options['verbosity'] > 1 else None,
+            )
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+            if errors:
+                errors.close()
+
+        verb = "Validated" if options['dry_run'] else "Imported"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {result.imported} itineraries, {result.days} days and {result.stops} stops "
+            f"({result.creators_created} new creators); {result.failed} failed, "
+            f"in {time.perf_counter() - start:.1f}s."))
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import loadtest
+
+
+class Command(BaseCommand):
+    help = ("Send concurrent mixed traffic (browsing, details, reviews, edits, logins) to a running server "
+            "and report throughput, latency percentiles and error rates per endpoint.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Server to load.")
+        parser.add_argument('--serve', choices=['wsgi', 'asgi'],
+                            help="Start the app locally on a free port (wsgi: threaded runserver, asgi: uvicorn) "
+                                 "and load it instead of --url.")
+        parser.add_argument('--concurrency', type=int, default=10, help="Connections / concurrent workers.")
+        parser.add_argument('--duration', type=float, default=30, help="Seconds of traffic.")
+        parser.add_argument('--rate', type=float,
+                            help="Arrival rate in actions per second (open model). "
+                                 "Without it every worker starts its next action immediately.")
+        parser.add_argument('--mix', help=f"Action weights, e.g. \"list=30,detail=25\". Actions: "
+                                          f"{', '.join(loadtest.MIX)}.")
+        parser.add_argument('--users', type=int, default=20, help="Virtual users to create or reuse.")
+        parser.add_argument('--seed', type=int, help="Random seed for the traffic.")
+        parser.add_argument('--output', help="Also write the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1 or options['duration'] <= 0 or options['users'] < 1:
+            raise CommandError("--concurrency, --duration and --users must be positive")
+        if options['rate'] is not None and options['rate'] <= 0:
+            raise CommandError("--rate must be positive")
+        try:
+            weights = loadtest.parse_mix(options['mix']) if options['mix'] else None
+            context = loadtest.prepare_context(users=options['users'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        process = None
+        url = options['url']
+        if options['serve']:
+            try:
+                process, url = loadtest.start_server(options['serve'])
+            except RuntimeError as e:
+                raise CommandError(str(e))
+        self.stdout.write(f"Loading {url} for {options['duration']:g}s with {options['concurrency']} workers...")
+        logging.disable(logging.WARNING)
+        try:
+            report = asyncio.run(loadtest.run(
+                url, context, concurrency=options['concurrency'], duration=options['duration'],
+                rate=options['rate'], weights=weights, seed=options['seed']))
+        finally:
+            logging.disable(logging.NOTSET)
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+        self._print(report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Wrote {options['output']}.")
+
+    def _print(self, report):
+        self.stdout.write(f"{'endpoint':<34} {'requests':>8} {'req/s':>8} {'errors':>7} "
+                          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        rows = list(report['endpoints'].items()) + [('total', report['total'])]
+        for label, stats in rows:
+            latency = stats.get('latency_ms', {})
+            self.stdout.write(
+                f"{label:<34} {stats['requests']:>8} {stats['throughput_rps']:>8.1f} "
+                f"{stats['error_rate']:>7.1%} {latency.get('p50', 0):>8.1f} {latency.get('p95', 0):>8.1f} "
+                f"{latency.get('p99', 0):>8.1f}")
+        if report.get('unstarted_actions'):
+            self.stdout.write(self.style.WARNING(
+                f"{report['unstarted_actions']} actions arrived but never started: the server could not keep up "
+                f"with the arrival rate."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads that were abandoned, with their temporary files."
+
+    def handle(self, *args, **options):
+        purged = uploads.purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Purged {purged} expired uploads."))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute every itinerary's rating, review count and star histogram from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--itinerary', type=int, action='append', dest='itinerary_ids',
+                            help="Only rebuild this itinerary (can be repeated).")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = ratings.rebuild_aggregates(options['itinerary_ids'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} itineraries."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api import routes
+
+
+class Command(BaseCommand):
+    help = "Recompute the cached route (distances and suggested stop order) of every itinerary day."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = routes.rebuild_routes(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the routes of {count} days."))
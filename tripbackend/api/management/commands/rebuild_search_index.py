@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import fulltext
+
+
+class Command(BaseCommand):
+    help = "Rebuild the itinerary full-text search index from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not fulltext.is_available():
+            raise CommandError("The full-text index requires SQLite with FTS5.")
+        fulltext.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS("Rebuilt the itinerary search index."))
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import leaderboards
+
+
+class Command(BaseCommand):
+    help = ("Recompute the trending, top rated and newest-per-destination leaderboards served on the home page. "
+            "Run it every few minutes, e.g. from cron; boards whose data did not change are skipped.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every board, changed or not.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        result = leaderboards.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {result.refreshed} leaderboards ({result.unchanged} unchanged, {result.removed} removed) "
+            f"in {time.perf_counter() - start:.1f}s."))
@@ -0,0 +1,72 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Benchmark every API endpoint against synthetic catalogs of several sizes, in a throwaway "
+            "test database, and write the results as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100,1000',
+                            help="Comma-separated catalog sizes, in itineraries.")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--allocation-iterations', type=int, default=3,
+                            help="Requests traced with tracemalloc per scenario.")
+        parser.add_argument('--only', action='append', default=[],
+                            help="Only run scenarios whose URL name or label contains this (can be repeated).")
+        parser.add_argument('--cache', action='store_true', help="Keep the response cache enabled.")
+        parser.add_argument('--output', default='benchmark-results.json')
+        parser.add_argument('--baseline', help="Results of an earlier run to compare with.")
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be a comma-separated list of integers")
+        if not sizes or min(sizes) < 1:
+            raise CommandError("--sizes must list positive catalog sizes")
+        scenarios = [
+            scenario for scenario in benchmarks.SCENARIOS
+            if not options['only'] or any(text in scenario.label for text in options['only'])
+        ]
+        if not scenarios:
+            raise CommandError("No scenario matches --only")
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+
+        def progress(size, result):
+            latency = result['latency_ms']
+            flag = '' if result['ok'] else self.style.WARNING(f"  status {result['status']}")
+            self.stdout.write(
+                f"{size:>8} {result['scenario']:<42} p50 {latency['p50']:>9.2f}ms  p95 {latency['p95']:>9.2f}ms  "
+                f"{result['queries']:>3} queries  {result['alloc_peak_kib']:>8} KiB{flag}")
+
+        # One log line per benchmarked request would drown the output
+        logging.disable(logging.WARNING)
+        try:
+            results = benchmarks.run(
+                sizes, scenarios, iterations=options['iterations'], warmup=options['warmup'],
+                allocation_iterations=options['allocation_iterations'], use_cache=options['cache'],
+                progress=progress if options['verbosity'] > 0 else None,
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+
+        with open(options['output'], 'w') as file:
+            json.dump(results, file, indent=2)
+        if results['meta']['uncovered']:
+            self.stdout.write(self.style.WARNING(
+                f"Endpoints without a scenario: {', '.join(results['meta']['uncovered'])}"))
+        if baseline:
+            self.stdout.write("Compared with the baseline (p50 latency, queries):")
+            for size, scenario, old, new, change, old_queries, new_queries in benchmarks.compare(baseline, results):
+                self.stdout.write(f"{size:>8} {scenario:<42} {old:>9.2f} -> {new:>9.2f}ms ({change:+.1f}%)  "
+                                  f"{old_queries} -> {new_queries} queries")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
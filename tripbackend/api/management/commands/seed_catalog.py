@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import seed
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic catalog of itineraries, days, stops, reviews and photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--itineraries', type=int, default=1000)
+        parser.add_argument('--days', type=int, default=4, help="Average days per itinerary.")
+        parser.add_argument('--stops-per-day', type=int, default=6, help="Average stops per day.")
+        parser.add_argument('--reviews', type=int, default=8, help="Average reviews per published itinerary.")
+        parser.add_argument('--photos', type=int, default=2, help="Average photos per itinerary.")
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--spread-days', type=int, default=365,
+                            help="Spread creation dates over this many past days (0: all now).")
+        parser.add_argument('--prefix', default='seed', help="Username prefix of the seeded users.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true', help="Delete previously seeded data first.")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError("--users must be at least 1")
+        if options['clear']:
+            deleted = seed.clear_catalog(prefix=options['prefix'])
+            self.stdout.write(f"Deleted {deleted} seeded rows.")
+
+        start = time.perf_counter()
+
+        def progress(counts):
+            self.stdout.write(f"  {counts.itineraries}/{options['itineraries']} itineraries, {counts.stops} stops")
+
+        counts = seed.seed_catalog(
+            options['itineraries'], days=options['days'], stops_per_day=options['stops_per_day'],
+            reviews_per_itinerary=options['reviews'], photos_per_itinerary=options['photos'],
+            users=options['users'], spread_days=options['spread_days'], prefix=options['prefix'],
+            seed=options['seed'], batch_size=options['batch_size'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {counts.itineraries} itineraries, {counts.days} days, {counts.stops} stops, "
+            f"{counts.reviews} reviews and {counts.photos} photos for {counts.users} users "
+            f"in {time.perf_counter() - start:.1f}s."))
@@ -0,0 +1,250 @@
+"""
+Per-request performance instrumentation.
+
+MetricsMiddleware measures every request: database queries and the time spent
+in them (through connection.execute_wrapper), time spent in serializers, the
+response size and the total latency. The numbers of the current request are
+returned in a Server-Timing header, e.g.
+
+    Server-Timing: db;desc="3 queries";dur=4.1, serializer;dur=2.7, total;dur=12.9
+
+and folded into per-view histograms with fixed buckets, served in the
+Prometheus text format by the metrics endpoint (views.metrics_view). Fixed buckets
+keep memory constant however many requests are observed; percentiles are
+estimated from the buckets, by Prometheus' histogram_quantile() or by
+Histogram.quantile().
+"""
+import bisect
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_local = threading.local()
+
+
+class RequestMetrics:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+def current():
+    """The RequestMetrics of the request being handled on this thread, or None."""
+    return getattr(_local, 'metrics', None)
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, as Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+    def quantile(self, q):
+        """Estimate the q-quantile (0..1) by linear interpolation inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        lower, previous = 0.0, 0
+        for bound, total in self.cumulative():
+            if total >= rank:
+                if bound == float('inf'):
+                    return lower
+                in_bucket = total - previous
+                return lower + (bound - lower) * ((rank - previous) / in_bucket if in_bucket else 0)
+            lower, previous = bound, total
+        return lower
+
+
+class Registry:
+    """Counters and histograms per label set, guarded by one lock."""
+
+    HISTOGRAMS = {
+        'api_request_duration_seconds': ('Total request latency.', LATENCY_BUCKETS),
+        'api_request_db_duration_seconds': ('Time spent executing database queries.', LATENCY_BUCKETS),
+        'api_request_db_queries': ('Database queries per request.', QUERY_BUCKETS),
+        'api_request_serializer_duration_seconds': ('Time spent in serializers.', LATENCY_BUCKETS),
+        'api_response_size_bytes': ('Response body size.', SIZE_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.requests = {}
+            self.histograms = {name: {} for name in self.HISTOGRAMS}
+
+    def observe(self, view, method, status_code, duration, metrics, size=None):
+        labels = (('view', view), ('method', method))
+        values = {
+            'api_request_duration_seconds': duration,
+            'api_request_db_duration_seconds': metrics.db_time,
+            'api_request_db_queries': metrics.queries,
+            'api_request_serializer_duration_seconds': metrics.serializer_time,
+            'api_response_size_bytes': size,
+        }
+        with self._lock:
+            key = labels + (('status', str(status_code)),)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            for name, value in values.items():
+                if value is None:
+                    continue
+                series = self.histograms[name]
+                if labels not in series:
+                    series[labels] = Histogram(self.HISTOGRAMS[name][1])
+                series[labels].observe(value)
+
+    def histogram(self, name, view, method='GET'):
+        return self.histograms[name].get((('view', view), ('method', method)))
+
+    def render(self):
+        """All series in the Prometheus text exposition format (version 0.0.4)."""
+        lines = [
+            '# HELP api_requests_total Requests handled.',
+            '# TYPE api_requests_total counter',
+        ]
+        with self._lock:
+            lines += [f'api_requests_total{_labels(key)} {count}' for key, count in sorted(self.requests.items())]
+            for name, (help_text, _) in self.HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for labels, histogram in sorted(self.histograms[name].items()):
+                    for bound, total in histogram.cumulative():
+                        le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                        lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {total}')
+                    lines.append(f'{name}_sum{_labels(labels)} {histogram.sum:g}')
+                    lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+registry = Registry()
+
+
+@contextmanager
+def serializer_timer():
+    """Add the time spent in the block to the current request's serializer time; nested blocks count once."""
+    metrics = current()
+    if metrics is None or metrics.serializer_depth:
+        yield
+        return
+    metrics.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_time += time.perf_counter() - start
+        metrics.serializer_depth -= 1
+
+
+class TimedSerializerMixin:
+    """
+    Count time spent representing instances as serializer time. Only the
+    outermost serializer is timed, so nested serializers are not counted twice;
+    with many=True each item is timed as it is represented.
+    """
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    # DRF function views are wrapped in a class named after the function
+    return getattr(match.func, 'cls', match.func).__name__
+
+
+def server_timing(metrics, duration):
+    queries = f'{metrics.queries} {"query" if metrics.queries == 1 else "queries"}'
+    return (f'db;desc="{queries}";dur={metrics.db_time * 1000:.1f}, '
+            f'serializer;dur={metrics.serializer_time * 1000:.1f}, total;dur={duration * 1000:.1f}')
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _execute(self, execute, sql, params, many, context):
+        metrics = current()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if metrics is not None:
+                metrics.queries += 1
+                metrics.db_time += time.perf_counter() - start
+
+    @contextmanager
+    def _measuring(self, metrics):
+        _local.metrics = metrics
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(self._execute))
+                yield
+        finally:
+            _local.metrics = None
+
+    def _stream(self, content, request, response, metrics, start):
+        # Streaming responses run their queries and serializers while the body
+        # is sent: keep measuring each chunk and record the request at the end
+        size = 0
+        iterator = iter(content)
+        try:
+            while True:
+                with self._measuring(metrics):
+                    chunk = next(iterator, None)
+                if chunk is None:
+                    break
+                size += len(chunk)
+                yield chunk
+        finally:
+            registry.observe(_view_name(request), request.method, response.status_code,
+                             time.perf_counter() - start, metrics, size)
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        start = time.perf_counter()
+        with self._measuring(metrics):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        # For a streaming response this covers the time to the first byte only
+        response['Server-Timing'] = server_timing(metrics, duration)
+        if response.streaming:
+            response.streaming_content = self._stream(response.streaming_content, request, response, metrics, start)
+        else:
+            registry.observe(_view_name(request), request.method, response.status_code, duration, metrics,
+                             len(response.content))
+        return response
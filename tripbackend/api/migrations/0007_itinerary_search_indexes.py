@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 00:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_passwordresettoken'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['status', 'duration'], name='api_itin_status_duration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['status', 'price'], name='api_itin_status_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['status', '-rating'], name='api_itin_status_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itinerary',
+            index=models.Index(fields=['status', '-created_at'], name='api_itin_status_created_idx'),
+        ),
+    ]
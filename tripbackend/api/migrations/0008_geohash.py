@@ -0,0 +1,90 @@
+# Generated by Django 5.2 on 2026-10-17 00:29
+
+from django.db import migrations, models
+
+# A copy of api.geo.geohash_for as of this migration, so later changes to that
+# module cannot change what this migration writes
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def geohash_for(latitude, longitude):
+    if latitude is None or longitude is None:
+        return ""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude = float(latitude)
+    longitude = float(longitude)
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < GEOHASH_PRECISION:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lng_range[0] = mid
+            else:
+                bits <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def populate_geohashes(apps, schema_editor):
+    Itinerary = apps.get_model("api", "Itinerary")
+    Stop = apps.get_model("api", "Stop")
+    for model in (Itinerary, Stop):
+        rows = list(model.objects.only("id", "latitude", "longitude"))
+        for row in rows:
+            row.geohash = geohash_for(row.latitude, row.longitude)
+        model.objects.bulk_update(rows, ["geohash"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0007_itinerary_search_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itinerary",
+            name="geohash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                help_text="Geohash of latitude/longitude, maintained on save",
+                max_length=12,
+            ),
+        ),
+        migrations.AddField(
+            model_name="stop",
+            name="geohash",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                help_text="Geohash of latitude/longitude, maintained on save",
+                max_length=12,
+            ),
+        ),
+        migrations.RunPython(populate_geohashes, migrations.RunPython.noop),
+    ]
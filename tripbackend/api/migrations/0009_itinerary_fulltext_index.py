@@ -0,0 +1,59 @@
+# Generated by Django 5.2 on 2026-10-17 00:31
+
+from django.db import migrations
+
+# The table as api.fulltext defined it at this migration; spelled out so later
+# changes to that module cannot change what this migration creates
+FTS_TABLE = "api_itinerary_fts"
+CREATE_FTS_TABLE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(name, destination, description, day_titles, stop_text, tokenize='porter unicode61')"
+)
+DROP_FTS_TABLE_SQL = f"DROP TABLE IF EXISTS {FTS_TABLE}"
+
+POPULATE_FTS_TABLE_SQL = f"""
+INSERT INTO {FTS_TABLE} (rowid, name, destination, description, day_titles, stop_text)
+SELECT
+    i.id,
+    i.name,
+    i.destination,
+    i.description,
+    COALESCE(
+        (SELECT group_concat(d.title, char(10)) FROM api_itineraryday d WHERE d.itinerary_id = i.id),
+        ''
+    ),
+    COALESCE(
+        (
+            SELECT group_concat(s.name || char(10) || s.location_name, char(10))
+            FROM api_stop s
+            JOIN api_itineraryday d ON s.itinerary_day_id = d.id
+            WHERE d.itinerary_id = i.id
+        ),
+        ''
+    )
+FROM api_itinerary i
+"""
+
+
+def create_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(CREATE_FTS_TABLE_SQL)
+    schema_editor.execute(POPULATE_FTS_TABLE_SQL)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(DROP_FTS_TABLE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_geohash"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2 on 2026-10-17 00:32
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    Itinerary = apps.get_model("api", "Itinerary")
+    Review = apps.get_model("api", "Review")
+    star_fields = {star: f"rating_{star}_count" for star in range(1, 6)}
+    stats = (
+        Review.objects.order_by()
+        .values("itinerary_id")
+        .annotate(
+            review_count=Count("id"),
+            rating_total=Sum("rating"),
+            **{
+                field: Count("id", filter=Q(rating=star))
+                for star, field in star_fields.items()
+            },
+        )
+    )
+    itineraries = []
+    for row in stats:
+        itinerary = Itinerary(pk=row["itinerary_id"])
+        itinerary.review_count = row["review_count"]
+        itinerary.rating_total = row["rating_total"]
+        for field in star_fields.values():
+            setattr(itinerary, field, row[field])
+        itinerary.rating = Decimal(row["rating_total"] / row["review_count"]).quantize(
+            Decimal("0.1"), rounding=ROUND_HALF_UP
+        )
+        itineraries.append(itinerary)
+    Itinerary.objects.bulk_update(
+        itineraries,
+        ["rating", "review_count", "rating_total", *star_fields.values()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_itinerary_fulltext_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itinerary",
+            name="rating_1_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="itinerary",
+            name="rating_2_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="itinerary",
+            name="rating_3_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="itinerary",
+            name="rating_4_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="itinerary",
+            name="rating_5_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="itinerary",
+            name="rating_total",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Sum of all review ratings"
+            ),
+        ),
+        migrations.AddField(
+            model_name="itinerary",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
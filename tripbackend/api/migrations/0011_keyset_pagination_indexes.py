@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-17 00:33
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, Now
+
+
+def backfill_itinerary_created_at(apps, schema_editor):
+    # Itineraries created before created_at existed have it NULL, which keyset
+    # pagination on (created_at, id) cannot page past
+    Itinerary = apps.get_model("api", "Itinerary")
+    Itinerary.objects.filter(created_at__isnull=True).update(
+        created_at=Coalesce("updated_at", Now())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_itinerary_rating_aggregates"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="itinerary",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="api_itin_user_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(
+                fields=["itinerary", "-created_at", "-id"],
+                name="api_review_itin_created_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_itinerary_created_at, migrations.RunPython.noop),
+    ]
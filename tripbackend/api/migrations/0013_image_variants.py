@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 00:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_day_stop_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itinerary",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="itineraryphoto",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-17 01:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0014_chunked_uploads"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="itineraryday",
+            name="route",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name="itineraryday",
+            name="route_signature",
+            field=models.CharField(
+                blank=True, default="", editable=False, max_length=16
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 01:11
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0015_itineraryday_route"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="itinerary",
+            index=models.Index(fields=["updated_at"], name="api_itin_updated_idx"),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.2 on 2026-10-17 01:14
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0016_itinerary_updated_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Leaderboard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("trending", "Trending"),
+                            ("top_rated", "Top rated"),
+                            ("newest", "Newest"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("key", models.CharField(blank=True, default="", max_length=100)),
+                (
+                    "rank",
+                    models.PositiveIntegerField(
+                        default=0,
+                        help_text="Order of the board among boards of its kind",
+                    ),
+                ),
+                ("signature", models.CharField(blank=True, default="", max_length=64)),
+                ("refreshed_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="LeaderboardEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.PositiveIntegerField()),
+                ("score", models.FloatField()),
+                (
+                    "summary",
+                    models.JSONField(
+                        encoder=django.core.serializers.json.DjangoJSONEncoder
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["leaderboard", "position"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="review",
+            index=models.Index(fields=["created_at"], name="api_review_created_idx"),
+        ),
+        migrations.AlterUniqueTogether(
+            name="leaderboard",
+            unique_together={("kind", "key")},
+        ),
+        migrations.AddField(
+            model_name="leaderboardentry",
+            name="itinerary",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="leaderboard_entries",
+                to="api.itinerary",
+            ),
+        ),
+        migrations.AddField(
+            model_name="leaderboardentry",
+            name="leaderboard",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="entries",
+                to="api.leaderboard",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="leaderboardentry",
+            unique_together={("leaderboard", "position")},
+        ),
+    ]
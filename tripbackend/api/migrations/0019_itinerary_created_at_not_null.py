@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-17 02:10
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def backfill_itinerary_created_at(apps, schema_editor):
+    # 0011 backfilled created_at, but the column stayed nullable and NULLs
+    # written since would drop out of keyset pagination on (created_at, id)
+    Itinerary = apps.get_model("api", "Itinerary")
+    Itinerary.objects.filter(created_at__isnull=True).update(
+        created_at=Coalesce("updated_at", Value(timezone.now()))
+    )
+    if schema_editor.connection.vendor == "sqlite":
+        # 0011 filled in NOW(), which SQLite writes with milliseconds; as text
+        # those compare below the microsecond cursors pagination filters with
+        schema_editor.execute(
+            "UPDATE api_itinerary SET created_at = created_at || '000' "
+            "WHERE created_at LIKE '____-__-__ __:__:__.___'"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0018_favorite"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_itinerary_created_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="itinerary",
+            name="created_at",
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+    ]
@@ -1,8 +1,74 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Substr
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 from datetime import datetime, timedelta
+from .geo import geohash_for
+
+def _refresh_geohash(instance, save_kwargs):
+    """
+    Recompute instance.geohash from its coordinates before a save. Code that
+    writes with bulk_create/bulk_update must set geohash itself via geohash_for().
+    """
+    instance.geohash = geohash_for(instance.latitude, instance.longitude)
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+        save_kwargs['update_fields'] = {*update_fields, 'geohash'}
+
+
+# Columns read by listing cards; see ItinerarySummarySerializer
+SUMMARY_FIELDS = (
+    'id', 'name', 'destination', 'duration', 'price', 'rating', 'review_count', 'status', 'image', 'image_variants',
+    'created_at',
+    'user_id', 'user__username', 'user__first_name', 'user__last_name',
+)
+SUMMARY_DESCRIPTION_LENGTH = 300
+# Related rows ItinerarySerializer reads, loaded by with_details()
+DETAIL_RELATIONS = ('user', 'days', 'photos')
+# Largest primary key a query can compare against (a signed 64-bit integer)
+MAX_ID = 2 ** 63 - 1
+
+
+class ItineraryQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(status='published')
+
+    def visible_to(self, user):
+        """Published itineraries, and the user's own drafts."""
+        return self.filter(models.Q(status='published') | models.Q(user=user))
+
+    def summaries(self):
+        """
+        Project just the columns needed by listing cards as dicts, joining the
+        creator in the same query and truncating the description.
+        """
+        return self.values(
+            *SUMMARY_FIELDS,
+            short_description=Substr('description', 1, SUMMARY_DESCRIPTION_LENGTH),
+        )
+
+    def with_details(self, relations=DETAIL_RELATIONS):
+        """
+        Load everything ItinerarySerializer reads in a constant number of queries:
+        the creator, the days (by day_number) with their stops (by order), and the photos.
+        `relations` limits this to some of DETAIL_RELATIONS, such as those a
+        sparse fieldset expands (see SparseFieldsetMixin).
+        """
+        queryset = self.select_related('user') if 'user' in relations else self
+        lookups = []
+        if 'days' in relations:
+            lookups.append(models.Prefetch(
+                'days',
+                queryset=ItineraryDay.objects.order_by('day_number').prefetch_related(
+                    models.Prefetch('stops', queryset=Stop.objects.order_by('order', 'id'))
+                ),
+            ))
+        if 'photos' in relations:
+            lookups.append('photos')
+        return queryset.prefetch_related(*lookups)
+
 
 # Create your models here.
 class Itinerary(models.Model):
@@ -16,23 +82,59 @@ class Itinerary(models.Model):
     description = models.TextField()
     duration = models.IntegerField(help_text="Duration in days")
     image = models.ImageField(upload_to='itineraries/', null=True, blank=True)
+    # Resized copies of image, written by api.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     destination = models.CharField(max_length=100)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False,
+                               help_text="Geohash of latitude/longitude, maintained on save")
     price = models.DecimalField(max_digits=10, decimal_places=2)
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=0)
+    # Review aggregates, maintained incrementally by api.ratings
+    review_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0, help_text="Sum of all review ratings")
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
-    created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 
+    objects = ItineraryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Support the filters and sort orders of the search endpoint
+            models.Index(fields=['status', 'duration'], name='api_itin_status_duration_idx'),
+            models.Index(fields=['status', 'price'], name='api_itin_status_price_idx'),
+            models.Index(fields=['status', '-rating'], name='api_itin_status_rating_idx'),
+            models.Index(fields=['status', '-created_at'], name='api_itin_status_created_idx'),
+            # Keyset pagination of a creator's itineraries on (created_at, id)
+            models.Index(fields=['user', '-created_at', '-id'], name='api_itin_user_created_idx'),
+            # Itineraries changed since a point in time, for api.similar
+            models.Index(fields=['updated_at'], name='api_itin_updated_idx'),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        _refresh_geohash(self, kwargs)
+        super().save(*args, **kwargs)
+
 class ItineraryDay(models.Model):
     itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='days')
     day_number = models.IntegerField()
     title = models.CharField(max_length=100)
     description = models.TextField()
+    # Distances and a suggested stop order computed by api.routes, valid while
+    # route_signature matches the stops' coordinates
+    route = models.JSONField(default=dict, blank=True, editable=False)
+    route_signature = models.CharField(max_length=16, blank=True, default='', editable=False)
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 
     class Meta:
         ordering = ['day_number']
@@ -57,7 +159,10 @@ class Stop(models.Model):
     location_name = models.CharField(max_length=255, default='')
     latitude = models.DecimalField(max_digits=9, decimal_places=6)
     longitude = models.DecimalField(max_digits=9, decimal_places=6)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True, editable=False,
+                               help_text="Geohash of latitude/longitude, maintained on save")
     order = models.PositiveIntegerField(default=0, help_text="Order of the stop within the day")
+    updated_at = models.DateTimeField(auto_now=True, null=True, blank=True)
 
     class Meta:
         ordering = ['order']
@@ -65,9 +170,15 @@ class Stop(models.Model):
     def __str__(self):
         return f"{self.get_stop_type_display()}: {self.name} (Day {self.itinerary_day.day_number})"
 
+    def save(self, *args, **kwargs):
+        _refresh_geohash(self, kwargs)
+        super().save(*args, **kwargs)
+
 class ItineraryPhoto(models.Model):
     itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='photos')
     image = models.ImageField(upload_to='itineraries/photos/')
+    # Resized copies of image, written by api.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     caption = models.CharField(max_length=200, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
@@ -85,7 +196,112 @@ class Review(models.Model):
     class Meta:
         unique_together = ['user', 'itinerary']  # One review per user per itinerary
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of an itinerary's reviews on (created_at, id)
+            models.Index(fields=['itinerary', '-created_at', '-id'], name='api_review_itin_created_idx'),
+            # Recent reviews across the catalog, for the trending leaderboard
+            models.Index(fields=['created_at'], name='api_review_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating so api.signals can apply the exact delta on save
+        if 'rating' in instance.__dict__:
+            instance._loaded_rating = instance.rating
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The itinerary's rating aggregates are updated by a post_save handler;
+        # keep both writes in one transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
     
+class Favorite(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='favorites')
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='favorited_by')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ['user', 'itinerary']
+        indexes = [
+            # A user's favorites, most recently saved first
+            models.Index(fields=['user', '-created_at'], name='api_fav_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} likes {self.itinerary}"
+
+class Leaderboard(models.Model):
+    """
+    A ranked list of published itineraries served by /api/leaderboards/,
+    recomputed by api.leaderboards. Newest boards are kept per destination,
+    which is their `key`; the other kinds have a single board with an empty key.
+    """
+    KIND_CHOICES = [
+        ('trending', 'Trending'),
+        ('top_rated', 'Top rated'),
+        ('newest', 'Newest'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100, blank=True, default='')
+    rank = models.PositiveIntegerField(default=0, help_text="Order of the board among boards of its kind")
+    # Digest of the data the board was computed from; unchanged data is not recomputed
+    signature = models.CharField(max_length=64, blank=True, default='')
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['kind', 'key']
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.key}".strip()
+
+class LeaderboardEntry(models.Model):
+    leaderboard = models.ForeignKey(Leaderboard, on_delete=models.CASCADE, related_name='entries')
+    position = models.PositiveIntegerField()
+    itinerary = models.ForeignKey(Itinerary, on_delete=models.CASCADE, related_name='leaderboard_entries')
+    score = models.FloatField()
+    # The itinerary's ItinerarySummarySerializer data, served as is
+    summary = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        ordering = ['leaderboard', 'position']
+        unique_together = ['leaderboard', 'position']
+
+    def __str__(self):
+        return f"{self.leaderboard} #{self.position}: {self.summary.get('name', self.itinerary_id)}"
+
+class Upload(models.Model):
+    """
+    A file being uploaded in chunks through the /api/uploads/ endpoints.
+
+    The bytes received so far live in a temporary file (see api.uploads); once
+    `offset` reaches `size` the upload is complete and can be attached to an
+    itinerary, which moves the file into media storage and deletes this row.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('complete', 'Complete'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField(help_text="Total size in bytes, declared when the upload starts")
+    offset = models.PositiveBigIntegerField(default=0, help_text="Bytes received so far")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size} bytes)"
+
 class PasswordResetToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reset_tokens')
     token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
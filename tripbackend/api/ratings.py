@@ -0,0 +1,105 @@
+"""
+Rating aggregates stored on Itinerary.
+
+Itinerary.review_count, rating_total and the per-star rating_<n>_count columns
+are adjusted with a single UPDATE whenever a review is created, changed or
+deleted (see api.signals), and Itinerary.rating is recomputed from them in the
+same statement. rebuild_aggregates() recomputes everything from api_review.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Case, Count, F, FloatField, Q, Sum, Value, When
+from django.db.models.functions import Cast, Round
+
+STAR_COUNT_FIELDS = {star: f'rating_{star}_count' for star in range(1, 6)}
+AGGREGATE_FIELDS = ('rating', 'review_count', 'rating_total', *STAR_COUNT_FIELDS.values())
+
+
+def _average(total, count, count_delta):
+    # `count` is the column before this UPDATE, so the new count is positive
+    # exactly when review_count > -count_delta
+    return Case(
+        When(review_count__gt=-count_delta, then=Round(Cast(total, FloatField()) / count, 1)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_review_change(itinerary_id, old_rating=None, new_rating=None):
+    """
+    Adjust an itinerary's aggregates for one review going from old_rating to
+    new_rating. Use old_rating=None for a new review and new_rating=None for a
+    deleted one.
+    """
+    if old_rating == new_rating:
+        return
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    total_delta = (new_rating or 0) - (old_rating or 0)
+    review_count = F('review_count') + count_delta
+    rating_total = F('rating_total') + total_delta
+    updates = {
+        'review_count': review_count,
+        'rating_total': rating_total,
+        'rating': _average(rating_total, review_count, count_delta),
+    }
+    if old_rating is not None:
+        updates[STAR_COUNT_FIELDS[old_rating]] = F(STAR_COUNT_FIELDS[old_rating]) - 1
+    if new_rating is not None:
+        updates[STAR_COUNT_FIELDS[new_rating]] = F(STAR_COUNT_FIELDS[new_rating]) + 1
+
+    from .models import Itinerary
+    Itinerary.objects.filter(pk=itinerary_id).update(**updates)
+
+
+def average_rating(rating_total, review_count):
+    """Average rounded the way SQLite's ROUND() rounds the float average in apply_review_change()."""
+    if not review_count:
+        return Decimal('0.0')
+    return Decimal(rating_total / review_count).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+
+
+def histogram(itinerary):
+    return {str(star): getattr(itinerary, field) for star, field in STAR_COUNT_FIELDS.items()}
+
+
+def rebuild_aggregates(itinerary_ids=None, batch_size=1000):
+    """
+    Recompute the aggregates of the given itineraries (all when None) from
+    api_review with one grouped query, writing them back with bulk_update.
+    Returns the number of itineraries updated.
+    """
+    from .models import Itinerary, Review
+
+    reviews = Review.objects.all()
+    itineraries = Itinerary.objects.order_by('pk')
+    if itinerary_ids is not None:
+        reviews = reviews.filter(itinerary_id__in=itinerary_ids)
+        itineraries = itineraries.filter(pk__in=itinerary_ids)
+
+    stats = {
+        row['itinerary_id']: row
+        for row in reviews.order_by().values('itinerary_id').annotate(
+            review_count=Count('id'),
+            rating_total=Sum('rating'),
+            **{field: Count('id', filter=Q(rating=star)) for star, field in STAR_COUNT_FIELDS.items()},
+        )
+    }
+
+    updated = 0
+    batch = []
+    for itinerary in itineraries.only('pk').iterator(chunk_size=batch_size):
+        row = stats.get(itinerary.pk, {})
+        itinerary.review_count = row.get('review_count', 0)
+        itinerary.rating_total = row.get('rating_total') or 0
+        for field in STAR_COUNT_FIELDS.values():
+            setattr(itinerary, field, row.get(field, 0))
+        itinerary.rating = average_rating(itinerary.rating_total, itinerary.review_count)
+        batch.append(itinerary)
+        if len(batch) >= batch_size:
+            Itinerary.objects.bulk_update(batch, AGGREGATE_FIELDS)
+            updated += len(batch)
+            batch = []
+    if batch:
+        Itinerary.objects.bulk_update(batch, AGGREGATE_FIELDS)
+        updated += len(batch)
+    return updated
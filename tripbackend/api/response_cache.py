@@ -0,0 +1,185 @@
+"""
+Cache for the public read endpoints.
+
+Cached responses are keyed on the request URL plus the current version of every
+scope the response depends on: the public catalog, one itinerary, one
+creator's itineraries, the leaderboards, or the similarity index. A write never deletes cache
+entries; api.signals bumps the versions of the scopes it touches once the
+transaction commits, so every key built from an old version simply stops
+being looked up and ages out.
+
+Versions live in the same cache as the responses, which makes the scheme work
+unchanged on any Django cache backend (see CACHE_BACKEND in settings).
+"""
+import hashlib
+import threading
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+CATALOG = 'catalog'
+LEADERBOARDS = 'leaderboards'
+SIMILAR = 'similar'
+ITINERARY = 'itinerary'
+CREATOR = 'creator'
+
+VERSION_KEY_PREFIX = 'api:version'
+# Headers stored with a cached response and replayed on a hit
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+RESPONSE_KEY_PREFIX = 'api:response'
+DOCUMENT_KEY_PREFIX = 'api:document'
+
+_local = threading.local()
+
+
+def version_key(scope, object_id=None):
+    if object_id is None:
+        return f'{VERSION_KEY_PREFIX}:{scope}'
+    return f'{VERSION_KEY_PREFIX}:{scope}:{object_id}'
+
+
+def _new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(keys):
+    """Current version of each key, creating versions for keys not in the cache yet."""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A fresh random version, so a key evicted from the cache can never
+            # come back with a version that old responses were stored under
+            cache.add(key, _new_version(), timeout=None)
+            versions[key] = cache.get(key) or _new_version()
+    return [versions[key] for key in keys]
+
+
+def bump_versions(keys):
+    keys = set(keys)
+    if keys:
+        cache.set_many({key: _new_version() for key in keys}, timeout=None)
+
+
+def _pending():
+    pending = getattr(_local, 'pending', None)
+    if pending is None:
+        pending = _local.pending = {'itineraries': set(), 'summaries': set(), 'days': set(), 'creators': set()}
+    return pending
+
+
+def _flush():
+    from .models import Itinerary, ItineraryDay
+
+    pending, _local.pending = _pending(), None
+    if pending['days']:
+        pending['itineraries'].update(
+            ItineraryDay.objects.filter(pk__in=pending['days']).values_list('itinerary_id', flat=True))
+    creators = pending['creators']
+    if pending['summaries']:
+        creators.update(
+            user_id for user_id in Itinerary.objects.filter(pk__in=pending['summaries']).values_list(
+                'user_id', flat=True)
+            if user_id is not None)
+
+    keys = [version_key(ITINERARY, pk) for pk in pending['itineraries'] | pending['summaries']]
+    keys += [version_key(CREATOR, user_id) for user_id in creators]
+    if pending['summaries'] or creators:
+        keys.append(version_key(CATALOG))
+    bump_versions(keys)
+
+
+def invalidate(itineraries=(), summaries=(), days=(), creators=()):
+    """
+    Schedule cache invalidation for when the current transaction commits.
+
+    itineraries  ids whose detail or reviews changed
+    summaries    ids whose list card changed too (also invalidates the
+                 catalog and the creator's list)
+    days         ItineraryDay ids whose itinerary's detail changed
+    creators     user ids whose list of itineraries changed
+
+    Ids are collected per thread and resolved in one pass on commit, however
+    many rows the transaction touched.
+    """
+    pending = _pending()
+    pending['itineraries'].update(itineraries)
+    pending['summaries'].update(summaries)
+    pending['days'].update(days)
+    pending['creators'].update(creators)
+    # Each call schedules a flush; the first one to run empties the batch and the
+    # rest are no-ops. Scheduling every time survives savepoint rollbacks.
+    transaction.on_commit(_flush)
+
+
+def cached_documents(scope, ids, load, namespace=''):
+    """
+    Data of many objects of one scope (ITINERARY or CREATOR) by id, each
+    cached on its own under the current version of its scope, so a change to
+    one object leaves the others cached. `load(ids)` is called once with the
+    ids not in the cache and returns {id: data}, which is cached for the next
+    call; ids it leaves out are left out of the result too. `namespace`
+    separates data that differs per request, such as absolute URLs per host.
+    """
+    versions = get_versions([version_key(scope, pk) for pk in ids])
+    namespace = hashlib.sha1(namespace.encode('utf-8')).hexdigest()[:12]
+    keys = {pk: f'{DOCUMENT_KEY_PREFIX}:{scope}:{namespace}:{pk}:{version}' for pk, version in zip(ids, versions)}
+    cached = cache.get_many(list(keys.values()))
+    found = {pk: cached[key] for pk, key in keys.items() if key in cached}
+    missing = [pk for pk in ids if pk not in found]
+    if missing:
+        loaded = load(missing)
+        cache.set_many({keys[pk]: data for pk, data in loaded.items()}, settings.RESPONSE_CACHE_TIMEOUT)
+        found.update(loaded)
+    return found
+
+
+def cached_response(*scopes):
+    """
+    Cache successful GET responses of a function-based DRF view.
+
+    Each scope is CATALOG, LEADERBOARDS or SIMILAR, or (ITINERARY, kwarg) /
+    (CREATOR, kwarg) naming the URL keyword argument holding the id. Place directly below @api_view. The
+    response data is cached, not the rendered bytes, so content negotiation
+    still applies on a hit; validators set by api.conditional are cached with
+    it so a conditional request that hits the cache is answered from it too.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            keys = [
+                version_key(scope) if isinstance(scope, str) else version_key(scope[0], kwargs[scope[1]])
+                for scope in scopes
+            ]
+            digest = hashlib.sha1(request.build_absolute_uri().encode('utf-8')).hexdigest()
+            key = f"{RESPONSE_KEY_PREFIX}:{view.__name__}:{digest}:{'.'.join(get_versions(keys))}"
+
+            cached = cache.get(key)
+            if cached is not None:
+                data, headers = cached
+                response = get_conditional_response(
+                    request, etag=headers.get('ETag'),
+                    last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+                ) or Response(data)
+                for header, value in headers.items():
+                    response[header] = value
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = view(request, *args, **kwargs)
+            # Streaming responses are produced on the fly and never cached
+            if response.status_code == 200 and not response.streaming:
+                headers = {header: response[header] for header in CACHED_HEADERS if header in response}
+                cache.set(key, (response.data, headers), settings.RESPONSE_CACHE_TIMEOUT)
+                response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
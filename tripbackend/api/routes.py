@@ -0,0 +1,197 @@
+"""
+Route metrics for the stops of an itinerary day.
+
+For a day's stops, in their stored order, a great-circle distance matrix is
+computed with NumPy in one vectorized pass. From it come the length of each
+leg, the total distance and walking and driving estimates: straight-line
+distance stretched by a detour factor for the street network, at a typical
+speed. A shorter visiting order is suggested by a nearest-neighbour tour
+improved with 2-opt, keeping the first stop (usually where the day starts)
+in place. The suggestion is a list of positions in the day's stop list, so
+stop ids play no part and it can be computed before the stops are saved.
+
+Routes are cached on ItineraryDay with a signature of the coordinates they
+were computed from. A cached route whose signature no longer matches the
+stops is stale and is recomputed on read; the bulk writers in api.bulk store
+fresh routes as they write days and stops, and rebuild_routes() refreshes
+every day, e.g. after a stop was edited through the admin.
+"""
+import hashlib
+
+import numpy as np
+
+from .geo import EARTH_RADIUS_KM
+from .models import ItineraryDay, Stop
+
+# (detour factor over the straight line, average speed in km/h)
+TRAVEL_MODES = {
+    'walking': (1.3, 4.8),
+    'driving': (1.4, 35.0),
+}
+# 2-opt is quadratic per pass; longer days only get the nearest-neighbour tour
+MAX_TWO_OPT_STOPS = 200
+# Only suggest a new order if it saves this much of the current distance
+MIN_SAVING = 0.05
+MIN_SAVING_KM = 0.05
+
+
+def points_of(stops):
+    """(latitude, longitude) pairs of Stop rows or validated stop dicts."""
+    return [
+        (float(stop['latitude']), float(stop['longitude'])) if isinstance(stop, dict)
+        else (float(stop.latitude), float(stop.longitude))
+        for stop in stops
+    ]
+
+
+def signature(points):
+    """Short digest of the points a route is computed from."""
+    text = ';'.join(f'{latitude:.6f},{longitude:.6f}' for latitude, longitude in points)
+    return hashlib.blake2b(text.encode('ascii'), digest_size=8).hexdigest()
+
+
+def distance_matrix(points):
+    """Great-circle distances in kilometres between every pair of points, as an n x n array."""
+    coordinates = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    latitudes, longitudes = coordinates[:, 0], coordinates[:, 1]
+    half_dlat = (latitudes[:, None] - latitudes[None, :]) / 2
+    half_dlng = (longitudes[:, None] - longitudes[None, :]) / 2
+    cosines = np.cos(latitudes)
+    a = np.sin(half_dlat) ** 2 + np.outer(cosines, cosines) * np.sin(half_dlng) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def path_length(matrix, order):
+    order = np.asarray(order)
+    return float(matrix[order[:-1], order[1:]].sum()) if len(order) > 1 else 0.0
+
+
+def nearest_neighbour(matrix, start=0):
+    """Visit the closest unvisited point next, starting from `start`."""
+    count = len(matrix)
+    order = [start]
+    unvisited = np.ones(count, dtype=bool)
+    unvisited[start] = False
+    for _ in range(count - 1):
+        distances = np.where(unvisited, matrix[order[-1]], np.inf)
+        following = int(distances.argmin())
+        order.append(following)
+        unvisited[following] = False
+    return order
+
+
+def two_opt(matrix, order):
+    """
+    Shorten an open path by reversing segments until no reversal helps. The
+    first point stays first; the last one may change. Each pass scores every
+    possible reversal at once and applies the best one.
+    """
+    count = len(order)
+    # An extra point at distance 0 from all others ends the path, so reversing
+    # a segment that reaches the end is scored like any other
+    padded = np.zeros((count + 1, count + 1))
+    padded[:count, :count] = matrix
+    path = np.append(np.asarray(order), count)
+    starts = np.arange(1, count)[:, None]
+    ends = np.arange(1, count)[None, :]
+    valid = ends > starts
+    while True:
+        before, first = path[starts - 1], path[starts]
+        last, after = path[ends], path[ends + 1]
+        gains = padded[before, first] + padded[last, after] - padded[before, last] - padded[first, after]
+        gains = np.where(valid, gains, 0.0)
+        best = int(gains.argmax())
+        if gains.flat[best] <= 1e-9:
+            return path[:-1].tolist()
+        start, end = divmod(best, count - 1)
+        path[start + 1:end + 2] = path[start + 1:end + 2][::-1]
+
+
+def optimize_order(matrix):
+    """A short visiting order starting from point 0, as a list of positions."""
+    count = len(matrix)
+    if count < 3:
+        return list(range(count))
+    candidates = [nearest_neighbour(matrix)]
+    if count <= MAX_TWO_OPT_STOPS:
+        # 2-opt from the stored order too: it is often close to good already
+        candidates = [two_opt(matrix, order) for order in (candidates[0], list(range(count)))]
+    return min(candidates, key=lambda order: path_length(matrix, order))
+
+
+def _estimate(distance_km, mode):
+    detour, speed = TRAVEL_MODES[mode]
+    return {'distance_km': round(distance_km * detour, 3), 'minutes': round(distance_km * detour / speed * 60, 1)}
+
+
+def compute(points):
+    """The route document of a day whose stops are at `points`, in order."""
+    matrix = distance_matrix(points)
+    legs = np.diagonal(matrix, 1)  # from each stop to the next
+    distance = float(legs.sum())
+    route = {
+        'stop_count': len(points),
+        'distance_km': round(distance, 3),
+        'legs_km': legs.round(3).tolist(),
+        **{mode: _estimate(distance, mode) for mode in TRAVEL_MODES},
+        'suggested_order': None,
+        'suggested_distance_km': None,
+    }
+    order = optimize_order(matrix)
+    suggested = path_length(matrix, order)
+    if distance - suggested > max(MIN_SAVING * distance, MIN_SAVING_KM):
+        route['suggested_order'] = order
+        route['suggested_distance_km'] = round(suggested, 3)
+    return route
+
+
+def route_fields(stops):
+    """
+    Values of ItineraryDay.route and route_signature for Stop rows in visiting
+    order, or for validated stop dicts in the order they are saved.
+    """
+    if stops and isinstance(stops[0], dict):
+        # Stops are read back by `order`, ties in insertion order
+        stops = sorted(stops, key=lambda stop: stop.get('order', 0))
+    points = points_of(stops)
+    return {'route': compute(points), 'route_signature': signature(points)}
+
+
+def route_for(day, stops=None, save=False):
+    """
+    The route of `day`: the cached one if it matches the stops, else a fresh
+    one, which is stored with save=True. `stops` default to day.stops.all(),
+    which should be prefetched in order.
+    """
+    stops = day.stops.all() if stops is None else stops
+    points = points_of(stops)
+    key = signature(points)
+    if day.route_signature == key and day.route:
+        return day.route
+    day.route, day.route_signature = compute(points), key
+    if save:
+        ItineraryDay.objects.filter(pk=day.pk).update(route=day.route, route_signature=key)
+    return day.route
+
+
+def refresh_days(day_ids, batch_size=None):
+    """Recompute and store the routes of the given days. Returns the number of days updated."""
+    days = {day.pk: day for day in ItineraryDay.objects.filter(pk__in=day_ids).only('id')}
+    stops = {pk: [] for pk in days}
+    for stop in Stop.objects.filter(itinerary_day__in=days).order_by('order', 'id').only(
+            'itinerary_day_id', 'latitude', 'longitude'):
+        stops[stop.itinerary_day_id].append(stop)
+    for pk, day in days.items():
+        for field, value in route_fields(stops[pk]).items():
+            setattr(day, field, value)
+    ItineraryDay.objects.bulk_update(days.values(), ['route', 'route_signature'], batch_size=batch_size)
+    return len(days)
+
+
+def rebuild_routes(batch_size=1000):
+    """Recompute the cached route of every day. Returns the number of days."""
+    refreshed = 0
+    day_ids = list(ItineraryDay.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(day_ids), batch_size):
+        refreshed += refresh_days(day_ids[start:start + batch_size], batch_size=batch_size)
+    return refreshed
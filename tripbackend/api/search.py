@@ -0,0 +1,205 @@
+from django.db.models import Case, FloatField, Q, Value, When
+
+from . import fulltext
+from .geo import bounding_box, covering_cells, geohash_prefix_ranges, haversine_km
+from .models import Itinerary, Stop
+
+# Price buckets shown on the search page, keyed by the symbol the frontend sends.
+# Upper bounds are inclusive to match getPriceSymbol() in the frontend.
+PRICE_BUCKETS = {
+    '$': (None, 500),
+    '$$': (500, 1000),
+    '$$$': (1000, None),
+}
+
+SORT_ORDERS = {
+    'rating': ('-rating', '-review_count', '-created_at', '-id'),
+    'newest': ('-created_at', '-id'),
+    'price_asc': ('price', '-id'),
+    'price_desc': ('-price', '-id'),
+}
+SORT_ALIASES = {
+    'price': 'price_asc',
+    '-price': 'price_desc',
+}
+DEFAULT_SORT = 'newest'
+
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 500
+# Cap on itineraries returned by a radius query, nearest first
+MAX_NEARBY_RESULTS = 500
+
+
+class SearchParamError(ValueError):
+    """Raised when a search query parameter cannot be interpreted."""
+
+
+def _parse_int(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise SearchParamError(f"'{name}' must be an integer")
+
+
+def _parse_float(params, name, minimum, maximum):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise SearchParamError(f"'{name}' must be a number")
+    if not minimum <= value <= maximum:
+        raise SearchParamError(f"'{name}' must be between {minimum} and {maximum}")
+    return value
+
+
+def parse_location(params):
+    """
+    Read lat/lng/radius (km) query parameters. Returns None when no location
+    was given, otherwise a (latitude, longitude, radius_km) tuple.
+    """
+    latitude = _parse_float(params, 'lat', -90, 90)
+    longitude = _parse_float(params, 'lng', -180, 180)
+    if latitude is None and longitude is None:
+        return None
+    if latitude is None or longitude is None:
+        raise SearchParamError("'lat' and 'lng' must be given together")
+    radius = _parse_float(params, 'radius', 0, MAX_RADIUS_KM)
+    return latitude, longitude, DEFAULT_RADIUS_KM if radius is None else radius
+
+
+def _spatial_q(south, north, lng_ranges, field_prefix=''):
+    """Q matching rows whose geohash and coordinates fall inside the bounding box."""
+    cells = Q()
+    for low, high in geohash_prefix_ranges(covering_cells(south, north, lng_ranges)):
+        cells |= Q(**{f'{field_prefix}geohash__gte': low, f'{field_prefix}geohash__lt': high})
+    longitudes = Q()
+    for west, east in lng_ranges:
+        longitudes |= Q(**{f'{field_prefix}longitude__gte': west, f'{field_prefix}longitude__lte': east})
+    return cells & longitudes & Q(**{
+        f'{field_prefix}latitude__gte': south,
+        f'{field_prefix}latitude__lte': north,
+    })
+
+
+def nearby_itinerary_distances(latitude, longitude, radius_km, limit=MAX_NEARBY_RESULTS):
+    """
+    Find published itineraries whose own coordinates or any of whose stops lie
+    within radius_km of the point.
+
+    Returns a list of (itinerary_id, distance_km) pairs, nearest first, where the
+    distance is to the closest of the itinerary's center and stops.
+    """
+    south, north, lng_ranges = bounding_box(latitude, longitude, radius_km)
+    candidates = list(
+        Itinerary.objects.published()
+        .filter(_spatial_q(south, north, lng_ranges))
+        .values_list('id', 'latitude', 'longitude')
+    )
+    candidates += (
+        Stop.objects.filter(
+            _spatial_q(south, north, lng_ranges),
+            itinerary_day__itinerary__status='published',
+        )
+        .values_list('itinerary_day__itinerary_id', 'latitude', 'longitude')
+    )
+
+    distances = {}
+    for itinerary_id, lat, lng in candidates:
+        distance = haversine_km(latitude, longitude, lat, lng)
+        if distance <= radius_km and distance < distances.get(itinerary_id, float('inf')):
+            distances[itinerary_id] = distance
+    return sorted(distances.items(), key=lambda item: (item[1], item[0]))[:limit]
+
+
+def _parse_price_buckets(params):
+    buckets = []
+    for value in params.getlist('price'):
+        buckets.extend(part.strip() for part in value.split(',') if part.strip())
+    unknown = [bucket for bucket in buckets if bucket not in PRICE_BUCKETS]
+    if unknown:
+        raise SearchParamError(
+            f"Unknown price bucket(s): {', '.join(unknown)}. Use one of: {', '.join(PRICE_BUCKETS)}"
+        )
+    return buckets
+
+
+def price_bucket_q(buckets):
+    """Build a Q object matching any of the given price buckets."""
+    query = Q()
+    for bucket in buckets:
+        lower, upper = PRICE_BUCKETS[bucket]
+        condition = Q()
+        if lower is not None:
+            condition &= Q(price__gt=lower)
+        if upper is not None:
+            condition &= Q(price__lte=upper)
+        query |= condition
+    return query
+
+
+def filter_itineraries(queryset, params):
+    """
+    Apply the search page filters to an Itinerary queryset.
+
+    Supported query parameters:
+        q             keywords matched against the full-text index (see api.fulltext)
+        destination   case-insensitive substring of Itinerary.destination
+        min_duration  minimum duration in days (inclusive)
+        max_duration  maximum duration in days (inclusive)
+        price         one or more of $, $$, $$$ (comma separated or repeated)
+        lat, lng      restrict to itineraries near this point (see nearby_itinerary_distances)
+        radius        search radius in km around lat/lng (default 25)
+        sort          rating, newest, price_asc, price_desc, relevance when q is given
+                      (the default then) or distance when lat/lng are given
+
+    Raises SearchParamError for malformed parameters.
+    """
+    destination = params.get('destination', '').strip()
+    if destination:
+        queryset = queryset.filter(destination__icontains=destination)
+
+    min_duration = _parse_int(params, 'min_duration')
+    max_duration = _parse_int(params, 'max_duration')
+    if min_duration is not None and max_duration is not None and min_duration > max_duration:
+        raise SearchParamError("'min_duration' cannot be greater than 'max_duration'")
+    if min_duration is not None:
+        queryset = queryset.filter(duration__gte=min_duration)
+    if max_duration is not None:
+        queryset = queryset.filter(duration__lte=max_duration)
+
+    buckets = _parse_price_buckets(params)
+    if buckets:
+        queryset = queryset.filter(price_bucket_q(buckets))
+
+    keywords = params.get('q', '').strip()
+    sort = params.get('sort') or ('relevance' if keywords else DEFAULT_SORT)
+    sort = SORT_ALIASES.get(sort, sort)
+
+    if keywords:
+        queryset = fulltext.filter_queryset(queryset, keywords, rank=sort == 'relevance')
+    elif sort == 'relevance':
+        raise SearchParamError("'sort=relevance' requires 'q'")
+
+    location = parse_location(params)
+    if location is not None:
+        distances = nearby_itinerary_distances(*location)
+        queryset = queryset.filter(id__in=[itinerary_id for itinerary_id, _ in distances])
+        if sort == 'distance':
+            distance = Case(
+                *[When(id=itinerary_id, then=Value(km)) for itinerary_id, km in distances],
+                default=Value(None), output_field=FloatField(),
+            )
+            return queryset.annotate(distance_km=distance).order_by('distance_km', 'id')
+    elif sort == 'distance':
+        raise SearchParamError("'sort=distance' requires 'lat' and 'lng'")
+
+    if sort == 'relevance':
+        return queryset
+    if sort not in SORT_ORDERS:
+        raise SearchParamError(f"'sort' must be one of: {', '.join(SORT_ORDERS)}, relevance, distance")
+    return queryset.order_by(*SORT_ORDERS[sort])
@@ -0,0 +1,230 @@
+"""
+Synthetic catalog generator for development and benchmarks.
+
+Creates users, itineraries, days, stops, reviews and photos with bulk_create,
+a chunk of itineraries at a time, so memory stays flat and a million stops
+load in seconds. bulk_create skips model save() and signals, so this module
+does their work per chunk: it sets geohashes and day routes, indexes the
+itineraries for full-text search, rebuilds their rating aggregates and
+invalidates cached responses. Output is deterministic for a given random seed.
+
+Seeded users are named "<prefix>-<n>@example.com" and cannot log in;
+clear_catalog() deletes them, which cascades to everything they created.
+"""
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from . import fulltext, ratings, response_cache, routes
+from .geo import geohash_for
+from .models import Itinerary, ItineraryDay, ItineraryPhoto, Review, Stop
+
+# name, country, latitude, longitude
+DESTINATIONS = (
+    ('Paris', 'France', 48.8566, 2.3522),
+    ('Rome', 'Italy', 41.9028, 12.4964),
+    ('Barcelona', 'Spain', 41.3874, 2.1686),
+    ('Lisbon', 'Portugal', 38.7223, -9.1393),
+    ('Amsterdam', 'Netherlands', 52.3676, 4.9041),
+    ('Berlin', 'Germany', 52.5200, 13.4050),
+    ('Prague', 'Czechia', 50.0755, 14.4378),
+    ('Vienna', 'Austria', 48.2082, 16.3738),
+    ('Istanbul', 'Turkey', 41.0082, 28.9784),
+    ('Athens', 'Greece', 37.9838, 23.7275),
+    ('London', 'United Kingdom', 51.5072, -0.1276),
+    ('Edinburgh', 'United Kingdom', 55.9533, -3.1883),
+    ('Reykjavik', 'Iceland', 64.1466, -21.9426),
+    ('New York', 'United States', 40.7128, -74.0060),
+    ('San Francisco', 'United States', 37.7749, -122.4194),
+    ('Mexico City', 'Mexico', 19.4326, -99.1332),
+    ('Buenos Aires', 'Argentina', -34.6037, -58.3816),
+    ('Rio de Janeiro', 'Brazil', -22.9068, -43.1729),
+    ('Cape Town', 'South Africa', -33.9249, 18.4241),
+    ('Marrakech', 'Morocco', 31.6295, -7.9811),
+    ('Cairo', 'Egypt', 30.0444, 31.2357),
+    ('Dubai', 'United Arab Emirates', 25.2048, 55.2708),
+    ('Mumbai', 'India', 19.0760, 72.8777),
+    ('Bangkok', 'Thailand', 13.7563, 100.5018),
+    ('Hanoi', 'Vietnam', 21.0278, 105.8342),
+    ('Singapore', 'Singapore', 1.3521, 103.8198),
+    ('Bali', 'Indonesia', -8.3405, 115.0920),
+    ('Tokyo', 'Japan', 35.6762, 139.6503),
+    ('Kyoto', 'Japan', 35.0116, 135.7681),
+    ('Seoul', 'South Korea', 37.5665, 126.9780),
+    ('Sydney', 'Australia', -33.8688, 151.2093),
+    ('Queenstown', 'New Zealand', -45.0312, 168.6626),
+)
+THEMES = ('classics', 'on a budget', 'food tour', 'for families', 'off the beaten path', 'in style',
+          'by bike', 'art and museums', 'nightlife', 'slow travel', 'weekend', 'hidden gems')
+PLACES = ('Old Town', 'Cathedral', 'Market', 'Museum', 'Harbour', 'Botanical Garden', 'Castle', 'Viewpoint',
+          'Riverside', 'Gallery', 'Food Hall', 'Park', 'Bridge', 'Temple', 'Station', 'Bistro', 'Hostel',
+          'Hotel', 'Beach', 'Palace')
+WORDS = ('wander', 'taste', 'local', 'early', 'sunset', 'quiet', 'crowded', 'historic', 'street', 'coffee',
+         'walk', 'views', 'guide', 'tickets', 'book', 'ahead', 'evening', 'lunch', 'breakfast', 'tram',
+         'ferry', 'square', 'lively', 'relaxed', 'photos', 'souvenirs', 'queue', 'worth', 'favourite')
+STOP_TYPES = [choice for choice, _ in Stop.STOP_TYPE_CHOICES]
+# Star ratings skewed towards the positive, like real reviews
+RATING_WEIGHTS = (0.04, 0.06, 0.15, 0.35, 0.40)
+
+
+@dataclass
+class SeedCounts:
+    users: int = 0
+    itineraries: int = 0
+    days: int = 0
+    stops: int = 0
+    reviews: int = 0
+    photos: int = 0
+
+
+def _sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def _jitter(rng, value, spread):
+    return Decimal(str(round(value + rng.uniform(-spread, spread), 6)))
+
+
+def _spread_dates(model, instances, field, now, days, rng, batch_size):
+    """Backdate an auto_now_add field, which bulk_create always sets to now."""
+    for instance in instances:
+        setattr(instance, field, now - timedelta(seconds=rng.randrange(days * 86400)))
+    model.objects.bulk_update(instances, [field], batch_size=batch_size)
+
+
+def seed_users(count, prefix='seed', batch_size=1000):
+    """Make sure `count` seeded users exist and return their ids."""
+    password = make_password(None)  # unusable
+    usernames = [f'{prefix}-{n}@example.com' for n in range(count)]
+    User.objects.bulk_create(
+        [User(username=username, email=username, first_name='Seed', last_name=str(n), password=password)
+         for n, username in enumerate(usernames)],
+        batch_size=batch_size, ignore_conflicts=True,
+    )
+    return list(User.objects.filter(username__in=usernames).order_by('pk').values_list('pk', flat=True))
+
+
+def seed_catalog(itineraries, days=4, stops_per_day=6, reviews_per_itinerary=8, photos_per_itinerary=2,
+                 users=200, published_ratio=0.9, spread_days=365, prefix='seed', seed=0, batch_size=1000,
+                 progress=None):
+    """
+    Generate `itineraries` itineraries. `days`, `stops_per_day`,
+    `reviews_per_itinerary` and `photos_per_itinerary` are averages; the
+    actual numbers vary per itinerary. Creation dates are spread over the last
+    `spread_days` days (0 keeps them at now). `progress(counts)` is called
+    after each committed chunk. Returns the SeedCounts created.
+    """
+    rng = random.Random(seed)
+    user_ids = seed_users(users, prefix=prefix, batch_size=batch_size)
+    counts = SeedCounts(users=len(user_ids))
+    # Keep chunks small enough that their days and stops fit comfortably in memory
+    chunk_size = max(1, min(batch_size, 200_000 // max(1, days * stops_per_day)))
+    for start in range(0, itineraries, chunk_size):
+        with transaction.atomic():
+            _seed_chunk(rng, min(chunk_size, itineraries - start), user_ids, counts, days, stops_per_day,
+                        reviews_per_itinerary, photos_per_itinerary, published_ratio, spread_days, batch_size)
+        if progress:
+            progress(counts)
+    return counts
+
+
+def _seed_chunk(rng, size, user_ids, counts, days, stops_per_day, reviews_per_itinerary, photos_per_itinerary,
+                published_ratio, spread_days, batch_size):
+    now = timezone.now()
+    places = []
+    itineraries = []
+    for _ in range(size):
+        city, country, latitude, longitude = place = rng.choice(DESTINATIONS)
+        duration = max(1, round(rng.gauss(days, days / 3)))
+        lat, lng = _jitter(rng, latitude, 0.02), _jitter(rng, longitude, 0.02)
+        places.append(place)
+        itineraries.append(Itinerary(
+            user_id=rng.choice(user_ids),
+            name=f'{city} {rng.choice(THEMES)}'[:100],
+            description=' '.join(_sentence(rng) for _ in range(rng.randint(2, 6))),
+            duration=duration,
+            destination=f'{city}, {country}',
+            latitude=lat,
+            longitude=lng,
+            geohash=geohash_for(lat, lng),
+            price=Decimal(rng.randrange(50, 5000)),
+            status='published' if rng.random() < published_ratio else 'draft',
+        ))
+    Itinerary.objects.bulk_create(itineraries, batch_size=batch_size)
+    if spread_days:
+        _spread_dates(Itinerary, itineraries, 'created_at', now, spread_days, rng, batch_size)
+
+    itinerary_days = [
+        ItineraryDay(itinerary=itinerary, day_number=number, title=f'Day {number}: {rng.choice(PLACES)}',
+                     description=_sentence(rng))
+        for itinerary in itineraries
+        for number in range(1, itinerary.duration + 1)
+    ]
+
+    centers = {itinerary.pk: place for itinerary, place in zip(itineraries, places)}
+    stops = []
+    for day in itinerary_days:
+        city, _, latitude, longitude = centers[day.itinerary_id]
+        day_stops = []
+        for order in range(max(0, round(rng.gauss(stops_per_day, stops_per_day / 3)))):
+            lat, lng = _jitter(rng, latitude, 0.05), _jitter(rng, longitude, 0.05)
+            day_stops.append(Stop(
+                itinerary_day=day, name=f'{city} {rng.choice(PLACES)}', description=_sentence(rng, 8),
+                stop_type=rng.choice(STOP_TYPES), location_name=f'{rng.choice(PLACES)}, {city}',
+                latitude=lat, longitude=lng, geohash=geohash_for(lat, lng), order=order,
+            ))
+        # The stops are known before the day is saved, so its route is stored with it
+        for field, value in routes.route_fields(day_stops).items():
+            setattr(day, field, value)
+        stops += day_stops
+    ItineraryDay.objects.bulk_create(itinerary_days, batch_size=batch_size)
+    Stop.objects.bulk_create(stops, batch_size=batch_size)
+
+    reviews = []
+    for itinerary in itineraries:
+        if itinerary.status != 'published':
+            continue
+        count = min(len(user_ids), max(0, round(rng.expovariate(1 / reviews_per_itinerary))
+                                       if reviews_per_itinerary else 0))
+        for user_id in rng.sample(user_ids, count):
+            reviews.append(Review(user_id=user_id, itinerary=itinerary, comment=_sentence(rng, 20),
+                                  rating=rng.choices(range(1, 6), RATING_WEIGHTS)[0]))
+    Review.objects.bulk_create(reviews, batch_size=batch_size)
+    if spread_days and reviews:
+        _spread_dates(Review, reviews, 'created_at', now, spread_days, rng, batch_size)
+
+    # Photos point at a placeholder name; there is no file behind them
+    photos = [
+        ItineraryPhoto(itinerary=itinerary, image=f'itineraries/photos/seed-{itinerary.pk}-{n}.jpg',
+                       caption=f'Photo {n + 1}')
+        for itinerary in itineraries
+        for n in range(rng.randint(0, 2 * photos_per_itinerary))
+    ]
+    ItineraryPhoto.objects.bulk_create(photos, batch_size=batch_size)
+
+    ids = [itinerary.pk for itinerary in itineraries]
+    ratings.rebuild_aggregates(ids, batch_size=batch_size)
+    fulltext.index_itineraries(ids)
+    response_cache.invalidate(summaries=ids)
+
+    counts.itineraries += len(itineraries)
+    counts.days += len(itinerary_days)
+    counts.stops += len(stops)
+    counts.reviews += len(reviews)
+    counts.photos += len(photos)
+
+
+def clear_catalog(prefix='seed'):
+    """Delete the seeded users and, by cascade, their itineraries and reviews."""
+    users = User.objects.filter(username__startswith=f'{prefix}-', username__endswith='@example.com')
+    # The delete signals reindex; batch them into one pass
+    with transaction.atomic(), fulltext.deferred_indexing():
+        deleted, _ = users.delete()
+    return deleted
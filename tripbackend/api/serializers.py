@@ -1,14 +1,20 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.conf import settings
 from django.contrib.auth.password_validation import validate_password
-from .models import Itinerary, ItineraryDay, ItineraryPhoto, Review, Stop
+from django.core.files.storage import default_storage
+from django.db import transaction
+from . import fulltext, images, routes
+from .bulk import apply_days_diff, create_days_and_stops, default_days, normalize_days
+from .metrics import TimedSerializerMixin
+from .models import DETAIL_RELATIONS, MAX_ID, Favorite, Itinerary, ItineraryDay, ItineraryPhoto, Review, Stop
+from .ratings import histogram
 import logging
-import json
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
-class UserRegistrationSerializer(serializers.ModelSerializer):
+class UserRegistrationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
     password2 = serializers.CharField(write_only=True, required=True)
 
@@ -37,42 +43,103 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
-class ItineraryPhotoSerializer(serializers.ModelSerializer):
+def _names(value):
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+class SparseFieldsetMixin:
+    """
+    Lets a request ask for less. `?fields=a,b` returns only those fields (and
+    `id`), and `?expand=` names relations from Meta.expandable to include;
+    once either parameter is given, relations not asked for are left out.
+    Without either the full representation is returned. Views read the
+    selection with requested_fields(), pass it as `fields=` and load only the
+    relations_for() it, so relations left out cost no queries either.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, query_params):
+        """Names of the fields selected by `fields` and `expand`, or None for all of them."""
+        fields, expand = _names(query_params.get('fields')), _names(query_params.get('expand'))
+        if fields is None and expand is None:
+            return None
+        known, expandable = set(cls.Meta.fields), set(cls.Meta.expandable)
+        errors = {}
+        if fields is not None and fields - known:
+            errors['fields'] = [f"Unknown fields: {', '.join(sorted(fields - known))}."]
+        if expand is not None and expand - expandable:
+            errors['expand'] = [f"Only {', '.join(cls.Meta.expandable)} can be expanded."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        selected = fields if fields is not None else known - expandable
+        return selected | (expand or set()) | {'id'}
+
+    @classmethod
+    def relations_for(cls, fields):
+        """The relations from Meta.expandable that are serialized for `fields`."""
+        return tuple(name for name in cls.Meta.expandable if fields is None or name in fields)
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of an image's resized copies; empty until api.images has made them."""
+
+    def to_representation(self, value):
+        return images.variant_urls(value, self.context.get('request'))
+
+class ItineraryPhotoSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = ItineraryPhoto
-        fields = ['id', 'image', 'caption', 'uploaded_at']
+        fields = ['id', 'image', 'image_variants', 'caption', 'uploaded_at']
 
-class StopSerializer(serializers.ModelSerializer):
+class StopSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Stop
         fields = ['id', 'name', 'description', 'stop_type', 'latitude', 'longitude', 'order', 'location_name']
         read_only_fields = ['id']
 
-class ItineraryDaySerializer(serializers.ModelSerializer):
+class ItineraryDaySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     stops = StopSerializer(many=True, required=False)
+    route = serializers.SerializerMethodField()
 
     class Meta:
         model = ItineraryDay
-        fields = ['id', 'day_number', 'title', 'description', 'stops']
+        fields = ['id', 'day_number', 'title', 'description', 'stops', 'route']
         read_only_fields = ['id']
+        extra_kwargs = {'description': {'required': False, 'allow_blank': True}}
 
-class ItinerarySerializer(serializers.ModelSerializer):
+    def get_route(self, obj):
+        # Distances and suggested order from api.routes; stale caches are recomputed, not saved, on read
+        return routes.route_for(obj)
+
+class ItinerarySerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     days = ItineraryDaySerializer(many=True, read_only=True)
     photos = ItineraryPhotoSerializer(many=True, required=False, read_only=True)
     user = serializers.SerializerMethodField(read_only=True)
     image = serializers.ImageField(required=False, allow_null=True)
+    image_variants = ImageVariantsField()
+    rating_histogram = serializers.SerializerMethodField()
 
     class Meta:
         model = Itinerary
         fields = [
             'id', 'user', 'name', 'description', 'duration', 'destination',
             'latitude', 'longitude',
-            'price', 'rating', 'status', 'created_at', 'updated_at',
+            'price', 'rating', 'review_count', 'rating_histogram', 'status', 'created_at', 'updated_at',
             'days',
             'photos',
-            'image'
+            'image',
+            'image_variants'
         ]
-        read_only_fields = ['user', 'rating', 'created_at', 'updated_at', 'id']
+        read_only_fields = ['user', 'rating', 'review_count', 'created_at', 'updated_at', 'id']
+        expandable = DETAIL_RELATIONS
 
     def get_user(self, obj):
         if obj.user:
@@ -84,6 +151,9 @@ class ItinerarySerializer(serializers.ModelSerializer):
             }
         return None
 
+    def get_rating_histogram(self, obj):
+        return histogram(obj)
+
     def save(self, **kwargs):
         user = kwargs.pop('user', None)
         days_data = kwargs.pop('days_data', None)
@@ -91,152 +161,144 @@ class ItinerarySerializer(serializers.ModelSerializer):
         if not self.instance and user:
             self.validated_data['user'] = user
             
-        self.context['days_data'] = days_data
+        if days_data is not None:
+            self.context['days_data'] = days_data
         
         return super().save(**kwargs)
 
-    def create(self, validated_data):
-        days_data = self.context.get('days_data', None)
-        logger.info(f"Creating itinerary with validated data: {validated_data}")
-        logger.info(f"Received Days data in create via context: {days_data}")
-        
-        itinerary = Itinerary.objects.create(**validated_data)
-        logger.info(f"Created itinerary with ID: {itinerary.id}")
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        days_data = self.context.get('days_data')
+        if days_data is not None:
+            attrs['days'] = self.validate_days_data(days_data, partial=self.instance is not None)
+        return attrs
+
+    def validate_days_data(self, days_data, partial=False, days_serializer=None):
+        """
+        Validate nested day/stop data sent alongside the itinerary fields.
 
+        With partial=True (edits) fields may be omitted so stored values are
+        kept, and each stop's `id` is passed through for apply_days_diff().
+        `days_serializer` is an unbound ItineraryDaySerializer(many=True) to
+        reuse across calls, which saves copying its fields for every itinerary
+        when validating many of them (see api.importer).
+        """
         try:
-            if days_data:
-                logger.info(f"Processing {len(days_data)} days for itinerary {itinerary.id}")
-                for day_data in days_data:
-                    stops_data = day_data.pop('stops', [])
-                    if isinstance(stops_data, str):
-                        try:
-                            stops_data = json.loads(stops_data)
-                            logger.info(f"Parsed stops_data from JSON string for day {day_data.get('day_number', 'N/A')}. Type: {type(stops_data)}, Content: {stops_data}")
-                        except Exception as e:
-                            logger.error(f"Error parsing stops data: {e}")
-                            stops_data = []
-                    else:
-                         logger.info(f"Received stops_data directly for day {day_data.get('day_number', 'N/A')}. Type: {type(stops_data)}, Content: {stops_data}")
-
-                    logger.info(f"Creating day with data: {day_data}")
-                    day_instance = ItineraryDay.objects.create(itinerary=itinerary, **day_data)
-                    logger.info(f"Created day with ID: {day_instance.id}")
-
-                    if stops_data: 
-                        for stop_data in stops_data:
-                            logger.info(f"Attempting to create stop with data: {stop_data}")
-                            if 'location_name' not in stop_data and 'address' in stop_data:
-                                stop_data['location_name'] = stop_data.pop('address')
-                            elif 'location_name' not in stop_data:
-                                lat = stop_data.get('latitude', '0')
-                                lng = stop_data.get('longitude', '0')
-                                stop_data['location_name'] = f"Location: {lat}, {lng}"
-                            logger.info(f"Final stop data before creation: {stop_data}")
-                            Stop.objects.create(itinerary_day=day_instance, **stop_data)
-                            logger.info(f"Successfully created stop for day {day_instance.id}")
-                    else:
-                         logger.info(f"No stops data found or processed for day {day_instance.id}")
-                         
-            elif 'duration' in validated_data:
-                logger.info(f"No days data provided, creating default days based on duration: {validated_data['duration']}")
-                for day_number in range(1, validated_data['duration'] + 1):
-                    ItineraryDay.objects.create(itinerary=itinerary, day_number=day_number, title=f"Day {day_number}", description="")
-                    logger.info(f"Created default day {day_number}")
-            else:
-                 logger.info("No days data provided and no duration found.")
-                 
-        except Exception as e:
-            logger.exception(f"Error creating related objects: {str(e)}")
-            raise
-            
+            days_data = normalize_days(days_data)
+        except ValueError as e:
+            raise serializers.ValidationError({'days': [str(e)]})
+        if partial and any(day.get('day_number') in (None, '') for day in days_data):
+            raise serializers.ValidationError({'days': ["Each day needs a day_number."]})
+        if days_serializer is None:
+            days_serializer = ItineraryDaySerializer(many=True, partial=partial)
+        try:
+            validated_days = days_serializer.run_validation(days_data)
+        except serializers.ValidationError as e:
+            raise serializers.ValidationError({'days': e.detail})
+        day_numbers = [day['day_number'] for day in validated_days]
+        if len(day_numbers) != len(set(day_numbers)):
+            raise serializers.ValidationError({'days': ["Day numbers must be unique."]})
+        if partial:
+            # StopSerializer treats `id` as read-only; keep it to match stored stops
+            for raw_day, day in zip(days_data, validated_days):
+                for raw_stop, stop in zip(raw_day.get('stops', ()), day.get('stops', ())):
+                    if raw_stop.get('id') is not None:
+                        stop['id'] = raw_stop['id']
+        return validated_days
+
+    def create(self, validated_data):
+        # No days, or an empty list, gets `duration` blank days to fill in
+        days = validated_data.pop('days', None)
+        if not days:
+            days = default_days(validated_data.get('duration', 0))
+
+        with transaction.atomic(), fulltext.deferred_indexing():
+            itinerary = Itinerary.objects.create(**validated_data)
+            created_days, created_stops = create_days_and_stops([(itinerary, days)])
+            fulltext.index_itineraries([itinerary.id])
+
+        logger.info("Created itinerary %s with %d days and %d stops",
+                    itinerary.id, len(created_days), len(created_stops))
         return itinerary
 
     def update(self, instance, validated_data):
-        days_data = self.context.get('days_data', None)
-        logger.info(f"Serializer.update called for itinerary {instance.id} with days_data: {days_data}")
-        logger.info(f"Serializer.update validated_data: {validated_data}")
-        logger.info(f"Updating itinerary {instance.id} with validated data: {validated_data}")
-        logger.info(f"Received Days data in update via context: {days_data}")
-        
-        instance = super().update(instance, validated_data)
-        
-        if days_data is not None: 
-            logger.info(f"Processing {len(days_data)} days for itinerary update {instance.id}")
-            
-            for day_data in days_data:
-                stops_data = day_data.pop('stops', [])
-                if isinstance(stops_data, str):
-                    try:
-                        stops_data = json.loads(stops_data)
-                        logger.info(f"Parsed stops_data from JSON string for day {day_data.get('day_number', 'N/A')} update. Type: {type(stops_data)}, Content: {stops_data}")
-                    except Exception as e:
-                        logger.error(f"Error parsing stops data for update: {e}")
-                        stops_data = []
-                else:
-                    logger.info(f"Received stops_data directly for day {day_data.get('day_number', 'N/A')} update. Type: {type(stops_data)}, Content: {stops_data}")
-                
-                day_number = day_data.get('day_number')
-                day_instance = instance.days.filter(day_number=day_number).first()
-                
-                if day_instance:
-                    logger.info(f"Updating existing day {day_instance.id} with data: {day_data}")
-                    for attr, value in day_data.items():
-                        setattr(day_instance, attr, value)
-                    day_instance.save()
-                else:
-                    logger.info(f"Creating new day {day_number} during update with data: {day_data}")
-                    day_instance = ItineraryDay.objects.create(itinerary=instance, **day_data)
-
-                if stops_data:
-                    logger.info(f"Processing {len(stops_data)} stops for updated/new day {day_instance.id}")
-                    for stop_data in stops_data:
-                        logger.info(f"Attempting to create/update stop with data: {stop_data}")
-                        if 'location_name' not in stop_data and 'address' in stop_data:
-                             stop_data['location_name'] = stop_data.pop('address')
-                        elif 'location_name' not in stop_data:
-                             lat = stop_data.get('latitude', '0')
-                             lng = stop_data.get('longitude', '0')
-                             stop_data['location_name'] = f"Location: {lat}, {lng}"
-                            
-                        stop_id = stop_data.pop('id', None)
-                        logger.info(f"Final stop data before update/creation: {stop_data}, ID: {stop_id}")
-                        
-                        if stop_id:
-                            stop_instance = day_instance.stops.filter(id=stop_id).first()
-                            if stop_instance:
-                                logger.info(f"Updating existing stop {stop_id}")
-                                for attr, value in stop_data.items():
-                                    setattr(stop_instance, attr, value)
-                                stop_instance.save()
-                                logger.info(f"Successfully updated stop {stop_id}")
-                            else:
-                                logger.warning(f"Stop with ID {stop_id} not found for day {day_instance.id}. Creating new stop instead.")
-                                Stop.objects.create(itinerary_day=day_instance, **stop_data)
-                                logger.info(f"Successfully created new stop after failing to find ID {stop_id}")
-                        else:
-                            logger.info("No stop ID provided, creating new stop.")
-                            Stop.objects.create(itinerary_day=day_instance, **stop_data)
-                            logger.info(f"Successfully created new stop for day {day_instance.id}")
-                else:
-                    logger.info(f"No stops data found or processed for updated/new day {day_instance.id}")
-        else:
-            logger.info("No days data provided for update.")
-            
-        try:
-            pass
-        except Exception as e:
-            logger.exception(f"Error during final update steps: {str(e)}")
-            raise
-            
+        days = validated_data.pop('days', None)
+
+        with transaction.atomic(), fulltext.deferred_indexing():
+            instance = super().update(instance, validated_data)
+            if days is not None:
+                try:
+                    diff = apply_days_diff(instance, days)
+                except ValueError as e:
+                    raise serializers.ValidationError({'days': [str(e)]})
+                fulltext.index_itineraries([instance.id])
+                logger.info("Updated itinerary %s days: %s", instance.id, diff)
+
         return instance
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ItinerarySummarySerializer(TimedSerializerMixin, serializers.Serializer):
+    """
+    Read-only card representation of an itinerary, built from the dicts
+    produced by ItineraryQuerySet.summaries(). Use ItinerarySerializer for
+    the full nested document.
+    """
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    description = serializers.CharField(source='short_description')
+    destination = serializers.CharField()
+    duration = serializers.IntegerField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    rating = serializers.DecimalField(max_digits=3, decimal_places=1)
+    review_count = serializers.IntegerField()
+    status = serializers.CharField()
+    image = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
+    created_at = serializers.DateTimeField()
+    user = serializers.SerializerMethodField()
+
+    def get_image(self, row):
+        if not row['image']:
+            return None
+        return default_storage.url(row['image'])
+
+    def get_user(self, row):
+        if row['user_id'] is None:
+            return None
+        return {
+            'username': row['user__username'],
+            'id': row['user_id'],
+            'first_name': row['user__first_name'],
+            'last_name': row['user__last_name']
+        }
+
+class NearbyItinerarySerializer(ItinerarySummarySerializer):
+    distance_km = serializers.FloatField()
+
+class SimilarItinerarySerializer(ItinerarySummarySerializer):
+    similarity = serializers.FloatField()
+
+class FavoriteItinerarySerializer(ItinerarySummarySerializer):
+    favorited_at = serializers.DateTimeField()
+
+class FavoriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Favorite
+        fields = ['itinerary', 'created_at']
+        read_only_fields = fields
+
+class FavoriteImportSerializer(serializers.Serializer):
+    """Ids of itineraries to save as favorites, oldest favorite first."""
+    itineraries = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=MAX_ID), max_length=settings.FAVORITES_IMPORT_MAX)
+
+class ReviewSerializer(SparseFieldsetMixin, TimedSerializerMixin, serializers.ModelSerializer):
     user = serializers.SerializerMethodField()
 
     class Meta:
         model = Review
         fields = ['id', 'user', 'rating', 'comment', 'created_at', 'updated_at']
         read_only_fields = ['user', 'created_at', 'updated_at', 'id']
+        expandable = ('user',)
 
     def get_user(self, obj):
         return {
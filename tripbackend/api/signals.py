@@ -0,0 +1,157 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import fulltext, images, leaderboards, ratings, response_cache, similar
+from .models import Itinerary, ItineraryDay, ItineraryPhoto, Review, Stop
+
+
+def _deleting_itinerary(kwargs):
+    """
+    Whether a post_delete comes from the rows cascading from an itinerary
+    deletion. The itinerary's own receivers unindex it and invalidate
+    everything it showed in, so per-row work would only be thrown away.
+    """
+    origin = kwargs.get('origin')
+    return isinstance(origin, Itinerary) or (isinstance(origin, QuerySet) and origin.model is Itinerary)
+
+
+@receiver(post_save, sender=Itinerary)
+def index_saved_itinerary(sender, instance, **kwargs):
+    fulltext.index_itineraries([instance.pk])
+
+
+@receiver(post_delete, sender=Itinerary)
+def unindex_deleted_itinerary(sender, instance, **kwargs):
+    fulltext.remove_itineraries([instance.pk])
+
+
+@receiver(post_save, sender=ItineraryDay)
+@receiver(post_delete, sender=ItineraryDay)
+def reindex_day_itinerary(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    fulltext.index_itineraries([instance.itinerary_id])
+
+
+@receiver(post_save, sender=Stop)
+@receiver(post_delete, sender=Stop)
+def reindex_stop_itinerary(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    fulltext.index_days([instance.itinerary_day_id])
+
+
+@receiver(post_save, sender=Review)
+def update_rating_aggregates_on_save(sender, instance, created, **kwargs):
+    if created:
+        ratings.apply_review_change(instance.itinerary_id, new_rating=instance.rating)
+    elif hasattr(instance, '_loaded_rating'):
+        ratings.apply_review_change(instance.itinerary_id, instance._loaded_rating, instance.rating)
+    else:
+        # Saved without being loaded from the database: the old rating is unknown
+        ratings.rebuild_aggregates([instance.itinerary_id])
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_aggregates_on_delete(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    old_rating = getattr(instance, '_loaded_rating', instance.rating)
+    ratings.apply_review_change(instance.itinerary_id, old_rating=old_rating)
+
+
+# Response cache. Days, stops and photos only appear in an itinerary's detail;
+# itinerary fields and reviews (through the rating) also show on list cards.
+
+@receiver(post_save, sender=Itinerary)
+@receiver(post_delete, sender=Itinerary)
+def invalidate_itinerary_responses(sender, instance, **kwargs):
+    response_cache.invalidate(summaries=[instance.pk], creators=[instance.user_id] if instance.user_id else [])
+
+
+@receiver(post_save, sender=ItineraryDay)
+@receiver(post_delete, sender=ItineraryDay)
+@receiver(post_save, sender=ItineraryPhoto)
+@receiver(post_delete, sender=ItineraryPhoto)
+def invalidate_detail_responses(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    response_cache.invalidate(itineraries=[instance.itinerary_id])
+
+
+@receiver(post_save, sender=Stop)
+@receiver(post_delete, sender=Stop)
+def invalidate_stop_responses(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    response_cache.invalidate(days=[instance.itinerary_day_id])
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_responses(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    response_cache.invalidate(summaries=[instance.itinerary_id])
+
+
+@receiver(post_save, sender=Itinerary)
+@receiver(post_save, sender=ItineraryPhoto)
+def generate_image_variants(sender, instance, **kwargs):
+    images.schedule([instance])
+
+
+@receiver(post_delete, sender=Itinerary)
+@receiver(post_delete, sender=ItineraryPhoto)
+def delete_image_variants(sender, instance, **kwargs):
+    variants = instance.image_variants
+    if variants:
+        transaction.on_commit(lambda: images.delete_variants(variants))
+
+
+# Similarity index. Itinerary saves are picked up through updated_at; day and
+# stop changes and deletions leave no trace there, so they are signalled.
+
+@receiver(post_delete, sender=Itinerary)
+def forget_similar_itinerary(sender, instance, **kwargs):
+    similar.mark_changed(itineraries=[instance.pk])
+
+
+@receiver(post_save, sender=ItineraryDay)
+@receiver(post_delete, sender=ItineraryDay)
+def update_similar_day_itinerary(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    similar.mark_changed(itineraries=[instance.itinerary_id])
+
+
+@receiver(post_save, sender=Stop)
+@receiver(post_delete, sender=Stop)
+def update_similar_stop_itinerary(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    similar.mark_changed(days=[instance.itinerary_day_id])
+
+
+# Leaderboards store the card data of their itineraries; keep it current.
+# Deleting an itinerary deletes its entries with it.
+
+@receiver(post_save, sender=Itinerary)
+def refresh_itinerary_leaderboard_entries(sender, instance, **kwargs):
+    leaderboards.schedule_refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Itinerary)
+def invalidate_leaderboards(sender, instance, **kwargs):
+    leaderboards.invalidate()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_reviewed_leaderboard_entries(sender, instance, **kwargs):
+    if _deleting_itinerary(kwargs):
+        return
+    leaderboards.schedule_refresh([instance.itinerary_id])
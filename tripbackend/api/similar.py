@@ -0,0 +1,282 @@
+"""
+Content-based "similar itineraries" index.
+
+Each published itinerary becomes a TF-IDF vector over hashed features: words
+of its name, description and stop names, its stop types, destination,
+duration and price band. Features are hashed with a sign bit into
+SIMILAR_INDEX_DIMENSIONS columns (the hashing trick), so there is no
+vocabulary to keep and a row has a fixed size. Rows are L2-normalized and kept
+in one float32 NumPy matrix per process; the neighbours of an itinerary are
+found with a single matrix-vector product and a partial sort.
+
+The index is built on first use and then kept up to date incrementally:
+before answering, rows of itineraries whose updated_at moved since the last
+sync are recomputed (with a small overlap for transactions that committed
+late), and day or stop changes signalled in this process mark their
+itinerary for recomputation. Rows of itineraries that were deleted elsewhere
+are dropped when a query finds them gone. IDF weights are fixed at build time;
+the index is rebuilt from scratch once enough rows have changed since.
+"""
+import math
+import re
+import threading
+import zlib
+from datetime import timedelta
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import response_cache
+from .models import Itinerary, ItineraryDay, Stop
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+CHUNK_SIZE = 2000
+# Rows whose updated_at falls this far before the last sync are checked again
+SYNC_OVERLAP = timedelta(seconds=60)
+# Rebuild (and refresh the IDF weights) after this share of rows changed
+REBUILD_FRACTION = 0.2
+REBUILD_MIN_CHANGES = 1000
+
+TOKEN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    'and the for with from into over this that are was were you your our their its all any but not '
+    'day days trip tour visit'.split()
+)
+FIELD_WEIGHTS = {
+    'name': 2.0,
+    'description': 1.0,
+    'stop': 1.0,
+    'stop_type': 0.5,
+    'destination': 3.0,
+    'duration': 2.0,
+    'price': 2.0,
+}
+
+
+def _words(text):
+    return [word for word in TOKEN.findall((text or '').lower()) if len(word) > 2 and word not in STOPWORDS]
+
+
+def features(itinerary, stops):
+    """
+    Weighted features of an itinerary dict (name, description, destination,
+    duration, price) and its (stop name, stop type) pairs, as {feature: weight}.
+    """
+    weights = {}
+
+    def add(feature, weight):
+        weights[feature] = weights.get(feature, 0.0) + weight
+
+    for field in ('name', 'description'):
+        for word in _words(itinerary[field]):
+            add(f'w:{word}', FIELD_WEIGHTS[field])
+    for word in _words(itinerary['destination']):
+        add(f'd:{word}', FIELD_WEIGHTS['destination'])
+    for name, stop_type in stops:
+        for word in _words(name):
+            add(f'w:{word}', FIELD_WEIGHTS['stop'])
+        add(f't:{stop_type}', FIELD_WEIGHTS['stop_type'])
+    # Trips of a similar length and budget share a band
+    add(f'n:{min(itinerary["duration"] or 0, 14)}', FIELD_WEIGHTS['duration'])
+    add(f'p:{int(math.log2(1 + float(itinerary["price"] or 0)))}', FIELD_WEIGHTS['price'])
+    return weights
+
+
+@lru_cache(maxsize=65536)
+def _slot(feature, dimensions):
+    digest = zlib.crc32(feature.encode('utf-8'))
+    return digest % dimensions, 1.0 if digest & 0x80000000 else -1.0
+
+
+def term_frequencies(weights, dimensions):
+    """Hashed, sublinearly scaled term frequencies of a feature dict, as a dense vector."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, weight in weights.items():
+        column, sign = _slot(feature, dimensions)
+        vector[column] += sign * math.log1p(weight)
+    return vector
+
+
+def _load(ids):
+    """Yield (id, updated_at, features) of the published itineraries among `ids`."""
+    itineraries = Itinerary.objects.published().filter(pk__in=ids).values(
+        'id', 'name', 'description', 'destination', 'duration', 'price', 'updated_at')
+    stops = {}
+    for itinerary_id, name, stop_type in Stop.objects.filter(
+            itinerary_day__itinerary__in=ids, itinerary_day__itinerary__status='published').values_list(
+            'itinerary_day__itinerary_id', 'name', 'stop_type'):
+        stops.setdefault(itinerary_id, []).append((name, stop_type))
+    for itinerary in itineraries:
+        yield itinerary['id'], itinerary['updated_at'], features(itinerary, stops.get(itinerary['id'], ()))
+
+
+class SimilarityIndex:
+    def __init__(self, dimensions=None):
+        self.dimensions = dimensions or settings.SIMILAR_INDEX_DIMENSIONS
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.vectors = np.zeros((0, self.dimensions), dtype=np.float32)
+            self.ids = np.zeros(0, dtype=np.int64)
+            self.size = 0
+            self.rows = {}  # itinerary id -> row
+            self.versions = {}  # itinerary id -> updated_at of its row
+            self.idf = np.ones(self.dimensions, dtype=np.float32)
+            self.built = False
+            self.synced_at = None
+            self.changes = 0
+            self._changed_itineraries = set()
+            self._changed_days = set()
+
+    def _reserve(self, count):
+        if count <= len(self.vectors):
+            return
+        capacity = max(count, 2 * len(self.vectors), 64)
+        vectors = np.zeros((capacity, self.dimensions), dtype=np.float32)
+        vectors[:self.size] = self.vectors[:self.size]
+        ids = np.zeros(capacity, dtype=np.int64)
+        ids[:self.size] = self.ids[:self.size]
+        self.vectors, self.ids = vectors, ids
+
+    def _weighted(self, frequencies):
+        vector = frequencies * self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _put(self, itinerary_id, updated_at, vector):
+        row = self.rows.get(itinerary_id)
+        if row is None:
+            self._reserve(self.size + 1)
+            row = self.rows[itinerary_id] = self.size
+            self.ids[row] = itinerary_id
+            self.size += 1
+        self.vectors[row] = vector
+        self.versions[itinerary_id] = updated_at
+
+    def _remove(self, itinerary_id):
+        row = self.rows.pop(itinerary_id, None)
+        self.versions.pop(itinerary_id, None)
+        if row is None:
+            return
+        # Move the last row into the gap
+        last = self.size - 1
+        if row != last:
+            moved = int(self.ids[last])
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+        self.size = last
+
+    def build(self):
+        """Index every published itinerary from scratch, computing fresh IDF weights."""
+        with self._lock:
+            synced_at = timezone.now()
+            ids = list(Itinerary.objects.published().order_by('pk').values_list('pk', flat=True))
+            frequencies = np.zeros((len(ids), self.dimensions), dtype=np.float32)
+            versions, order = [], []
+            for start in range(0, len(ids), CHUNK_SIZE):
+                for itinerary_id, updated_at, weights in _load(ids[start:start + CHUNK_SIZE]):
+                    frequencies[len(order)] = term_frequencies(weights, self.dimensions)
+                    order.append(itinerary_id)
+                    versions.append(updated_at)
+            frequencies = frequencies[:len(order)]
+
+            document_frequency = np.count_nonzero(frequencies, axis=0)
+            self.idf = (np.log((1 + len(order)) / (1 + document_frequency)) + 1).astype(np.float32)
+            frequencies *= self.idf
+            norms = np.linalg.norm(frequencies, axis=1, keepdims=True)
+            np.divide(frequencies, norms, out=frequencies, where=norms > 0)
+
+            self.vectors, self.ids, self.size = frequencies, np.array(order, dtype=np.int64), len(order)
+            self.rows = {itinerary_id: row for row, itinerary_id in enumerate(order)}
+            self.versions = dict(zip(order, versions))
+            self.built, self.synced_at, self.changes = True, synced_at, 0
+
+    def update(self, itinerary_ids):
+        """Recompute the rows of the given itineraries, dropping those no longer published."""
+        itinerary_ids = list(itinerary_ids)
+        with self._lock:
+            seen = set()
+            for start in range(0, len(itinerary_ids), CHUNK_SIZE):
+                for itinerary_id, updated_at, weights in _load(itinerary_ids[start:start + CHUNK_SIZE]):
+                    self._put(itinerary_id, updated_at, self._weighted(term_frequencies(weights, self.dimensions)))
+                    seen.add(itinerary_id)
+            removed = {itinerary_id for itinerary_id in set(itinerary_ids) - seen if itinerary_id in self.rows}
+            for itinerary_id in removed:
+                self._remove(itinerary_id)
+            self.changes += len(seen) + len(removed)
+
+    def discard(self, itinerary_ids):
+        with self._lock:
+            for itinerary_id in itinerary_ids:
+                self._remove(itinerary_id)
+
+    def mark_changed(self, itineraries=(), days=()):
+        """Recompute these itineraries (or those of these days) before the next query."""
+        with self._lock:
+            self._changed_itineraries.update(itineraries)
+            self._changed_days.update(days)
+
+    def sync(self):
+        """Build the index if needed, else apply the changes since the last sync."""
+        with self._lock:
+            if not self.built or self.changes > max(REBUILD_MIN_CHANGES, REBUILD_FRACTION * self.size):
+                self.build()
+                self._changed_itineraries, self._changed_days = set(), set()
+                return
+            synced_at = timezone.now()
+            changed, self._changed_itineraries = self._changed_itineraries, set()
+            days, self._changed_days = self._changed_days, set()
+            if days:
+                changed.update(ItineraryDay.objects.filter(pk__in=days).values_list('itinerary_id', flat=True))
+            # Drafts are never indexed: only the ones still to drop (just unpublished) count
+            changed.update(
+                itinerary_id for itinerary_id, updated_at, status in Itinerary.objects.filter(
+                    updated_at__gte=self.synced_at - SYNC_OVERLAP).values_list('pk', 'updated_at', 'status')
+                if (self.versions.get(itinerary_id) != updated_at if status == 'published'
+                    else itinerary_id in self.rows)
+            )
+            self.synced_at = synced_at
+            if changed:
+                self.update(changed)
+
+    def similar(self, itinerary_id, limit=DEFAULT_LIMIT):
+        """
+        [(id, cosine similarity)] of the `limit` itineraries most similar to
+        `itinerary_id`, best first, or None if it is not a published itinerary.
+        """
+        with self._lock:
+            self.sync()
+            row = self.rows.get(itinerary_id)
+            if row is None:
+                return None
+            scores = self.vectors[:self.size] @ self.vectors[row]
+            scores[row] = -np.inf
+            count = min(limit, self.size - 1)
+            if count <= 0:
+                return []
+            top = np.argpartition(-scores, count - 1)[:count]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(int(self.ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+
+index = SimilarityIndex()
+
+
+def mark_changed(itineraries=(), days=()):
+    """Schedule recomputation of these itineraries' rows for when the current transaction commits."""
+    itineraries, days = list(itineraries), list(days)
+
+    def apply():
+        index.mark_changed(itineraries, days)
+        # Day and stop edits only touch their own itinerary's response scope,
+        # but can move it in or out of any other itinerary's neighbours
+        response_cache.bump_versions([response_cache.version_key(response_cache.SIMILAR)])
+
+    transaction.on_commit(apply)
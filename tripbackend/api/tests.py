@@ -1,3 +1,1814 @@
-from django.test import TestCase
-
-# Create your tests here.
+import asyncio
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .geo import bounding_box, covering_cells, encode_geohash, haversine_km
+from . import benchmarks, export, images, importer, leaderboards, loadtest, metrics, routes, seed, similar
+from .log import JsonFormatter, QueueFileHandler, RedactingFilter, SamplingFilter
+from .models import Favorite, Itinerary, ItineraryDay, ItineraryPhoto, Leaderboard, LeaderboardEntry, Review, Stop, Upload
+
+
+class ItinerarySearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com')
+        self.cheap = self._itinerary('Paris on a budget', 'Paris, France', 3, '300', rating='4.5')
+        self.mid = self._itinerary('Paris classics', 'Paris, France', 5, '800', rating='3.0')
+        self.luxury = self._itinerary('Tokyo deluxe', 'Tokyo, Japan', 10, '2500', rating='5.0')
+        self._itinerary('Paris draft', 'Paris, France', 3, '300', status='draft')
+
+    def _itinerary(self, name, destination, duration, price, rating='0', status='published'):
+        return Itinerary.objects.create(
+            user=self.user, name=name, description='', destination=destination,
+            duration=duration, price=Decimal(price), rating=Decimal(rating), status=status,
+        )
+
+    def _search(self, **params):
+        response = self.client.get('/api/itineraries/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_filters_by_destination_duration_and_price(self):
+        data = self._search(destination='paris', max_duration=4)
+        self.assertEqual([item['id'] for item in data['results']], [self.cheap.id])
+
+        data = self._search(price='$$,$$$', sort='price_asc')
+        self.assertEqual([item['id'] for item in data['results']], [self.mid.id, self.luxury.id])
+
+    def test_sorts_by_rating_and_excludes_drafts(self):
+        data = self._search(sort='rating')
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(
+            [item['id'] for item in data['results']],
+            [self.luxury.id, self.cheap.id, self.mid.id],
+        )
+
+    def test_page_size_is_bounded(self):
+        data = self._search(page_size=1)
+        self.assertEqual(len(data['results']), 1)
+        self.assertIsNotNone(data['next'])
+
+    def test_rejects_malformed_parameters(self):
+        for params in ({'price': '$$$$'}, {'min_duration': 'two'}, {'sort': 'random'}):
+            response = self.client.get('/api/itineraries/search/', params)
+            self.assertEqual(response.status_code, 400)
+
+
+class ItineraryQueryCountTests(TestCase):
+    """
+    Each endpoint must cost the same number of queries however many
+    itineraries, days, stops, photos and reviews it returns.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com')
+        self.client.force_authenticate(self.user)
+        self.first = self._add_itinerary()
+
+    def _add_itinerary(self, days=2, stops_per_day=3):
+        itinerary = Itinerary.objects.create(
+            user=self.user, name='Trip', description='', destination='Rome, Italy',
+            duration=days, price=Decimal('700'), status='published',
+        )
+        for day_number in range(1, days + 1):
+            day = ItineraryDay.objects.create(
+                itinerary=itinerary, day_number=day_number, title=f'Day {day_number}', description='',
+            )
+            for order in range(stops_per_day):
+                Stop.objects.create(
+                    itinerary_day=day, name=f'Stop {order}', latitude=Decimal('41.9'),
+                    longitude=Decimal('12.5'), order=order,
+                )
+        ItineraryPhoto.objects.create(itinerary=itinerary, image='itineraries/photos/photo.jpg')
+        self._add_review(itinerary)
+        return itinerary
+
+    def _add_review(self, itinerary):
+        reviewer = User.objects.create(username=f'reviewer{User.objects.count()}@example.com')
+        Review.objects.create(user=reviewer, itinerary=itinerary, rating=4, comment='Great')
+
+    def _assert_constant_queries(self, url, expected):
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for _ in range(3):
+            self._add_itinerary(days=3, stops_per_day=4)
+            self._add_review(self.first)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_itinerary_list(self):
+        self._assert_constant_queries('/api/itineraries/', 1)
+
+    def test_itinerary_search(self):
+        self._assert_constant_queries('/api/itineraries/search/', 2)
+
+    def test_itineraries_by_creator(self):
+        self._assert_constant_queries(f'/api/itineraries/creator/{self.user.id}/', 2)
+
+    def test_user_itineraries(self):
+        self._assert_constant_queries('/api/user/itineraries/', 1)
+
+    # Detail and review views run one extra query for their ETag (api.conditional)
+    def test_public_itinerary_detail(self):
+        self._assert_constant_queries(f'/api/itineraries/{self.first.id}/', 5)
+
+    def test_itinerary_detail(self):
+        self._assert_constant_queries(f'/api/user/itineraries/{self.first.id}/', 5)
+
+    def test_itinerary_reviews(self):
+        self._assert_constant_queries(f'/api/itineraries/{self.first.id}/reviews/', 3)
+
+    def test_itinerary_delete(self):
+        # Cascaded days, stops, photos and reviews leave the search index, the
+        # response cache and the rating aggregates to the itinerary's own receivers
+        large = self._add_itinerary(days=10, stops_per_day=10)
+        for itinerary in (self.first, large):
+            with self.assertNumQueries(16):
+                response = self.client.delete(f'/api/user/itineraries/{itinerary.id}/')
+            self.assertEqual(response.status_code, 204)
+
+    def test_itinerary_batch(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/itineraries/batch/?ids={self.first.id}')
+        self.assertEqual(len(response.json()['results']), 1)
+        ids = [self.first.id] + [self._add_itinerary(days=3, stops_per_day=4).id for _ in range(3)]
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/itineraries/batch/?ids={",".join(map(str, ids))}')
+        self.assertEqual([document['id'] for document in response.json()['results']], ids)
+
+
+class ItinerarySummaryTests(TestCase):
+    def test_list_returns_summary_cards(self):
+        user = User.objects.create(username='creator@example.com', first_name='Ada')
+        itinerary = Itinerary.objects.create(
+            user=user, name='Trip', description='x' * 1000, destination='Rome, Italy',
+            duration=2, price=Decimal('700'), status='published', image='itineraries/cover.jpg',
+        )
+        ItineraryDay.objects.create(itinerary=itinerary, day_number=1, title='Day 1', description='')
+
+        [card] = APIClient().get('/api/itineraries/').json()['results']
+        self.assertNotIn('days', card)
+        self.assertNotIn('photos', card)
+        self.assertEqual(card['image'], '/media/itineraries/cover.jpg')
+        self.assertEqual(card['price'], '700.00')
+        self.assertEqual(card['user']['first_name'], 'Ada')
+        self.assertEqual(len(card['description']), 300)
+
+
+class GeoSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create(username='creator@example.com')
+        self.paris = Itinerary.objects.create(
+            user=user, name='Paris', description='', destination='Paris, France', duration=1,
+            price=Decimal('100'), status='published', latitude=Decimal('48.856600'), longitude=Decimal('2.352200'),
+        )
+        # Centered far away, but with a stop in Versailles (~17 km from Paris)
+        self.road_trip = Itinerary.objects.create(
+            user=user, name='Road trip', description='', destination='France', duration=1,
+            price=Decimal('100'), status='published', latitude=Decimal('43.296500'), longitude=Decimal('5.369800'),
+        )
+        day = ItineraryDay.objects.create(itinerary=self.road_trip, day_number=1, title='Day 1', description='')
+        Stop.objects.create(itinerary_day=day, name='Versailles', latitude=Decimal('48.804900'),
+                            longitude=Decimal('2.120400'))
+        Itinerary.objects.create(
+            user=user, name='Tokyo', description='', destination='Tokyo, Japan', duration=1,
+            price=Decimal('100'), status='published', latitude=Decimal('35.676200'), longitude=Decimal('139.650300'),
+        )
+
+    def test_geohash_is_maintained_on_save(self):
+        self.paris.refresh_from_db()
+        self.assertEqual(self.paris.geohash, encode_geohash(48.8566, 2.3522))
+        self.assertTrue(self.paris.geohash.startswith('u09tv'))
+
+    def test_covering_cells_contain_points_in_box(self):
+        south, north, lng_ranges = bounding_box(48.8566, 2.3522, 30)
+        cells = covering_cells(south, north, lng_ranges)
+        self.assertLessEqual(len(cells), 32)
+        self.assertTrue(any(encode_geohash(48.8049, 2.1204).startswith(cell) for cell in cells))
+
+    def test_bounding_box_splits_at_antimeridian(self):
+        _, _, lng_ranges = bounding_box(0, 179.9, 50)
+        self.assertEqual(len(lng_ranges), 2)
+
+    def test_nearby_ranks_by_closest_center_or_stop(self):
+        response = self.client.get('/api/itineraries/nearby/', {'lat': 48.8566, 'lng': 2.3522, 'radius': 30})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        self.assertEqual([row['id'] for row in results], [self.paris.id, self.road_trip.id])
+        self.assertAlmostEqual(results[1]['distance_km'], haversine_km(48.8566, 2.3522, 48.8049, 2.1204), places=2)
+
+    def test_search_filters_and_sorts_by_distance(self):
+        response = self.client.get('/api/itineraries/search/', {'lat': 48.8049, 'lng': 2.1204, 'radius': 30,
+                                                                'sort': 'distance'})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.road_trip.id, self.paris.id])
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        user = User.objects.create(username='creator@example.com')
+        self.louvre = Itinerary.objects.create(
+            user=user, name='Museums of Paris', description='Art all day', destination='Paris, France',
+            duration=1, price=Decimal('100'), status='published',
+        )
+        self.food = Itinerary.objects.create(
+            user=user, name='Eating through Lyon', description='Bouchons and markets', destination='Lyon, France',
+            duration=1, price=Decimal('100'), status='published',
+        )
+        day = ItineraryDay.objects.create(itinerary=self.food, day_number=1, title='Market morning', description='')
+        self.stop = Stop.objects.create(itinerary_day=day, name='Les Halles Paul Bocuse', latitude=Decimal('45.76'),
+                                        longitude=Decimal('4.85'), location_name='102 Cours Lafayette')
+
+    def _search(self, q):
+        response = self.client.get('/api/itineraries/search/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()['results']]
+
+    def test_matches_itinerary_day_and_stop_text(self):
+        self.assertEqual(self._search('museum'), [self.louvre.id])
+        self.assertEqual(self._search('market'), [self.food.id])
+        self.assertEqual(self._search('lafayette'), [self.food.id])
+        self.assertEqual(self._search('france'), [self.louvre.id, self.food.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.stop.name = 'Fourviere basilica'
+        self.stop.save()
+        self.assertEqual(self._search('bocuse'), [])
+        self.assertEqual(self._search('fourviere'), [self.food.id])
+
+        self.food.delete()
+        self.assertEqual(self._search('france'), [self.louvre.id])
+
+    def test_ranks_name_matches_first(self):
+        Itinerary.objects.create(
+            user=self.louvre.user, name='Lyon weekend', description='', destination='Lyon, France',
+            duration=1, price=Decimal('100'), status='published',
+        )
+        self.assertEqual(self._search('lyon')[0], Itinerary.objects.get(name='Lyon weekend').id)
+
+    def test_punctuation_only_query_matches_nothing(self):
+        self.assertEqual(self._search('"*'), [])
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.itinerary = Itinerary.objects.create(
+            name='Trip', description='', destination='Rome, Italy', duration=1, price=Decimal('100'),
+            status='published',
+        )
+        self.alice = User.objects.create(username='alice@example.com')
+        self.bob = User.objects.create(username='bob@example.com')
+
+    def _post_review(self, user, rating):
+        self.client.force_authenticate(user)
+        response = self.client.post(f'/api/itineraries/{self.itinerary.id}/reviews/',
+                                    {'rating': rating, 'comment': 'ok'})
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def _assert_aggregates(self, rating, count, histogram):
+        self.itinerary.refresh_from_db()
+        self.assertEqual(self.itinerary.rating, Decimal(rating))
+        self.assertEqual(self.itinerary.review_count, count)
+        self.assertEqual(
+            [getattr(self.itinerary, f'rating_{star}_count') for star in range(1, 6)], histogram
+        )
+
+    def test_aggregates_follow_review_create_update_delete(self):
+        self._post_review(self.alice, 5)
+        bob_review = self._post_review(self.bob, 2)
+        self._assert_aggregates('3.5', 2, [0, 1, 0, 0, 1])
+
+        response = self.client.put(f'/api/reviews/{bob_review}/', {'rating': 4})
+        self.assertEqual(response.status_code, 200)
+        self._assert_aggregates('4.5', 2, [0, 0, 0, 1, 1])
+
+        response = self.client.delete(f'/api/reviews/{bob_review}/')
+        self.assertEqual(response.status_code, 204)
+        self._assert_aggregates('5.0', 1, [0, 0, 0, 0, 1])
+
+        self.alice.delete()
+        self._assert_aggregates('0.0', 0, [0, 0, 0, 0, 0])
+
+    def test_detail_exposes_histogram(self):
+        self._post_review(self.alice, 4)
+        data = self.client.get(f'/api/itineraries/{self.itinerary.id}/').json()
+        self.assertEqual(data['review_count'], 1)
+        self.assertEqual(data['rating_histogram'], {'1': 0, '2': 0, '3': 0, '4': 1, '5': 0})
+
+    def test_rebuild_command_recomputes_from_reviews(self):
+        Review.objects.bulk_create([
+            Review(user=self.alice, itinerary=self.itinerary, rating=3, comment=''),
+            Review(user=self.bob, itinerary=self.itinerary, rating=4, comment=''),
+        ])
+        self._assert_aggregates('0.0', 0, [0, 0, 0, 0, 0])
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self._assert_aggregates('3.5', 2, [0, 0, 1, 1, 0])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com')
+        self.itineraries = [self._create(f'Trip {i}') for i in range(5)]
+        # Share a timestamp so ordering must fall back to the id
+        Itinerary.objects.filter(pk__in=[i.pk for i in self.itineraries[1:3]]).update(
+            created_at=self.itineraries[1].created_at)
+
+    def _create(self, name):
+        return Itinerary.objects.create(
+            user=self.user, name=name, description='', destination='Rome', duration=1,
+            price=Decimal('100'), status='published',
+        )
+
+    def _ids(self, data):
+        return [row['id'] for row in data['results']]
+
+    def test_pages_forward_and_back_without_gaps(self):
+        expected = list(
+            Itinerary.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        first = self.client.get('/api/itineraries/', {'page_size': 2}).json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        third = self.client.get(second['next']).json()
+        self.assertIsNone(third['next'])
+        self.assertEqual(self._ids(first) + self._ids(second) + self._ids(third), expected)
+
+        back = self.client.get(third['previous']).json()
+        self.assertEqual(self._ids(back), self._ids(second))
+
+    def test_new_rows_do_not_shift_later_pages(self):
+        first = self.client.get('/api/itineraries/', {'page_size': 2}).json()
+        self._create('Brand new')
+        second = self.client.get(first['next']).json()
+        self.assertFalse(set(self._ids(first)) & set(self._ids(second)))
+
+    def test_deep_pages_cost_the_same_as_the_first(self):
+        first = self.client.get('/api/itineraries/', {'page_size': 1}).json()
+        with self.assertNumQueries(1):
+            self.client.get(first['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/itineraries/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ItineraryCreatedAtMigrationTests(TransactionTestCase):
+    def _migrate(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('api', name)])
+        return executor.loader.project_state([('api', name)]).apps
+
+    def test_null_created_at_is_backfilled_and_paged(self):
+        self.addCleanup(self._migrate, '0019_itinerary_created_at_not_null')
+        OldItinerary = self._migrate('0018_favorite').get_model('api', 'Itinerary')
+        for name in ('Old', 'Dated'):
+            OldItinerary.objects.create(name=name, description='', destination='Rome', duration=1,
+                                        price=Decimal('100'), status='published')
+        undated = OldItinerary.objects.get(name='Old')
+        OldItinerary.objects.filter(pk=undated.pk).update(created_at=None, updated_at=None)
+        with connection.cursor() as cursor:
+            # As written by 0011's backfill: NOW() with milliseconds
+            cursor.execute("UPDATE api_itinerary SET created_at = '2099-01-01 10:00:00.123' WHERE name = 'Dated'")
+
+        self._migrate('0019_itinerary_created_at_not_null')
+        self.assertIsNotNone(Itinerary.objects.get(pk=undated.pk).created_at)
+        first = self.client.get('/api/itineraries/', {'page_size': 1}).json()
+        second = self.client.get(first['next']).json()
+        dated = OldItinerary.objects.get(name='Dated')
+        self.assertEqual([row['id'] for row in first['results'] + second['results']], [dated.pk, undated.pk])
+        self.assertIsNone(second['next'])
+
+
+class ItineraryCreateTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com')
+        self.client.force_authenticate(self.user)
+
+    def _payload(self, days, stops_per_day, **overrides):
+        days_data = [
+            {
+                'day_number': day_number,
+                'title': f'Day {day_number}',
+                'description': '',
+                'stops': [
+                    {'name': f'Stop {order}', 'description': '', 'stop_type': 'food',
+                     'latitude': 41.90278349999, 'longitude': '12.4963655', 'address': 'Rome', 'order': order}
+                    for order in range(stops_per_day)
+                ],
+            }
+            for day_number in range(1, days + 1)
+        ]
+        payload = {
+            'name': 'Rome', 'description': 'Trip', 'duration': days, 'destination': 'Rome, Italy',
+            'price': '500', 'status': 'published', 'days': json.dumps(days_data),
+        }
+        payload.update(overrides)
+        return payload
+
+    def _create(self, payload):
+        return self.client.post('/api/user/itineraries/', payload, format='multipart')
+
+    def test_creates_days_and_stops(self):
+        response = self._create(self._payload(days=2, stops_per_day=3))
+        self.assertEqual(response.status_code, 201, response.content)
+        data = response.json()
+        self.assertEqual([day['day_number'] for day in data['days']], [1, 2])
+        stop = data['days'][0]['stops'][0]
+        self.assertEqual(stop['latitude'], '41.902783')
+        self.assertEqual(stop['location_name'], 'Rome')
+        self.assertEqual(Stop.objects.filter(itinerary_day__itinerary_id=data['id']).count(), 6)
+        self.assertTrue(Stop.objects.exclude(geohash='').exists())
+
+    def test_query_count_does_not_grow_with_days_and_stops(self):
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self._create(self._payload(days=1, stops_per_day=1)).status_code, 201)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self._create(self._payload(days=8, stops_per_day=6)).status_code, 201)
+        self.assertEqual(len(small), len(large))
+
+    def test_invalid_stop_rejects_whole_itinerary(self):
+        payload = self._payload(days=2, stops_per_day=2)
+        days = json.loads(payload['days'])
+        del days[1]['stops'][1]['latitude']
+        payload['days'] = json.dumps(days)
+        response = self._create(payload)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('days', response.json())
+        self.assertFalse(Itinerary.objects.exists())
+
+    def test_creates_default_days_without_day_plan(self):
+        payload = self._payload(days=3, stops_per_day=0)
+        del payload['days']
+        response = self._create(payload)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([day['title'] for day in response.json()['days']], ['Day 1', 'Day 2', 'Day 3'])
+
+    def test_creates_default_days_for_empty_day_plan(self):
+        payload = self._payload(days=2, stops_per_day=0)
+        payload['days'] = '[]'
+        response = self._create(payload)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([day['day_number'] for day in response.json()['days']], [1, 2])
+
+
+class ItineraryUpdateTests(TestCase):
+    setUp = ItineraryCreateTests.setUp
+    _payload = ItineraryCreateTests._payload
+    _create = ItineraryCreateTests._create
+
+    def _created(self, days, stops_per_day):
+        response = self._create(self._payload(days=days, stops_per_day=stops_per_day))
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def _update(self, itinerary_id, days, **fields):
+        payload = {'days_json': json.dumps(days), **fields}
+        return self.client.put(f'/api/user/itineraries/{itinerary_id}/', payload, format='multipart')
+
+    def test_updates_inserts_and_deletes_children(self):
+        data = self._created(days=3, stops_per_day=2)
+        day1, day2 = data['days'][0], data['days'][1]
+        kept, dropped = day1['stops']
+        days = [
+            {'day_number': 1, 'title': 'Arrival', 'stops': [
+                {'id': kept['id'], 'name': 'Colosseum', 'order': 1},
+                {'name': 'Trevi', 'latitude': '41.9009', 'longitude': '12.4833', 'order': 2},
+            ]},
+            # No stops key: the day's stops are kept as they are
+            {'day_number': 2, 'title': 'Day 2'},
+        ]
+        response = self._update(data['id'], days)
+        self.assertEqual(response.status_code, 200, response.content)
+
+        result = response.json()['days']
+        self.assertEqual([day['title'] for day in result], ['Arrival', 'Day 2'])
+        self.assertEqual([stop['name'] for stop in result[0]['stops']], ['Colosseum', 'Trevi'])
+        self.assertEqual(result[0]['stops'][0]['id'], kept['id'])
+        self.assertEqual(result[0]['stops'][0]['latitude'], kept['latitude'])
+        self.assertEqual(result[1]['stops'], day2['stops'])
+        self.assertFalse(Stop.objects.filter(pk=dropped['id']).exists())
+        self.assertFalse(ItineraryDay.objects.filter(itinerary_id=data['id'], day_number=3).exists())
+        self.assertEqual(Stop.objects.filter(itinerary_day__itinerary_id=data['id']).count(), 4)
+        self.assertNotEqual(Stop.objects.get(name='Trevi').geohash, '')
+
+    def test_stop_ids_from_other_itineraries_are_inserted(self):
+        other = self._created(days=1, stops_per_day=1)
+        data = self._created(days=1, stops_per_day=1)
+        foreign = other['days'][0]['stops'][0]
+        days = [{'day_number': 1, 'stops': [dict(foreign, name='Copied')]}]
+        self.assertEqual(self._update(data['id'], days).status_code, 200)
+        self.assertEqual(Stop.objects.get(pk=foreign['id']).name, 'Stop 0')
+        self.assertEqual(Stop.objects.filter(itinerary_day__itinerary_id=data['id'], name='Copied').count(), 1)
+
+    def test_new_stop_without_coordinates_is_rejected(self):
+        data = self._created(days=1, stops_per_day=1)
+        days = [{'day_number': 1, 'title': 'Changed', 'stops': [{'name': 'Nowhere', 'order': 1}]}]
+        response = self._update(data['id'], days, name='Renamed')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('days', response.json())
+        itinerary = Itinerary.objects.get(pk=data['id'])
+        self.assertEqual(itinerary.name, 'Rome')
+        self.assertEqual(itinerary.days.get().title, 'Day 1')
+
+    def test_update_query_count_does_not_grow_with_days_and_stops(self):
+        counts = []
+        for days, stops_per_day in ((2, 2), (8, 6)):
+            data = self._created(days=days, stops_per_day=stops_per_day)
+            edited = [
+                {'day_number': day['day_number'], 'title': f"Edited {day['day_number']}", 'stops': [
+                    dict(stop, name=f"Edited {stop['name']}") for stop in day['stops'][1:]
+                ] + [{'name': 'New', 'latitude': '41.9', 'longitude': '12.5', 'order': 99}]}
+                for day in data['days'][1:]
+            ]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self._update(data['id'], edited).status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com')
+        self.reviewer = User.objects.create(username='reviewer@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.itinerary = self._itinerary('Rome')
+            self.other = self._itinerary('Paris')
+            day = ItineraryDay.objects.create(itinerary=self.itinerary, day_number=1, title='Day 1', description='')
+            self.stop = Stop.objects.create(
+                itinerary_day=day, name='Colosseum', description='', stop_type='activity',
+                latitude=Decimal('41.890210'), longitude=Decimal('12.492231'), order=1)
+
+    def _itinerary(self, name):
+        return Itinerary.objects.create(
+            user=self.user, name=name, description='', destination=name,
+            duration=1, price=Decimal('100'), status='published',
+        )
+
+    def _get(self, url, expected_cache):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], expected_cache)
+        return response.json()
+
+    def test_hot_detail_is_served_without_queries(self):
+        url = f'/api/itineraries/{self.itinerary.id}/'
+        self._get(url, 'MISS')
+        with self.assertNumQueries(0):
+            data = self._get(url, 'HIT')
+        self.assertEqual(data['days'][0]['stops'][0]['name'], 'Colosseum')
+
+    def test_stop_change_invalidates_only_its_itinerary(self):
+        url = f'/api/itineraries/{self.itinerary.id}/'
+        other_url = f'/api/itineraries/{self.other.id}/'
+        self._get(url, 'MISS')
+        self._get(other_url, 'MISS')
+        self._get('/api/itineraries/', 'MISS')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.stop.name = 'Forum'
+            self.stop.save()
+
+        self.assertEqual(self._get(url, 'MISS')['days'][0]['stops'][0]['name'], 'Forum')
+        self._get(other_url, 'HIT')
+        self._get('/api/itineraries/', 'HIT')
+
+    def test_review_invalidates_reviews_detail_and_lists(self):
+        urls = [
+            f'/api/itineraries/{self.itinerary.id}/reviews/',
+            f'/api/itineraries/{self.itinerary.id}/',
+            '/api/itineraries/',
+            f'/api/itineraries/creator/{self.user.id}/',
+        ]
+        for url in urls:
+            self._get(url, 'MISS')
+
+        self.client.force_authenticate(self.reviewer)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(urls[0], {'rating': 5, 'comment': 'Great'})
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(None)
+
+        self.assertEqual(len(self._get(urls[0], 'MISS')['results']), 1)
+        self.assertEqual(self._get(urls[1], 'MISS')['review_count'], 1)
+        self._get(urls[2], 'MISS')
+        self._get(urls[3], 'MISS')
+        self._get(f'/api/itineraries/{self.other.id}/', 'MISS')
+        self._get(f'/api/itineraries/{self.other.id}/', 'HIT')
+
+    def test_invalidation_waits_for_commit(self):
+        url = f'/api/itineraries/{self.itinerary.id}/'
+        self._get(url, 'MISS')
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Itinerary.objects.filter(pk=self.itinerary.pk).update(name='Roma')
+            self.itinerary.refresh_from_db()
+            self.itinerary.save()
+            self._get(url, 'HIT')
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self._get(url, 'MISS')['name'], 'Roma')
+
+
+class ConditionalRequestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com')
+        self.itinerary = Itinerary.objects.create(
+            user=self.user, name='Rome', description='', destination='Rome',
+            duration=1, price=Decimal('100'), status='published',
+        )
+        self.day = ItineraryDay.objects.create(itinerary=self.itinerary, day_number=1, title='Day 1', description='')
+        self.stop = Stop.objects.create(
+            itinerary_day=self.day, name='Colosseum', description='', stop_type='activity',
+            latitude=Decimal('41.890210'), longitude=Decimal('12.492231'), order=1)
+        self.detail_url = f'/api/itineraries/{self.itinerary.id}/'
+        self.reviews_url = f'/api/itineraries/{self.itinerary.id}/reviews/'
+
+    def _etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        return response['ETag']
+
+    def _assert_not_modified(self, url, etag):
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_unchanged_detail_returns_304_from_one_query(self):
+        self._assert_not_modified(self.detail_url, self._etag(self.detail_url))
+
+    def test_child_changes_change_etag(self):
+        etags = {self._etag(self.detail_url)}
+        self.client.force_authenticate(self.user)
+        days = [{'day_number': 1, 'stops': [{'id': self.stop.id, 'name': 'Forum'}]}]
+        response = self.client.put(
+            f'/api/user/itineraries/{self.itinerary.id}/', {'days_json': json.dumps(days)}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.client.force_authenticate(None)
+        etags.add(self._etag(self.detail_url))
+        # bulk_update does not apply auto_now; the diff stamps updated_at itself
+        self.assertGreater(Stop.objects.get(pk=self.stop.pk).updated_at, self.stop.updated_at)
+
+        self.stop.delete()
+        etags.add(self._etag(self.detail_url))
+        ItineraryPhoto.objects.create(itinerary=self.itinerary, image='itineraries/photos/a.jpg')
+        etags.add(self._etag(self.detail_url))
+        self.assertEqual(len(etags), 4)
+
+    def test_reviews_validators(self):
+        etag = self._etag(self.reviews_url)
+        last_modified = self.client.get(self.reviews_url)['Last-Modified']
+        response = self.client.get(self.reviews_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        reviewer = User.objects.create(username='reviewer@example.com')
+        Review.objects.create(user=reviewer, itinerary=self.itinerary, rating=4, comment='Good')
+        response = self.client.get(self.reviews_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+    def test_owner_detail_is_private(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/user/itineraries/{self.itinerary.id}/'
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_draft_is_not_found_on_public_detail(self):
+        Itinerary.objects.filter(pk=self.itinerary.pk).update(status='draft')
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_conditional_request_answered_from_response_cache(self):
+        cache.clear()
+        etag = self._etag(self.detail_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+
+def _png(name='cover.png', size=(2000, 1000)):
+    buffer = BytesIO()
+    Image.new('RGBA', size, (200, 40, 40, 128)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        overrides = self.settings(MEDIA_ROOT=media_root, IMAGE_VARIANT_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com')
+
+    def _itinerary(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            itinerary = Itinerary.objects.create(
+                user=self.user, name='Rome', description='', destination='Rome',
+                duration=1, price=Decimal('100'), status='published', image=image,
+            )
+        itinerary.refresh_from_db()
+        return itinerary
+
+    def test_upload_generates_variants(self):
+        variants = self._itinerary(_png()).image_variants
+        self.assertEqual(variants['source'], 'itineraries/cover.png')
+        sizes = {name: (variants[name]['width'], variants[name]['height']) for name in ('thumb', 'card', 'full')}
+        self.assertEqual(sizes, {'thumb': (160, 160), 'card': (640, 400), 'full': (1600, 800)})
+        for name in ('thumb', 'card', 'full'):
+            with default_storage.open(variants[name]['webp']) as file:
+                self.assertEqual(Image.open(file).format, 'WEBP')
+            with default_storage.open(variants[name]['jpeg']) as file:
+                self.assertEqual(Image.open(file).format, 'JPEG')
+
+    def test_variant_urls_in_responses(self):
+        itinerary = self._itinerary(_png())
+        detail = self.client.get(f'/api/itineraries/{itinerary.id}/').json()
+        self.assertTrue(detail['image_variants']['card']['webp'].startswith('http://testserver/media/'))
+        card = self.client.get('/api/itineraries/').json()['results'][0]
+        self.assertEqual(card['image_variants']['card']['width'], 640)
+        self.assertTrue(card['image_variants']['thumb']['jpeg'].startswith('/media/itineraries/variants/'))
+
+    def test_replacing_image_replaces_variants(self):
+        itinerary = self._itinerary(_png())
+        old = itinerary.image_variants
+        with self.captureOnCommitCallbacks(execute=True):
+            itinerary.image = _png('other.png', size=(300, 900))
+            itinerary.save()
+        itinerary.refresh_from_db()
+        self.assertEqual(itinerary.image_variants['source'], 'itineraries/other.png')
+        self.assertEqual(itinerary.image_variants['full']['height'], 900)
+        self.assertFalse(default_storage.exists(old['card']['webp']))
+
+    def test_unreadable_image_is_recorded_and_not_retried(self):
+        itinerary = self._itinerary(SimpleUploadedFile('broken.png', b'not an image'))
+        self.assertEqual(itinerary.image_variants['source'], 'itineraries/broken.png')
+        self.assertIn('error', itinerary.image_variants)
+        self.assertFalse(images.needs_variants(itinerary))
+        self.assertEqual(self.client.get(f'/api/itineraries/{itinerary.id}/').json()['image_variants'], {})
+
+        # Later saves do not queue the same file again
+        with self.captureOnCommitCallbacks() as callbacks:
+            images.schedule([itinerary])
+        self.assertEqual(callbacks, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            itinerary.image = _png()
+            itinerary.save()
+        itinerary.refresh_from_db()
+        self.assertIn('card', itinerary.image_variants)
+
+    def test_oversized_image_is_recorded_and_not_retried(self):
+        # Over twice MAX_IMAGE_PIXELS, Pillow refuses to decode an image
+        self.addCleanup(setattr, Image, 'MAX_IMAGE_PIXELS', Image.MAX_IMAGE_PIXELS)
+        Image.MAX_IMAGE_PIXELS = 1000
+        itinerary = self._itinerary(_png(size=(100, 30)))
+        self.assertIn('error', itinerary.image_variants)
+        self.assertFalse(images.needs_variants(itinerary))
+
+    def test_photo_upload_on_create_generates_variants(self):
+        self.client.force_authenticate(self.user)
+        payload = {
+            'name': 'Rome', 'description': 'Trip', 'duration': 1, 'destination': 'Rome',
+            'price': '100', 'status': 'published', 'image': _png(),
+            'additional_photos_count': 1, 'additional_photo_0': _png('photo.png'),
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/user/itineraries/', payload, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        photo = ItineraryPhoto.objects.get()
+        self.assertEqual(photo.image_variants['thumb']['width'], 160)
+
+    def test_backfill_command(self):
+        itinerary = self._itinerary(_png())
+        Itinerary.objects.filter(pk=itinerary.pk).update(image_variants={})
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn('Generated variants for 1 images', out.getvalue())
+        itinerary.refresh_from_db()
+        self.assertIn('card', itinerary.image_variants)
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media_root, upload_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+        for directory in (media_root, upload_dir):
+            self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overrides = self.settings(MEDIA_ROOT=media_root, UPLOAD_TEMP_DIR=upload_dir,
+                                  UPLOAD_MAX_CHUNK_SIZE=16384, IMAGE_VARIANT_WORKERS=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com')
+        self.client.force_authenticate(self.user)
+        self.itinerary = Itinerary.objects.create(
+            user=self.user, name='Rome', description='', destination='Rome',
+            duration=1, price=Decimal('100'), status='published',
+        )
+        buffer = BytesIO()
+        # Noise, so the PNG does not compress below a few chunks
+        Image.frombytes('RGB', (120, 100), os.urandom(120 * 100 * 3)).save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+
+    def _start(self, size=None):
+        response = self.client.post('/api/uploads/', {
+            'filename': 'photo.png', 'size': size or len(self.content), 'content_type': 'image/png',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def _put(self, upload_id, offset, chunk):
+        return self.client.put(f'/api/uploads/{upload_id}/', chunk, content_type='application/octet-stream',
+                               HTTP_UPLOAD_OFFSET=str(offset))
+
+    def _send(self, upload_id, start=0, chunk_size=16384):
+        response = None
+        for offset in range(start, len(self.content), chunk_size):
+            response = self._put(upload_id, offset, self.content[offset:offset + chunk_size])
+            self.assertEqual(response.status_code, 200, response.content)
+        return response
+
+    def test_upload_in_chunks_and_attach(self):
+        upload_id = self._start()
+        self.assertGreater(len(self.content), 2 * 16384)
+        response = self._send(upload_id)
+        self.assertEqual(response.json()['status'], 'complete')
+        self.assertEqual(response['Upload-Offset'], str(len(self.content)))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/user/itineraries/{self.itinerary.id}/photos/',
+                                        {'uploads': [{'id': upload_id, 'caption': 'Forum'}]}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        photo = ItineraryPhoto.objects.get(itinerary=self.itinerary)
+        self.assertEqual(photo.caption, 'Forum')
+        with photo.image.open('rb') as file:
+            self.assertEqual(file.read(), self.content)
+        self.assertIn('thumb', ItineraryPhoto.objects.get(pk=photo.pk).image_variants)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_resume_after_interrupted_chunk(self):
+        upload_id = self._start()
+        # The connection drops: a chunk ahead of the stored data is rejected with the offset to resume from
+        response = self._put(upload_id, 16384, self.content[16384:32768])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 0)
+
+        self._put(upload_id, 0, self.content[:1000])
+        offset = int(self.client.get(f'/api/uploads/{upload_id}/')['Upload-Offset'])
+        self.assertEqual(offset, 1000)
+        self.assertEqual(self._send(upload_id, start=offset).json()['status'], 'complete')
+
+    def test_limits(self):
+        self.assertEqual(self.client.post('/api/uploads/', {
+            'filename': 'a.pdf', 'size': 10, 'content_type': 'application/pdf'}, format='json').status_code, 400)
+        upload_id = self._start()
+        self.assertEqual(self._put(upload_id, 0, self.content[:20000]).status_code, 400)
+        short = self._start(size=10)
+        self.assertEqual(self._put(short, 0, b'x' * 11).status_code, 400)
+
+    def test_open_uploads_per_user_are_capped(self):
+        with self.settings(UPLOAD_MAX_OPEN_PER_USER=2):
+            first = self._start()
+            self._start()
+            response = self.client.post('/api/uploads/', {
+                'filename': 'photo.png', 'size': 100, 'content_type': 'image/png'}, format='json')
+            self.assertEqual(response.status_code, 429)
+            self.client.delete(f'/api/uploads/{first}/')
+            self._start()
+
+    def test_non_image_is_rejected_on_completion(self):
+        upload_id = self._start(size=100)
+        response = self._put(upload_id, 0, b'x' * 100)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Upload.objects.filter(pk=upload_id).exists())
+
+    def test_attach_requires_own_complete_upload(self):
+        pending = self._start()
+        url = f'/api/user/itineraries/{self.itinerary.id}/photos/'
+        response = self.client.post(url, {'uploads': [{'id': pending}, {'id': 'nope'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(pending, response.json()['uploads'][0])
+
+        other = User.objects.create(username='other@example.com')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(f'/api/uploads/{pending}/').status_code, 404)
+        self.assertEqual(self.client.post(url, {'uploads': [{'id': pending}]}, format='json').status_code, 404)
+
+    def test_attach_rejects_duplicate_uploads(self):
+        upload_id = self._start()
+        self._send(upload_id)
+        response = self.client.post(f'/api/user/itineraries/{self.itinerary.id}/photos/',
+                                    {'uploads': [{'id': upload_id}, {'id': upload_id}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(upload_id, response.json()['uploads'][0])
+        self.assertFalse(ItineraryPhoto.objects.exists())
+
+    def test_purge_expired_uploads(self):
+        upload_id = self._start()
+        Upload.objects.filter(pk=upload_id).update(updated_at=timezone.now() - timedelta(days=2))
+        call_command('purge_uploads', stdout=StringIO())
+        self.assertFalse(Upload.objects.exists())
+
+
+class LoggingTests(TestCase):
+    def _record(self, msg, *args, level=logging.INFO, name='api'):
+        return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+    def test_redacts_sensitive_keys_and_text(self):
+        record = self._record('payload %s', {'email': 'a@example.com', 'password': 'hunter2',
+                                             'nested': [{'token': 'abc'}]})
+        RedactingFilter().filter(record)
+        message = record.getMessage()
+        self.assertIn('a@example.com', message)
+        self.assertNotIn('hunter2', message)
+        self.assertNotIn('abc', message)
+
+        record = self._record('Authorization: Token 0123abcd password=secret1 "new_password": "secret2"')
+        RedactingFilter().filter(record)
+        message = record.getMessage()
+        for secret in ('0123abcd', 'secret1', 'secret2'):
+            self.assertNotIn(secret, message)
+
+    def test_sampling_filter(self):
+        debug = self._record('payload', level=logging.DEBUG)
+        self.assertFalse(SamplingFilter(0).filter(debug))
+        self.assertTrue(SamplingFilter(1).filter(debug))
+        self.assertTrue(SamplingFilter(0).filter(self._record('boom', level=logging.ERROR)))
+
+    def test_json_formatter_includes_extra_fields(self):
+        record = self._record('%s %s', 'GET', '/api/itineraries/')
+        record.status = 200
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual(entry['message'], 'GET /api/itineraries/')
+        self.assertEqual(entry['status'], 200)
+        self.assertEqual(entry['level'], 'INFO')
+
+    def test_one_structured_line_per_request(self):
+        with self.assertLogs('api.requests', level='INFO') as logs:
+            APIClient().get('/api/itineraries/')
+        self.assertEqual(len(logs.records), 1)
+        record = logs.records[0]
+        self.assertEqual((record.method, record.path, record.status), ('GET', '/api/itineraries/', 200))
+
+    def test_queue_handler_writes_rotating_file_and_drops_when_full(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        handler = QueueFileHandler(os.path.join(directory, 'api.log'), queue_size=2)
+        handler.setFormatter(JsonFormatter())
+        handler.handle(self._record('hello %s', 'world'))
+        handler.listener.stop()
+
+        # With the listener stopped nothing drains the queue: the handler drops instead of blocking
+        for i in range(5):
+            handler.handle(self._record('flood %d', i))
+        self.assertGreater(handler.dropped, 0)
+        handler.listener.start()
+        handler.close()
+        with open(os.path.join(directory, 'api.log')) as file:
+            lines = [json.loads(line) for line in file]
+        self.assertEqual(lines[0]['message'], 'hello world')
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.client = APIClient()
+        user = User.objects.create(username='creator@example.com')
+        Itinerary.objects.create(user=user, name='Rome', description='', destination='Rome, Italy',
+                                 duration=2, price=Decimal('100'), status='published')
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/itineraries/')
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;desc="1 query";dur=[\d.]+, serializer;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_histograms_per_view(self):
+        for _ in range(3):
+            self.client.get('/api/itineraries/')
+        latency = metrics.registry.histogram('api_request_duration_seconds', 'itinerary_list')
+        self.assertEqual(latency.count, 3)
+        self.assertGreater(metrics.registry.histogram('api_request_serializer_duration_seconds',
+                                                      'itinerary_list').sum, 0)
+        queries = metrics.registry.histogram('api_request_db_queries', 'itinerary_list')
+        self.assertEqual(queries.sum, 3)
+
+    def test_histogram_quantile(self):
+        histogram = metrics.Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3):
+            histogram.observe(value)
+        self.assertEqual(histogram.quantile(0.5), 1.5)
+        self.assertEqual(list(histogram.cumulative())[-1], (float('inf'), 4))
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/itineraries/')
+        self.assertEqual(self.client.get('/api/internal/metrics/').status_code, 403)
+
+        staff = User.objects.create(username='staff@example.com', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get('/api/internal/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('api_requests_total{view="itinerary_list",method="GET",status="200"} 1', body)
+        self.assertIn('api_request_duration_seconds_bucket{view="itinerary_list",method="GET",le="+Inf"} 1', body)
+
+        self.client.force_authenticate(None)
+        with self.settings(METRICS_TOKEN='scrape'):
+            self.assertEqual(self.client.get('/api/internal/metrics/', HTTP_AUTHORIZATION='Bearer scrape').status_code, 200)
+            self.assertEqual(self.client.get('/api/internal/metrics/', HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+
+
+class SeedCatalogTests(TestCase):
+    def test_seed_catalog(self):
+        out = StringIO()
+        call_command('seed_catalog', itineraries=30, days=3, stops_per_day=4, reviews=3, users=10, stdout=out)
+        self.assertIn('Seeded 30 itineraries', out.getvalue())
+        self.assertEqual(Itinerary.objects.count(), 30)
+        self.assertFalse(Stop.objects.filter(geohash='').exists())
+        self.assertFalse(Itinerary.objects.filter(geohash='').exists())
+        self.assertTrue(ItineraryDay.objects.exists() and Review.objects.exists())
+
+        # Aggregates and the search index are maintained as if the rows had been saved one by one
+        for itinerary in Itinerary.objects.all():
+            self.assertEqual(itinerary.review_count, itinerary.reviews.count())
+        stop = Stop.objects.select_related('itinerary_day__itinerary').first()
+        itinerary = stop.itinerary_day.itinerary
+        itinerary.status = 'published'
+        itinerary.save()
+        found = APIClient().get('/api/itineraries/search/', {'q': itinerary.destination.split(',')[0]}).json()
+        self.assertIn(itinerary.id, [row['id'] for row in found['results']])
+
+    def test_seed_is_deterministic_and_clearable(self):
+        call_command('seed_catalog', itineraries=5, users=3, stdout=StringIO())
+        first = list(Itinerary.objects.order_by('pk').values_list('name', 'duration', 'price'))
+        call_command('seed_catalog', itineraries=5, users=3, clear=True, stdout=StringIO())
+        self.assertEqual(list(Itinerary.objects.order_by('pk').values_list('name', 'duration', 'price')), first)
+        self.assertEqual(User.objects.count(), 3)
+
+
+class BenchmarkTests(TestCase):
+    def test_every_endpoint_has_a_scenario(self):
+        self.assertEqual(benchmarks.uncovered_url_names(), [])
+
+    def test_measure_rolls_back_writes(self):
+        seed.seed_catalog(10, users=5)
+        fixtures = benchmarks.create_fixtures()
+        scenarios = {scenario.label: scenario for scenario in benchmarks.SCENARIOS}
+        result = benchmarks.measure(scenarios['GET itinerary-list'], fixtures, iterations=2, warmup=1,
+                                    allocation_iterations=1)
+        self.assertTrue(result['ok'])
+        self.assertEqual(result['queries'], 1)
+        self.assertGreater(result['alloc_peak_kib'], 0)
+
+        count = Itinerary.objects.count()
+        result = benchmarks.measure(scenarios['POST user-itineraries'], fixtures, iterations=2, warmup=0,
+                                    allocation_iterations=0)
+        self.assertTrue(result['ok'])
+        self.assertEqual(Itinerary.objects.count(), count)
+
+
+class LoadTestTests(LiveServerTestCase):
+    def test_mixed_traffic_against_live_server(self):
+        seed.seed_catalog(10, users=5, published_ratio=1)
+        context = loadtest.prepare_context(users=2)
+        weights = loadtest.parse_mix('list=3,detail=3,creator=1,review=2,edit=1')
+        # The live server shares one in-memory SQLite connection between its
+        # threads, so overlapping write transactions would collide: one worker
+        report = asyncio.run(loadtest.run(self.live_server_url, context, concurrency=1, duration=1,
+                                          weights=weights, seed=1))
+        self.assertGreater(report['total']['requests'], 0)
+        self.assertEqual(report['total']['errors'], 0, report['endpoints'])
+        self.assertIn('p99', report['endpoints']['GET itinerary-list']['latency_ms'])
+        # Reviews posted by the load test are removed again
+        self.assertFalse(Review.objects.filter(user__username__startswith='loadtest-').exists())
+
+    def test_chunked_responses_and_keep_alive(self):
+        async def handle(reader, writer):
+            for _ in range(2):
+                while (await reader.readline()) not in (b'\r\n', b''):
+                    pass
+                writer.write(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                             b'5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n')
+                await writer.drain()
+            writer.close()
+
+        async def exchange():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            connection = loadtest.Connection('127.0.0.1', port)
+            try:
+                return [await connection.request('GET', '/') for _ in range(2)]
+            finally:
+                await connection.close()
+                server.close()
+
+        for status, _, body in asyncio.run(exchange()):
+            self.assertEqual((status, body), (200, b'hello world'))
+
+    def test_parse_mix(self):
+        self.assertEqual(loadtest.parse_mix('list=2, detail'), {'list': 2.0, 'detail': 25})
+        with self.assertRaises(ValueError):
+            loadtest.parse_mix('nope=1')
+
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        seed.seed_catalog(25, days=2, stops_per_day=2, users=5, published_ratio=0.8)
+        self.published = list(Itinerary.objects.published().order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_streaming_list(self):
+        response = APIClient().get('/api/itineraries/', {'stream': '1'})
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['id'] for row in rows], self.published)
+        self.assertEqual(set(rows[0]), set(APIClient().get('/api/itineraries/').json()['results'][0]))
+
+    def test_ndjson_export_endpoint(self):
+        response = APIClient().get('/api/itineraries/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        documents = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([document['id'] for document in documents], self.published)
+        itinerary = Itinerary.objects.get(pk=documents[0]['id'])
+        self.assertEqual(len(documents[0]['days']), itinerary.days.count())
+        self.assertEqual(documents[0]['review_count'], itinerary.review_count)
+        self.assertIn('rating_histogram', documents[0])
+
+    def test_documents_are_fetched_in_chunks(self):
+        # One itinerary query read in chunks of 10, each chunk prefetching its days, stops and photos
+        chunks = -(-len(self.published) // 10)
+        with self.assertNumQueries(1 + 3 * chunks):
+            self.assertEqual(len(list(export.documents(chunk_size=10))), len(self.published))
+
+    def test_export_catalog_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'catalog.ndjson')
+        call_command('export_catalog', output=path, stderr=StringIO())
+        with open(path, 'rb') as file:
+            self.assertEqual([json.loads(line)['id'] for line in file], self.published)
+
+
+
+class CatalogImportTests(TestCase):
+    def setUp(self):
+        self.partner = User.objects.create(username='partner@example.com', email='partner@example.com')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def document(self, name, **fields):
+        return {
+            'name': name, 'description': 'Tiles and trams', 'duration': 1, 'destination': 'Lisbon, Portugal',
+            'latitude': '38.722300', 'longitude': '-9.139300', 'price': '300.00', 'status': 'published',
+            'creator': 'partner@example.com',
+            'days': [{'day_number': 1, 'title': 'Alfama', 'stops': [
+                {'name': 'Castelo de Sao Jorge', 'latitude': '38.713900', 'longitude': '-9.133500', 'order': 0},
+                {'name': 'Miradouro da Graca', 'latitude': '38.716400', 'longitude': '-9.131500', 'order': 1},
+            ]}],
+            **fields,
+        }
+
+    def write(self, name, documents):
+        path = os.path.join(self.directory, name)
+        with open(path, 'a') as file:
+            file.writelines(json.dumps(document) + '\n' for document in documents)
+        return path
+
+    def test_round_trip_of_the_export(self):
+        seed.seed_catalog(12, days=2, stops_per_day=2, users=3, published_ratio=1)
+        path = os.path.join(self.directory, 'catalog.ndjson')
+        call_command('export_catalog', output=path, stderr=StringIO())
+        with open(path) as file:
+            exported = json.loads(file.readline())
+        seed.clear_catalog()  # the seeded creators go too
+
+        with self.captureOnCommitCallbacks(execute=True), open(path, 'rb') as file:
+            result = importer.import_catalog(file, batch_size=5, create_creators=True)
+        self.assertEqual((result.imported, result.failed, result.creators_created, result.line), (12, 0, 3, 12))
+        copy = Itinerary.objects.get(name=exported['name'], description=exported['description'])
+        self.assertEqual(copy.user.username, exported['user']['username'])
+        self.assertEqual((copy.status, copy.price, copy.review_count), ('published', Decimal(exported['price']), 0))
+        self.assertEqual(copy.geohash, encode_geohash(copy.latitude, copy.longitude))
+        stops = Stop.objects.filter(itinerary_day__itinerary=copy).order_by('itinerary_day__day_number', 'order')
+        self.assertEqual([(stop.name, str(stop.latitude), stop.geohash[:5]) for stop in stops],
+                         [(stop['name'], stop['latitude'], encode_geohash(stop['latitude'], stop['longitude'])[:5])
+                          for day in exported['days'] for stop in day['stops']])
+        response = APIClient().get('/api/itineraries/search/', {'q': exported['days'][0]['stops'][0]['name']})
+        self.assertIn(copy.id, [row['id'] for row in response.json()['results']])
+
+    def test_invalid_documents_are_reported_and_skipped(self):
+        path = self.write('catalog.ndjson', [
+            self.document('Good'),
+            self.document('No price', price=None),
+            self.document('Stranger', creator='nobody@example.com'),
+            self.document('Clashing days', days=[{'day_number': 1}, {'day_number': 1}]),
+        ])
+        with open(path, 'a') as file:
+            file.write('{"name": \n')
+        errors = StringIO()
+        with open(path, 'rb') as file:
+            result = importer.import_catalog(file, errors=errors)
+        self.assertEqual((result.imported, result.failed), (1, 4))
+        report = [json.loads(line) for line in errors.getvalue().splitlines()]
+        self.assertEqual([entry['line'] for entry in report], [2, 3, 4, 5])
+        self.assertIn('price', report[0]['errors'])
+        self.assertIn('creator', report[1]['errors'])
+        self.assertIn('days', report[2]['errors'])
+        self.assertEqual(list(Itinerary.objects.values_list('name', flat=True)), ['Good'])
+
+    def test_csv_rows_with_days_as_json(self):
+        path = os.path.join(self.directory, 'catalog.csv')
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['name', 'description', 'duration', 'destination', 'latitude', 'longitude', 'price',
+                             'status', 'days'])
+            writer.writerow(['Porto weekend', 'Port, "francesinha" and azulejos', '2', 'Porto, Portugal', '', '',
+                             '250', 'draft', json.dumps(self.document('x')['days'])])
+            writer.writerow(['Sintra day trip', 'Palaces', '1', 'Sintra, Portugal', '38.800000', '-9.380000',
+                             '90', 'published', ''])
+        with open(path, 'rb') as file:
+            result = importer.import_catalog(file, format='csv', default_creator='partner@example.com')
+        self.assertEqual((result.imported, result.days, result.stops), (2, 2, 2))
+        porto = Itinerary.objects.get(name='Porto weekend')
+        self.assertEqual((porto.user, porto.latitude, porto.geohash), (self.partner, None, ''))
+        self.assertEqual(porto.description, 'Port, "francesinha" and azulejos')
+        # Without days the itinerary gets empty ones, as on the create page
+        self.assertEqual(list(Itinerary.objects.get(name='Sintra day trip').days.values_list('title', flat=True)),
+                         ['Day 1'])
+
+    def test_resumes_from_the_checkpoint(self):
+        path = self.write('catalog.ndjson', [self.document(f'Trip {n}') for n in range(3)])
+        checkpoint_path = os.path.join(self.directory, 'checkpoint.json')
+        with open(path, 'rb') as file:
+            importer.import_catalog(file, batch_size=2, checkpoint=importer.Checkpoint(checkpoint_path, path))
+
+        # The partner appends to the file; only the new lines are imported and the totals carry on.
+        # One batch: a savepoint, one creator lookup, three INSERTs and the search index refresh
+        self.write('catalog.ndjson', [self.document('Trip 3'), self.document('Broken', duration='soon')])
+        with open(path, 'rb') as file, self.assertNumQueries(11):
+            result = importer.import_catalog(file, batch_size=2, checkpoint=importer.Checkpoint(checkpoint_path, path))
+        self.assertEqual((result.imported, result.failed, result.stops, result.line), (4, 1, 8, 5))
+        self.assertEqual(Itinerary.objects.count(), 4)
+        with open(checkpoint_path) as file:
+            self.assertEqual(json.load(file)['line'], 5)
+
+        with self.assertRaises(importer.CatalogImportError):
+            importer.Checkpoint(checkpoint_path, os.path.join(self.directory, 'other.ndjson'))
+
+    def test_errors_of_a_crashed_batch_are_reported_once(self):
+        class CrashingImporter(importer.Importer):
+            def validate(self, document):
+                if document['name'] == 'Crash':
+                    raise RuntimeError("killed")
+                return super().validate(document)
+
+        path = self.write('catalog.ndjson', [self.document('Broken', duration='soon'), self.document('Crash')])
+        checkpoint_path = os.path.join(self.directory, 'checkpoint.json')
+        errors = StringIO()
+        with open(path, 'rb') as file, self.assertRaises(RuntimeError):
+            CrashingImporter(errors=errors).run(importer.read_ndjson(file),
+                                                checkpoint=importer.Checkpoint(checkpoint_path, path))
+        with open(path, 'rb') as file:
+            importer.import_catalog(file, errors=errors, checkpoint=importer.Checkpoint(checkpoint_path, path))
+        self.assertEqual([json.loads(line)['line'] for line in errors.getvalue().splitlines()], [1])
+
+    def test_import_catalog_command(self):
+        path = self.write('catalog.ndjson', [self.document('Trip', creator=None), self.document('Orphan', creator=None)])
+        errors_path = os.path.join(self.directory, 'errors.ndjson')
+        out = StringIO()
+        call_command('import_catalog', path, dry_run=True, errors=errors_path, stdout=out)
+        self.assertIn("Validated 0 itineraries", out.getvalue())
+        self.assertFalse(Itinerary.objects.exists())
+        with open(errors_path) as file:
+            self.assertEqual(len(file.readlines()), 2)
+
+        call_command('import_catalog', path, creator='partner@example.com', stdout=out)
+        self.assertIn("Imported 2 itineraries, 2 days and 4 stops", out.getvalue())
+        self.assertEqual(self.partner.itineraries.count(), 2)
+
+
+class RouteTests(TestCase):
+    setUp = ItineraryCreateTests.setUp
+    _create = ItineraryCreateTests._create
+    _update = ItineraryUpdateTests._update
+
+    # Stops along a street in Rome, about 1 km apart, listed out of order
+    STOPS = [('Start', '41.900000', '12.480000'), ('Third', '41.900000', '12.504000'),
+             ('Second', '41.900000', '12.492000'), ('Fourth', '41.900000', '12.516000')]
+
+    def _created(self, status='published'):
+        days = [{'day_number': 1, 'title': 'Walk', 'stops': [
+            {'name': name, 'latitude': latitude, 'longitude': longitude, 'order': order}
+            for order, (name, latitude, longitude) in enumerate(self.STOPS)
+        ]}]
+        response = self._create({'name': 'Rome', 'description': 'Trip', 'duration': 1, 'destination': 'Rome',
+                                  'price': '100', 'status': status, 'days': json.dumps(days)})
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_distance_matrix_matches_haversine(self):
+        points = [(48.8566, 2.3522), (51.5072, -0.1276), (40.7128, -74.0060)]
+        matrix = routes.distance_matrix(points)
+        for i, (lat1, lng1) in enumerate(points):
+            for j, (lat2, lng2) in enumerate(points):
+                self.assertAlmostEqual(matrix[i, j], haversine_km(lat1, lng1, lat2, lng2), places=6)
+        self.assertEqual(routes.distance_matrix([]).shape, (0, 0))
+
+    def test_suggests_a_shorter_order_keeping_the_first_stop(self):
+        points = [(0.0, 0.0), (0.0, 0.05), (0.0, 0.04), (0.0, 0.01), (0.0, 0.03), (0.0, 0.02)]
+        route = routes.compute(points)
+        self.assertEqual(route['suggested_order'], [0, 3, 5, 4, 2, 1])
+        self.assertAlmostEqual(route['suggested_distance_km'], haversine_km(0, 0, 0, 0.05), places=2)
+        self.assertGreater(route['walking']['minutes'], 0)
+        self.assertIsNone(routes.compute(sorted(points))['suggested_order'])
+        self.assertEqual(routes.compute(points[:1])['distance_km'], 0)
+
+    def test_route_is_stored_on_create_and_served_with_the_day(self):
+        day = self._created()['days'][0]
+        stored = ItineraryDay.objects.get(pk=day['id'])
+        self.assertEqual(day['route'], stored.route)
+        self.assertEqual(stored.route['stop_count'], 4)
+        self.assertEqual(len(stored.route['legs_km']), 3)
+        self.assertEqual(stored.route['suggested_order'], [0, 2, 1, 3])
+        self.assertAlmostEqual(stored.route['suggested_distance_km'], 3.0, delta=0.1)
+
+    def test_route_is_refreshed_when_stops_change(self):
+        data = self._created()
+        stops = {stop['name']: stop for stop in data['days'][0]['stops']}
+        days = [{'day_number': 1, 'stops': [
+            {'id': stops[name]['id'], 'order': order} for order, name in enumerate(['Start', 'Second', 'Third'])
+        ]}]
+        self.assertEqual(self._update(data['id'], days).status_code, 200)
+        route = ItineraryDay.objects.get(pk=data['days'][0]['id']).route
+        self.assertEqual(route['stop_count'], 3)
+        self.assertIsNone(route['suggested_order'])
+
+    def test_stale_routes_are_recomputed(self):
+        data = self._created()
+        day = ItineraryDay.objects.get(pk=data['days'][0]['id'])
+        # Saved one by one, e.g. through the admin: the cached route goes stale
+        Stop.objects.filter(itinerary_day=day, name='Fourth').update(longitude='12.600000')
+        response = self.client.get(f'/api/itineraries/{data["id"]}/')
+        self.assertEqual(response.json()['days'][0]['route']['stop_count'], 4)
+        self.assertGreater(response.json()['days'][0]['route']['distance_km'], day.route['distance_km'])
+
+        response = self.client.get(f'/api/itineraries/{data["id"]}/days/1/route/')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([stop['name'] for stop in body['stops']], ['Start', 'Third', 'Second', 'Fourth'])
+        self.assertEqual(len(body['matrix_km']), 4)
+        self.assertEqual(body['matrix_km'][0][0], 0)
+        day.refresh_from_db()
+        self.assertEqual(body['route'], day.route)  # stored by the endpoint
+
+        ItineraryDay.objects.update(route={}, route_signature='')
+        out = StringIO()
+        call_command('rebuild_routes', stdout=out)
+        self.assertIn("1 days", out.getvalue())
+        day.refresh_from_db()
+        self.assertEqual(day.route, body['route'])
+
+    def test_seeded_days_have_fresh_routes(self):
+        seed.seed_catalog(3, days=2, stops_per_day=4, users=2)
+        for itinerary in Itinerary.objects.with_details():
+            for day in itinerary.days.all():
+                points = routes.points_of(day.stops.all())
+                self.assertEqual(day.route_signature, routes.signature(points))
+                self.assertEqual(day.route['stop_count'], len(points))
+
+    def test_route_endpoint_hides_drafts(self):
+        data = self._created(status='draft')
+        self.assertEqual(self.client.get(f'/api/itineraries/{data["id"]}/days/1/route/').status_code, 404)
+        self.assertEqual(self.client.get(f'/api/itineraries/{data["id"]}/days/2/route/').status_code, 404)
+
+
+class SimilarItineraryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user = User.objects.create(username='creator@example.com')
+            self.louvre = self._itinerary('Paris museums', 'The Louvre, Orsay and the Pompidou art collections',
+                                          'Paris, France',
+                                          stops=[('Louvre museum', 'activity'), ('Orsay museum', 'activity')])
+            self.orangerie = self._itinerary('Art in Paris', 'Monet at the Orangerie and the Rodin museum',
+                                             'Paris, France', stops=[('Orangerie museum', 'activity')])
+            self.bistros = self._itinerary('Paris bistros', 'Steak frites, croissants and natural wine',
+                                           'Paris, France', stops=[('Le Bistrot', 'food')], duration=5, price='2000')
+            self.ramen = self._itinerary('Tokyo ramen crawl', 'Noodles in Shinjuku and Shibuya',
+                                         'Tokyo, Japan', stops=[('Ichiran', 'food')], duration=5, price='2000')
+        similar.index.clear()
+        self.addCleanup(similar.index.clear)
+
+    def _itinerary(self, name, description, destination, stops=(), duration=2, price='300', status='published'):
+        itinerary = Itinerary.objects.create(user=self.user, name=name, description=description,
+                                             destination=destination, duration=duration, price=Decimal(price),
+                                             status=status)
+        day = ItineraryDay.objects.create(itinerary=itinerary, day_number=1, title='Day 1', description='')
+        for order, (stop_name, stop_type) in enumerate(stops):
+            Stop.objects.create(itinerary_day=day, name=stop_name, stop_type=stop_type, order=order,
+                                latitude=Decimal('48.86'), longitude=Decimal('2.35'))
+        return itinerary
+
+    def _similar(self, itinerary, **params):
+        response = self.client.get(f'/api/itineraries/{itinerary.pk}/similar/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [row['id'] for row in response.json()]
+
+    def test_ranks_by_content(self):
+        self.assertEqual(self._similar(self.louvre), [self.orangerie.id, self.bistros.id])
+        self.assertEqual(self._similar(self.ramen), [self.bistros.id])
+        row = self.client.get(f'/api/itineraries/{self.louvre.pk}/similar/').json()[0]
+        self.assertEqual(row['name'], 'Art in Paris')
+        self.assertTrue(0 < row['similarity'] <= 1)
+        self.assertEqual(self._similar(self.louvre, limit=1), [self.orangerie.id])
+
+    def test_drafts_are_not_indexed(self):
+        draft = self._itinerary('Paris museums again', 'The Louvre and Orsay museum', 'Paris, France',
+                                status='draft')
+        self.assertNotIn(draft.id, self._similar(self.louvre))
+        self.assertEqual(self.client.get(f'/api/itineraries/{draft.pk}/similar/').status_code, 404)
+        self.assertEqual(self.client.get('/api/itineraries/999/similar/').status_code, 404)
+
+    def test_changes_are_applied_incrementally(self):
+        self._similar(self.louvre)
+        self.assertTrue(similar.index.built)
+
+        # Saved itineraries are found through updated_at
+        self.ramen.description = 'Museums of Tokyo: the Louvre of Japan, Orsay style art'
+        self.ramen.destination = 'Paris, France'
+        self.ramen.save()
+        museums = self._itinerary('Paris museum pass', 'Louvre, Orsay, Orangerie and Pompidou art museums',
+                                  'Paris, France', stops=[('Louvre museum', 'activity')])
+        self.assertEqual(self._similar(self.louvre)[0], museums.id)
+        self.assertIn(self.ramen.id, self._similar(self.louvre))
+
+        # Stop changes are signalled on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            Stop.objects.filter(itinerary_day__itinerary=self.bistros).update(name='Louvre museum cafe')
+            stop = Stop.objects.get(itinerary_day__itinerary=self.bistros)
+            stop.save()
+        self.assertEqual(similar.index._changed_days, {stop.itinerary_day_id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            museums.delete()
+        self.assertNotIn(museums.id, self._similar(self.louvre))
+        self.assertNotIn(museums.id, similar.index.rows)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cached_neighbours_follow_other_itineraries_stops(self):
+        cache.clear()
+        self.assertNotIn(self.ramen.id, self._similar(self.louvre))
+        with self.captureOnCommitCallbacks(execute=True):
+            Stop.objects.create(itinerary_day=self.ramen.days.get(), name='Louvre Orsay Pompidou museum',
+                                stop_type='activity', order=1, latitude=Decimal('48.86'), longitude=Decimal('2.35'))
+        self.assertIn(self.ramen.id, self._similar(self.louvre))
+
+    def test_one_query_to_sync_and_one_to_load(self):
+        self._similar(self.louvre)
+        with self.assertNumQueries(2):
+            self._similar(self.orangerie)
+
+    def test_edited_drafts_do_not_count_as_changes(self):
+        draft = self._itinerary('Paris draft', 'Louvre', 'Paris, France', status='draft')
+        self._similar(self.louvre)
+        with self.captureOnCommitCallbacks(execute=True):
+            draft.description = 'Louvre and Orsay'
+            draft.save()
+            Stop.objects.create(itinerary_day=draft.days.get(), name='Louvre museum', order=0,
+                                latitude=Decimal('48.86'), longitude=Decimal('2.35'))
+        for _ in range(3):
+            self._similar(self.louvre)
+        self.assertEqual(similar.index.changes, 0)
+        self.assertNotIn(draft.id, similar.index.rows)
+
+    def test_rows_deleted_elsewhere_are_dropped(self):
+        self._similar(self.louvre)
+        # Deleted by another process: no signal reaches this one
+        Itinerary.objects.filter(pk=self.orangerie.pk).update(status='draft')
+        self.assertEqual(self._similar(self.louvre), [self.bistros.id])
+        self.assertNotIn(self.orangerie.id, similar.index.rows)
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.reviewers = [User.objects.create(username=f'reviewer{n}@example.com') for n in range(5)]
+        self.recent = self._itinerary('Rome lately', 'Rome, Italy', ratings=[3, 3])
+        self.classic = self._itinerary('Paris classic', 'Paris, France', ratings=[5, 5, 5], age=timedelta(days=6))
+        self.draft = self._itinerary('Rome draft', 'Rome, Italy', ratings=[5] * 5, status='draft')
+        self.newest = self._itinerary('Rome newest', 'Rome, Italy')
+        # Saved long enough ago not to count as changed since a refresh
+        Itinerary.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+
+    def _itinerary(self, name, destination, ratings=(), age=timedelta(0), status='published'):
+        itinerary = Itinerary.objects.create(name=name, description='', destination=destination, duration=2,
+                                             price=Decimal('300'), status=status)
+        for user, rating in zip(self.reviewers, ratings):
+            Review.objects.create(user=user, itinerary=itinerary, rating=rating, comment='ok')
+        Review.objects.filter(itinerary=itinerary).update(created_at=timezone.now() - age)
+        return itinerary
+
+    def _ids(self, items):
+        return [item['id'] for item in items]
+
+    def test_boards_are_served_in_one_query(self):
+        result = leaderboards.refresh()
+        self.assertEqual(result, leaderboards.RefreshResult(refreshed=4))
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/leaderboards/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+
+        # Two reviews today outweigh three from six days (two half-lives) ago
+        self.assertEqual(self._ids(data['trending']), [self.recent.id, self.classic.id])
+        self.assertAlmostEqual(data['trending'][1]['score'], 0.75, places=3)
+        # Catalog mean (6 + 15) / 5 = 4.2 weighs like five reviews: 4.5 beats 27 / 7
+        self.assertEqual(self._ids(data['top_rated']), [self.classic.id, self.recent.id])
+        self.assertEqual(data['top_rated'][0]['score'], 4.5)
+        self.assertEqual(data['top_rated'][0]['name'], 'Paris classic')
+        self.assertEqual(data['top_rated'][0]['rating'], '5.0')
+        self.assertEqual([(board['destination'], self._ids(board['itineraries'])) for board in data['newest']], [
+            ('Rome, Italy', [self.newest.id, self.recent.id]),
+            ('Paris, France', [self.classic.id]),
+        ])
+
+    def test_unchanged_boards_are_skipped(self):
+        leaderboards.refresh()
+        self.assertEqual(leaderboards.refresh(), leaderboards.RefreshResult(refreshed=1, unchanged=3))
+
+        berlin = self._itinerary('Berlin', 'Berlin, Germany', ratings=[4])
+        result = leaderboards.refresh()
+        self.assertEqual(result, leaderboards.RefreshResult(refreshed=3, unchanged=2))
+        self.assertIn(berlin.id, self._ids(leaderboards.boards()['top_rated']))
+
+        Itinerary.objects.filter(destination='Paris, France').delete()
+        result = leaderboards.refresh()
+        self.assertEqual(result.removed, 1)
+        self.assertEqual([board['destination'] for board in leaderboards.boards()['newest']],
+                         ['Rome, Italy', 'Berlin, Germany'])
+
+    def test_changes_are_seen_by_one_refresh(self):
+        leaderboards.refresh()
+        Leaderboard.objects.update(refreshed_at=timezone.now() - timedelta(minutes=30))
+        Itinerary.objects.filter(pk=self.recent.pk).update(updated_at=timezone.now() - timedelta(minutes=10))
+        # Trending, top rated (its digest covers updated_at) and Rome
+        self.assertEqual(leaderboards.refresh(), leaderboards.RefreshResult(refreshed=3, unchanged=1))
+        # The Paris board was skipped, but the run still moves the window past the edit
+        self.assertEqual(leaderboards.refresh(), leaderboards.RefreshResult(refreshed=1, unchanged=3))
+
+    def test_entries_follow_their_itinerary(self):
+        leaderboards.refresh()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.classic.name = 'Paris forever'
+            self.classic.save()
+        self.assertEqual(leaderboards.boards()['top_rated'][0]['name'], 'Paris forever')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.reviewers[4], itinerary=self.recent, rating=1, comment='meh')
+        rows = LeaderboardEntry.objects.filter(itinerary=self.recent).values_list('summary', flat=True)
+        self.assertEqual({row['review_count'] for row in rows}, {3})
+
+        # Moved to another destination: gone from its old newest board only
+        with self.captureOnCommitCallbacks(execute=True):
+            self.newest.destination = 'Naples, Italy'
+            self.newest.save()
+        self.assertEqual(self._ids(leaderboards.boards()['newest'][0]['itineraries']), [self.recent.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recent.status = 'draft'
+            self.recent.save()
+        self.assertFalse(LeaderboardEntry.objects.filter(itinerary=self.recent).exists())
+
+    def test_refresh_command(self):
+        out = StringIO()
+        call_command('refresh_leaderboards', '--full', stdout=out)
+        self.assertIn('Refreshed 4 leaderboards (0 unchanged, 0 removed)', out.getvalue())
+        self.assertEqual(Leaderboard.objects.count(), 4)
+
+
+class FavoriteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='traveller@example.com')
+        self.creator = User.objects.create(username='creator@example.com')
+        self.rome, self.paris, self.lisbon = (
+            Itinerary.objects.create(user=self.creator, name=name, description='', destination=name, duration=1,
+                                     price=Decimal('100'), status='published')
+            for name in ('Rome', 'Paris', 'Lisbon')
+        )
+        self.draft = Itinerary.objects.create(user=self.creator, name='Secret', description='', destination='Oslo',
+                                              duration=1, price=Decimal('100'))
+        self.client.force_authenticate(self.user)
+
+    def _favorites(self):
+        response = self.client.get('/api/user/favorites/')
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.json()]
+
+    def test_add_list_and_remove(self):
+        response = self.client.post('/api/user/favorites/', {'itinerary': self.rome.id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['itinerary'], self.rome.id)
+        self.assertEqual(self.client.post('/api/user/favorites/', {'itinerary': self.rome.id}).status_code, 200)
+        self.assertEqual(self.client.post('/api/user/favorites/', {'itinerary': self.paris.id}).status_code, 201)
+        self.assertEqual(self.client.post('/api/user/favorites/', {'itinerary': self.draft.id}).status_code, 404)
+        self.assertEqual(self.client.post('/api/user/favorites/', {'itinerary': 'rome'}).status_code, 400)
+
+        self.assertEqual(self._favorites(), [self.paris.id, self.rome.id])
+        self.assertEqual(self.client.get(f'/api/user/favorites/{self.rome.id}/').status_code, 200)
+        self.assertEqual(self.client.get(f'/api/user/favorites/{self.lisbon.id}/').status_code, 404)
+
+        self.assertEqual(self.client.delete(f'/api/user/favorites/{self.rome.id}/').status_code, 204)
+        self.assertEqual(self.client.delete(f'/api/user/favorites/{self.rome.id}/').status_code, 404)
+        self.assertEqual(self._favorites(), [self.paris.id])
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/user/favorites/').status_code, 401)
+
+    def test_list_is_one_query_and_hides_unpublished(self):
+        for itinerary in (self.rome, self.paris, self.lisbon):
+            Favorite.objects.create(user=self.user, itinerary=itinerary)
+        Itinerary.objects.filter(pk=self.paris.pk).update(status='draft')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/user/favorites/')
+        rows = response.json()
+        self.assertEqual([row['id'] for row in rows], [self.lisbon.id, self.rome.id])
+        self.assertEqual(rows[0]['name'], 'Lisbon')
+        self.assertIn('favorited_at', rows[0])
+
+    def test_import(self):
+        Favorite.objects.create(user=self.user, itinerary=self.paris)
+        with self.assertNumQueries(3):
+            response = self.client.post('/api/user/favorites/import/', {
+                'itineraries': [self.rome.id, self.draft.id, self.paris.id, 999, self.lisbon.id, self.rome.id],
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'imported': 2, 'existing': 1, 'missing': [self.draft.id, 999]})
+        # Later ids are the more recent favorites
+        self.assertEqual(self._favorites(), [self.lisbon.id, self.rome.id, self.paris.id])
+
+        response = self.client.post('/api/user/favorites/import/', {'itineraries': list(range(1, 502))},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_out_of_range_ids(self):
+        huge = 99999999999999999999999
+        response = self.client.post('/api/user/favorites/import/', {'itineraries': [self.rome.id, huge]},
+                                    format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/user/favorites/', {'itinerary': huge}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(f'/api/user/favorites/{huge}/').status_code, 404)
+        self.assertEqual(self.client.delete(f'/api/user/favorites/{huge}/').status_code, 404)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   ITINERARY_BATCH_MAX=3)
+class ItineraryBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rome, self.paris = (
+                Itinerary.objects.create(name=name, description='', destination=name, duration=1,
+                                         price=Decimal('100'), status='published')
+                for name in ('Rome', 'Paris')
+            )
+            self.draft = Itinerary.objects.create(name='Draft', description='', destination='Oslo', duration=1,
+                                                  price=Decimal('100'))
+
+    def _batch(self, ids):
+        return self.client.get('/api/itineraries/batch/', {'ids': ids})
+
+    def test_documents_in_order_with_missing_ids(self):
+        ids = f'{self.paris.id},{self.draft.id},999,{self.rome.id},{self.paris.id}'
+        with self.settings(ITINERARY_BATCH_MAX=5):
+            response = self._batch(ids)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([document['name'] for document in data['results']], ['Paris', 'Rome'])
+        self.assertEqual(data['results'][0]['days'], [])
+        self.assertEqual(data['missing'], [self.draft.id, 999])
+
+    def test_documents_are_cached_per_itinerary(self):
+        self._batch(f'{self.rome.id},{self.paris.id}')
+        with self.assertNumQueries(0):
+            self.assertEqual(len(self._batch(f'{self.paris.id},{self.rome.id}').json()['results']), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rome.name = 'Roma'
+            self.rome.save()
+        # Only the changed itinerary is loaded again
+        with CaptureQueriesContext(connection) as queries:
+            data = self._batch(f'{self.rome.id},{self.paris.id}').json()
+        self.assertEqual([document['name'] for document in data['results']], ['Roma', 'Paris'])
+        self.assertIn(f'IN ({self.rome.id})', queries.captured_queries[0]['sql'])
+
+    def test_invalid_ids(self):
+        self.assertEqual(self._batch('').status_code, 400)
+        self.assertEqual(self._batch('1,two').status_code, 400)
+        self.assertEqual(self._batch('1,2,3,4').status_code, 400)
+        self.assertEqual(self._batch('1,2,3,3,').status_code, 200)
+
+    def test_out_of_range_ids(self):
+        for ids in ('0', f'{self.rome.id},-1', '99999999999999999999999', str(2 ** 63)):
+            self.assertEqual(self._batch(ids).status_code, 400, ids)
+        self.assertEqual(self._batch(str(2 ** 63 - 1)).json()['missing'], [2 ** 63 - 1])
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='creator@example.com', first_name='Ada')
+        self.itinerary = Itinerary.objects.create(
+            user=self.user, name='Rome', description='', destination='Rome, Italy', duration=1,
+            price=Decimal('100'), status='published')
+        day = ItineraryDay.objects.create(itinerary=self.itinerary, day_number=1, title='Day 1', description='')
+        Stop.objects.create(itinerary_day=day, name='Forum', latitude=Decimal('41.89'), longitude=Decimal('12.49'))
+        ItineraryPhoto.objects.create(itinerary=self.itinerary, image='itineraries/photos/photo.jpg')
+        Review.objects.create(user=self.user, itinerary=self.itinerary, rating=5, comment='Great')
+        self.url = f'/api/itineraries/{self.itinerary.id}/'
+
+    def _get(self, url, params, queries):
+        # One of the queries is for the ETag (api.conditional)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_fields_skip_every_relation(self):
+        data = self._get(self.url, {'fields': 'name,rating'}, 2)
+        self.assertEqual(data, {'id': self.itinerary.id, 'name': 'Rome', 'rating': '5.0'})
+
+    def test_expand_loads_only_the_expanded_relations(self):
+        data = self._get(self.url, {'expand': 'user'}, 2)
+        self.assertEqual(data['user']['first_name'], 'Ada')
+        self.assertNotIn('days', data)
+        self.assertNotIn('photos', data)
+        self.assertEqual(data['destination'], 'Rome, Italy')
+
+        data = self._get(self.url, {'fields': 'name', 'expand': 'days'}, 4)
+        self.assertEqual(set(data), {'id', 'name', 'days'})
+        self.assertEqual(data['days'][0]['stops'][0]['name'], 'Forum')
+
+        # Without either parameter the document is complete
+        self.assertEqual(len(self._get(self.url, {}, 5)['photos']), 1)
+
+    def test_other_endpoints(self):
+        self.client.force_authenticate(self.user)
+        data = self._get(f'/api/user/itineraries/{self.itinerary.id}/', {'expand': 'photos'}, 3)
+        self.assertEqual(len(data['photos']), 1)
+        self.assertNotIn('user', data)
+
+        data = self._get('/api/itineraries/batch/', {'ids': self.itinerary.id, 'fields': 'name'}, 1)
+        self.assertEqual(data['results'], [{'id': self.itinerary.id, 'name': 'Rome'}])
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self._get(f'{self.url}reviews/', {'fields': 'rating,comment'}, 3)
+        self.assertEqual(data['results'], [{'id': data['results'][0]['id'], 'rating': 5, 'comment': 'Great'}])
+        self.assertNotIn('auth_user', queries.captured_queries[-1]['sql'])
+        self.assertEqual(self._get(f'{self.url}reviews/', {'expand': 'user'}, 3)['results'][0]['user']['first_name'],
+                         'Ada')
+
+    def test_unknown_names_are_rejected(self):
+        response = self.client.get(self.url, {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'fields': ['Unknown fields: secret.']})
+        self.assertEqual(self.client.get(self.url, {'expand': 'reviews'}).status_code, 400)
+        self.assertEqual(self.client.get(f'{self.url}reviews/', {'expand': 'itinerary'}).status_code, 400)
@@ -0,0 +1,198 @@
+"""
+Resumable chunked uploads.
+
+A client declares a file (name, size, type) and gets an Upload id, then sends
+the bytes as a series of PUT requests, each carrying the offset it starts at.
+Chunks are streamed from the request into a temporary file in small buffers,
+so neither a whole chunk nor a whole file is ever held in memory, and every
+request stays short. If a connection drops, the client asks for the current
+offset and resumes from there. When the last byte arrives the file is checked
+to be an image; a complete upload is then attached to an itinerary as a photo,
+which moves it into media storage.
+"""
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from . import images, response_cache
+from .models import ItineraryPhoto, Upload
+
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class UploadError(ValueError):
+    """Raised for an upload request that cannot be honoured; carries the HTTP status to answer with."""
+    status_code = 400
+
+
+class OffsetMismatch(UploadError):
+    """The chunk does not start where the stored data ends; the client should resume from `expected`."""
+    status_code = 409
+
+    def __init__(self, expected):
+        super().__init__(f"Expected a chunk starting at offset {expected}")
+        self.expected = expected
+
+
+class TooManyUploads(UploadError):
+    """The user already holds UPLOAD_MAX_OPEN_PER_USER uploads; finish or abort some first."""
+    status_code = 429
+
+
+def temp_path(upload):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f'{upload.pk}.part')
+
+
+def _remove_temp_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def start_upload(user, filename, size, content_type):
+    """Validate a declared file and create its Upload and empty temporary file."""
+    filename = os.path.basename(str(filename or '')).strip()
+    if not filename:
+        raise UploadError("'filename' is required")
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError("'size' must be an integer")
+    if not 0 < size <= settings.UPLOAD_MAX_SIZE:
+        raise UploadError(f"'size' must be between 1 and {settings.UPLOAD_MAX_SIZE} bytes")
+    content_type = str(content_type or '')
+    if not content_type.startswith('image/'):
+        raise UploadError("Only image uploads are supported")
+    if Upload.objects.filter(user=user).count() >= settings.UPLOAD_MAX_OPEN_PER_USER:
+        raise TooManyUploads(
+            f"At most {settings.UPLOAD_MAX_OPEN_PER_USER} uploads may be open at once; attach or delete some first")
+
+    upload = Upload.objects.create(user=user, filename=filename, size=size, content_type=content_type)
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    open(temp_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(upload, offset, stream, length):
+    """
+    Write `length` bytes read from `stream` at `offset` and advance the upload.
+
+    Data is written at the offset rather than appended, so a retried chunk that
+    was already stored overwrites itself with the same bytes. If the stream
+    ends early only the bytes received are counted, and the client resumes
+    from the returned upload's offset.
+    """
+    if upload.status != 'pending':
+        raise UploadError("Upload is already complete")
+    if offset != upload.offset:
+        raise OffsetMismatch(upload.offset)
+    if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(f"Chunks may be at most {settings.UPLOAD_MAX_CHUNK_SIZE} bytes")
+    if offset + length > upload.size:
+        raise UploadError("Chunk extends past the declared size")
+
+    written = 0
+    with open(temp_path(upload), 'r+b') as file:
+        file.seek(offset)
+        while written < length:
+            data = stream.read(min(STREAM_BUFFER_SIZE, length - written))
+            if not data:
+                break
+            file.write(data)
+            written += len(data)
+
+    # Another request may have stored this chunk concurrently; only one of them advances the offset
+    if written and Upload.objects.filter(pk=upload.pk, offset=offset).update(
+            offset=offset + written, updated_at=timezone.now()):
+        upload.offset = offset + written
+    else:
+        upload.refresh_from_db()
+    if upload.offset == upload.size and upload.status == 'pending':
+        _finish(upload)
+    return upload
+
+
+def _finish(upload):
+    path = temp_path(upload)
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception:
+        abort(upload)
+        raise UploadError("The uploaded file is not a readable image")
+    upload.status = 'complete'
+    upload.save(update_fields=['status', 'updated_at'])
+
+
+def abort(upload):
+    path = temp_path(upload)
+    upload.delete()
+    _remove_temp_file(path)
+
+
+def attach_photos(itinerary, user, entries):
+    """
+    Turn complete uploads of `user` into photos of `itinerary`.
+
+    `entries` is a list of {'id': upload id, 'caption': str} dicts. Raises
+    UploadError naming any upload that is listed twice, unknown or not
+    complete; otherwise the photos are created with one INSERT and returned.
+    """
+    ids = [str(entry.get('id')) for entry in entries]
+    duplicates = sorted({upload_id for upload_id in ids if ids.count(upload_id) > 1})
+    if duplicates:
+        raise UploadError(f"Uploads listed more than once: {', '.join(duplicates)}")
+    uploads = Upload.objects.filter(user=user, status='complete').in_bulk(
+        [upload_id for upload_id in ids if _is_uuid(upload_id)], field_name='pk')
+    uploads = {str(pk): upload for pk, upload in uploads.items()}
+    missing = [upload_id for upload_id in ids if upload_id not in uploads]
+    if missing:
+        raise UploadError(f"Unknown or incomplete uploads: {', '.join(missing)}")
+
+    files = []
+    try:
+        photos = []
+        for entry, upload_id in zip(entries, ids):
+            upload = uploads[upload_id]
+            file = File(open(temp_path(upload), 'rb'), name=upload.filename)
+            files.append(file)
+            photos.append(ItineraryPhoto(itinerary=itinerary, image=file, caption=str(entry.get('caption') or '')))
+        with transaction.atomic():
+            # Saving the FileFields copies each temporary file into media storage
+            ItineraryPhoto.objects.bulk_create(photos)
+            Upload.objects.filter(pk__in=[upload.pk for upload in uploads.values()]).delete()
+            # bulk_create skips the post_save handlers that queue variants and
+            # invalidate cached responses
+            images.schedule(photos)
+            response_cache.invalidate(itineraries=[itinerary.pk])
+    finally:
+        for file in files:
+            file.close()
+
+    for upload in uploads.values():
+        _remove_temp_file(temp_path(upload))
+    return photos
+
+
+def _is_uuid(value):
+    try:
+        uuid.UUID(value)
+    except ValueError:
+        return False
+    return True
+
+
+def purge_expired(now=None):
+    """Delete uploads untouched for UPLOAD_EXPIRY_HOURS and their temporary files."""
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    expired = list(Upload.objects.filter(updated_at__lt=cutoff))
+    for upload in expired:
+        abort(upload)
+    return len(expired)
@@ -8,11 +8,26 @@ urlpatterns = [
     path('password-reset/validate/<str:token>/', views.validate_reset_token, name='validate-reset-token'),
     path('password-reset/confirm/', views.confirm_password_reset, name='confirm-password-reset'),
     path('itineraries/', views.itinerary_list, name='itinerary-list'),
+    path('itineraries/export/', views.itinerary_export, name='itinerary-export'),
+    path('itineraries/search/', views.itinerary_search, name='itinerary-search'),
+    path('itineraries/batch/', views.itinerary_batch, name='itinerary-batch'),
+    path('itineraries/nearby/', views.nearby_itineraries, name='nearby-itineraries'),
     path('itineraries/<int:pk>/', views.public_itinerary_detail, name='public-itinerary-detail'),
+    path('itineraries/<int:pk>/similar/', views.similar_itineraries, name='similar-itineraries'),
+    path('itineraries/<int:pk>/days/<int:day_number>/route/', views.itinerary_day_route,
+         name='itinerary-day-route'),
     path('itineraries/<int:pk>/reviews/', views.itinerary_reviews, name='itinerary-reviews'),
     path('itineraries/creator/<int:creator_id>/', views.itineraries_by_creator, name='itineraries-by-creator'),
+    path('leaderboards/', views.leaderboard_list, name='leaderboard-list'),
     path('user/itineraries/', views.user_itineraries, name='user-itineraries'),
     path('user/itineraries/<int:pk>/', views.itinerary_detail, name='itinerary-detail'),
     path('user/itineraries/<int:pk>/publish/', views.publish_itinerary, name='publish-itinerary'),
+    path('user/itineraries/<int:pk>/photos/', views.itinerary_photos, name='itinerary-photos'),
+    path('user/favorites/', views.user_favorites, name='user-favorites'),
+    path('user/favorites/import/', views.import_favorites, name='import-favorites'),
+    path('user/favorites/<int:itinerary_id>/', views.user_favorite_detail, name='user-favorite-detail'),
+    path('uploads/', views.upload_list, name='upload-list'),
+    path('uploads/<uuid:upload_id>/', views.upload_detail, name='upload-detail'),
     path('reviews/<int:pk>/', views.review_detail, name='review-detail'),
+    path('internal/metrics/', views.metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,55 +1,227 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from django.conf import settings
+from django.db.models import F, Prefetch
 from django.utils import timezone
-from .models import Itinerary, ItineraryDay, ItineraryPhoto, Review, Stop, PasswordResetToken
+from .models import MAX_ID, Favorite, Itinerary, ItineraryDay, ItineraryPhoto, Review, Stop, PasswordResetToken, Upload
 from .serializers import (
-    ItinerarySerializer, UserRegistrationSerializer,
-    ItineraryDaySerializer, ItineraryPhotoSerializer,
-    ReviewSerializer
+    ItinerarySerializer, ItinerarySummarySerializer, NearbyItinerarySerializer, UserRegistrationSerializer,
+    ItineraryDaySerializer, ItineraryPhotoSerializer, SimilarItinerarySerializer,
+    FavoriteItinerarySerializer, FavoriteSerializer, FavoriteImportSerializer, ReviewSerializer
 )
+from . import conditional, export, images, leaderboards, metrics, response_cache, routes, similar, uploads
+from .pagination import KeysetPagination, SearchPagination
+from .search import SearchParamError, filter_itineraries, nearby_itinerary_distances, parse_location
+import hmac
 import json
 import logging
 
 # Set up logger
 logger = logging.getLogger(__name__)
+# Full request payloads; sampled (LOG_PAYLOAD_SAMPLE_RATE) and redacted by settings.LOGGING
+payload_logger = logging.getLogger('api.payloads')
 
 # Create your views here.
 @api_view(['GET'])
+@response_cache.cached_response(response_cache.CATALOG)
 def itinerary_list(request):
-    itineraries = Itinerary.objects.filter(status='published')
-    serializer = ItinerarySerializer(itineraries, many=True)
+    if request.query_params.get('stream') in ('1', 'true'):
+        # The whole catalog as one JSON array, serialized while it is sent
+        return StreamingHttpResponse(export.json_array(export.summary_rows()), content_type='application/json')
+    itineraries = Itinerary.objects.published().summaries()
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(itineraries, request)
+    serializer = ItinerarySummarySerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@api_view(['GET'])
+def itinerary_export(request):
+    """
+    The whole published catalog as NDJSON: one full itinerary document per
+    line (days, stops, photo URLs, rating aggregates), streamed in constant memory.
+    """
+    response = StreamingHttpResponse(export.ndjson(export.documents(request=request)),
+                                     content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="catalog.ndjson"'
+    return response
+
+@api_view(['GET'])
+def itinerary_search(request):
+    """
+    Filter, sort and paginate published itineraries in the database.
+    See api.search.filter_itineraries for the supported query parameters.
+    """
+    try:
+        itineraries = filter_itineraries(Itinerary.objects.published(), request.query_params).summaries()
+    except SearchParamError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = SearchPagination()
+    page = paginator.paginate_queryset(itineraries, request)
+    serializer = ItinerarySummarySerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@api_view(['GET'])
+def nearby_itineraries(request):
+    """
+    Published itineraries whose center or any stop lies within `radius` km of
+    (`lat`, `lng`), nearest first.
+    """
+    try:
+        location = parse_location(request.query_params)
+        if location is None:
+            raise SearchParamError("'lat' and 'lng' are required")
+        limit = int(request.query_params.get('limit', 20))
+    except SearchParamError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return Response({"error": "'limit' must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    distances = dict(nearby_itinerary_distances(*location, limit=max(1, min(limit, 100))))
+    rows = list(Itinerary.objects.filter(id__in=distances).summaries())
+    for row in rows:
+        row['distance_km'] = round(distances[row['id']], 3)
+    rows.sort(key=lambda row: (row['distance_km'], row['id']))
+    serializer = NearbyItinerarySerializer(rows, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
+@response_cache.cached_response((response_cache.CREATOR, 'creator_id'))
 def itineraries_by_creator(request, creator_id):
     try:
         creator = User.objects.get(pk=creator_id)
-        itineraries = Itinerary.objects.filter(user=creator, status='published')
-        serializer = ItinerarySerializer(itineraries, many=True)
-        return Response(serializer.data)
+        itineraries = Itinerary.objects.published().filter(user=creator).summaries()
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(itineraries, request)
+        serializer = ItinerarySummarySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     except User.DoesNotExist:
         return Response({"error": "Creator not found"}, status=status.HTTP_404_NOT_FOUND)
+    except APIException:
+        # Let DRF render client errors such as an invalid cursor
+        raise
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
+@response_cache.cached_response((response_cache.ITINERARY, 'pk'))
+@conditional.conditional_itinerary(published=True)
 def public_itinerary_detail(request, pk):
+    # ?fields= and ?expand= select what is serialized and so what is loaded
+    fields = ItinerarySerializer.requested_fields(request.query_params)
     try:
-        itinerary = Itinerary.objects.get(pk=pk, status='published')
-        serializer = ItinerarySerializer(itinerary, context={'request': request})
+        itinerary = Itinerary.objects.published().with_details(ItinerarySerializer.relations_for(fields)).get(pk=pk)
+        serializer = ItinerarySerializer(itinerary, fields=fields, context={'request': request})
         return Response(serializer.data)
     except Itinerary.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
+@api_view(['GET'])
+def itinerary_batch(request):
+    """
+    Documents of the published itineraries listed in `ids` (comma
+    separated, at most ITINERARY_BATCH_MAX), in the order given, trimmed by
+    `fields` and `expand` as on the detail endpoint. Each document is cached
+    on its own; the ones not cached are loaded together, in the same number
+    of queries however many there are. Ids that do not exist or are not
+    published are listed under `missing`, alike.
+    """
+    try:
+        ids = list(dict.fromkeys(int(value) for value in request.query_params.get('ids', '').split(',')
+                                 if value.strip()))
+        if not all(1 <= pk <= MAX_ID for pk in ids):
+            raise ValueError
+    except ValueError:
+        return Response({"error": "'ids' must be a comma-separated list of itinerary ids"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if not ids:
+        return Response({"error": "'ids' is required"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > settings.ITINERARY_BATCH_MAX:
+        return Response({"error": f"At most {settings.ITINERARY_BATCH_MAX} ids per request"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    fields = ItinerarySerializer.requested_fields(request.query_params)
+
+    def load(missing):
+        itineraries = Itinerary.objects.published().with_details(
+            ItinerarySerializer.relations_for(fields)).in_bulk(missing)
+        serializer = ItinerarySerializer(list(itineraries.values()), many=True, fields=fields,
+                                         context={'request': request})
+        return {document['id']: document for document in serializer.data}
+
+    namespace = request.build_absolute_uri('/') + ','.join(sorted(fields or ()))
+    documents = response_cache.cached_documents(response_cache.ITINERARY, ids, load, namespace=namespace)
+    return Response({
+        'results': [documents[pk] for pk in ids if pk in documents],
+        'missing': [pk for pk in ids if pk not in documents],
+    })
+
+@api_view(['GET'])
+@response_cache.cached_response(response_cache.CATALOG, response_cache.SIMILAR, (response_cache.ITINERARY, 'pk'))
+def similar_itineraries(request, pk):
+    """Published itineraries most like itinerary `pk` by content (see api.similar), most similar first."""
+    try:
+        limit = int(request.query_params.get('limit', similar.DEFAULT_LIMIT))
+    except ValueError:
+        return Response({"error": "'limit' must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    scores = similar.index.similar(pk, limit=max(1, min(limit, similar.MAX_LIMIT)))
+    if scores is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    scores = dict(scores)
+    rows = list(Itinerary.objects.published().filter(id__in=scores).summaries())
+    # Deleted or unpublished by another process since the index last synced
+    similar.index.discard(set(scores) - {row['id'] for row in rows})
+    for row in rows:
+        row['similarity'] = round(scores[row['id']], 4)
+    rows.sort(key=lambda row: (-row['similarity'], row['id']))
+    serializer = SimilarItinerarySerializer(rows, many=True)
+    return Response(serializer.data)
+
+@api_view(['GET'])
+@response_cache.cached_response((response_cache.ITINERARY, 'pk'))
+@conditional.conditional_itinerary(children=conditional.ROUTES, published=True)
+def itinerary_day_route(request, pk, day_number):
+    """
+    Route metrics of one day of a published itinerary: leg and total
+    distances, walking and driving estimates, a suggested stop order and the
+    distance matrix between its stops, all in kilometres.
+    """
+    try:
+        day = ItineraryDay.objects.filter(itinerary__status='published').prefetch_related(
+            Prefetch('stops', queryset=Stop.objects.order_by('order', 'id'))
+        ).get(itinerary_id=pk, day_number=day_number)
+    except ItineraryDay.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    stops = day.stops.all()
+    matrix = routes.distance_matrix(routes.points_of(stops))
+    return Response({
+        'itinerary': pk,
+        'day_number': day.day_number,
+        'stops': [{'id': stop.id, 'name': stop.name, 'latitude': stop.latitude, 'longitude': stop.longitude}
+                  for stop in stops],
+        'route': routes.route_for(day, stops, save=True),
+        'matrix_km': matrix.round(3).tolist(),
+    })
+
+@api_view(['GET'])
+@response_cache.cached_response(response_cache.LEADERBOARDS)
+def leaderboard_list(request):
+    """
+    The trending, top rated and newest-per-destination boards, as last
+    computed by the refresh_leaderboards command (see api.leaderboards).
+    """
+    return Response(leaderboards.boards())
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register(request):
@@ -115,25 +287,27 @@ def login(request):
 @permission_classes([IsAuthenticated])
 def user_itineraries(request):
     if request.method == 'GET':
-        itineraries = Itinerary.objects.filter(user=request.user)
-        serializer = ItinerarySerializer(itineraries, many=True)
-        return Response(serializer.data)
+        itineraries = Itinerary.objects.filter(user=request.user).summaries()
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(itineraries, request)
+        serializer = ItinerarySummarySerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     elif request.method == 'POST':
         try:
-            logger.info(f"Creating itinerary for user: {request.user.username}")
+            logger.debug("Creating itinerary for user %s", request.user.pk)
             # Copy request data to make it mutable
             data = request.data.copy()
-            logger.info(f"Raw request data: {data}")
+            payload_logger.debug("Create itinerary payload: %s", data)
             
             # Process additional photos if any
             additional_photos_count = data.get('additional_photos_count')
             if additional_photos_count:
                 try:
                     additional_photos_count = int(additional_photos_count)
-                    logger.info(f"Processing {additional_photos_count} additional photos")
+                    logger.debug("Processing %d additional photos", additional_photos_count)
                 except ValueError:
-                    logger.error(f"Invalid additional_photos_count: {additional_photos_count}")
+                    logger.warning("Invalid additional_photos_count: %r", additional_photos_count)
                     additional_photos_count = 0
             else:
                 additional_photos_count = 0
@@ -143,71 +317,135 @@ def user_itineraries(request):
             if 'days' in data and isinstance(data['days'], str):
                 try:
                     parsed_days = json.loads(data['days'])
-                    logger.info(f"Parsed days data: {parsed_days}")
+                    payload_logger.debug("Parsed days data: %s", parsed_days)
                     # *** Remove days from the data dict before validation ***
                     del data['days'] 
                 except json.JSONDecodeError as e:
-                    logger.error(f"JSON decode error for days data: {e}")
+                    logger.info("JSON decode error for days data: %s", e)
                     return Response({'days': ['Invalid JSON format.']}, status=status.HTTP_400_BAD_REQUEST)
-            else:
-                logger.info(f"Days data not found or not a string: {data.get('days', 'None')}")
             
             # Pass the data *without* days to the serializer
-            logger.info(f"Data being passed to serializer for validation: {data}")
-            serializer = ItinerarySerializer(data=data, context={'request': request})
+            # The parsed days are validated together with the itinerary fields
+            serializer = ItinerarySerializer(data=data, context={'request': request, 'days_data': parsed_days})
             
             if serializer.is_valid():
-                logger.info(f"Serializer is valid. Validated data: {serializer.validated_data}")
-                # *** Pass the parsed_days data to the save method ***
-                itinerary = serializer.save(user=request.user, days_data=parsed_days)
-                logger.info(f"Itinerary saved with ID: {itinerary.id}")
+                itinerary = serializer.save(user=request.user)
+                logger.info("Created itinerary %s for user %s", itinerary.pk, request.user.pk)
                 
-                # Process and save additional photos
-                for i in range(additional_photos_count):
-                    photo_key = f'additional_photo_{i}'
-                    if photo_key in request.FILES:
-                        photo_file = request.FILES[photo_key]
-                        logger.info(f"Processing additional photo {i}: {photo_file.name}")
-                        try:
-                            photo = ItineraryPhoto.objects.create(
-                                itinerary=itinerary,
-                                image=photo_file,
-                                caption=f"Photo {i+1}"
-                            )
-                            logger.info(f"Created additional photo with ID: {photo.id}")
-                        except Exception as e:
-                            logger.error(f"Error creating additional photo {i}: {e}")
+                # Save additional photos with a single INSERT
+                photos = [
+                    ItineraryPhoto(itinerary=itinerary, image=request.FILES[f'additional_photo_{i}'], caption=f"Photo {i+1}")
+                    for i in range(additional_photos_count)
+                    if f'additional_photo_{i}' in request.FILES
+                ]
+                if photos:
+                    try:
+                        ItineraryPhoto.objects.bulk_create(photos)
+                        # bulk_create skips the post_save handler that queues these
+                        images.schedule(photos)
+                    except Exception as e:
+                        logger.error("Error creating additional photos: %s", e)
                 
+                # Respond with the freshly created document, loaded in a constant number of queries
+                serializer.instance = Itinerary.objects.with_details().get(pk=itinerary.pk)
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             
-            logger.error(f"Serializer errors: {serializer.errors}")
+            logger.info("Itinerary create rejected: %s", serializer.errors)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            logger.exception(f"Error in user_itineraries POST: {e}")
+            logger.exception("Error in user_itineraries POST")
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def user_favorites(request):
+    """
+    GET: The user's favorite itineraries as cards, most recently saved first,
+    read with one query.
+    POST: Save itinerary `itinerary` as a favorite.
+    """
+    if request.method == 'GET':
+        rows = Itinerary.objects.visible_to(request.user).filter(favorited_by__user=request.user).summaries(
+        ).annotate(favorited_at=F('favorited_by__created_at')).order_by('-favorited_at', '-id')
+        serializer = FavoriteItinerarySerializer(rows, many=True)
+        return Response(serializer.data)
+
+    try:
+        itinerary_id = int(request.data.get('itinerary'))
+        if not 1 <= itinerary_id <= MAX_ID:
+            raise ValueError
+    except (TypeError, ValueError):
+        return Response({"error": "'itinerary' must be an itinerary id"}, status=status.HTTP_400_BAD_REQUEST)
+    if not Itinerary.objects.visible_to(request.user).filter(pk=itinerary_id).exists():
+        return Response({"error": "Itinerary not found"}, status=status.HTTP_404_NOT_FOUND)
+    favorite, created = Favorite.objects.get_or_create(user=request.user, itinerary_id=itinerary_id)
+    return Response(FavoriteSerializer(favorite).data,
+                    status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def user_favorite_detail(request, itinerary_id):
+    """Whether itinerary `itinerary_id` is one of the user's favorites (404 if not), or remove it."""
+    if itinerary_id > MAX_ID:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    favorites = Favorite.objects.filter(user=request.user, itinerary_id=itinerary_id)
+    if request.method == 'DELETE':
+        deleted, _ = favorites.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT if deleted else status.HTTP_404_NOT_FOUND)
+    favorite = favorites.first()
+    if favorite is None:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+    return Response(FavoriteSerializer(favorite).data)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def import_favorites(request):
+    """
+    Save many favorites at once, such as those the web app used to keep in
+    the browser. Favorites saved already are left as they are, and ids of
+    itineraries the user cannot see are reported as missing.
+    """
+    serializer = FavoriteImportSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    # Keep the given order so the last id becomes the most recent favorite
+    ids = list(dict.fromkeys(serializer.validated_data['itineraries']))
+    found = set(Itinerary.objects.visible_to(request.user).filter(pk__in=ids).values_list('pk', flat=True))
+    existing = set(Favorite.objects.filter(user=request.user, itinerary_id__in=found).values_list(
+        'itinerary_id', flat=True))
+    new = [Favorite(user=request.user, itinerary_id=pk) for pk in ids if pk in found and pk not in existing]
+    # A favorite saved concurrently is skipped instead of failing the whole import
+    Favorite.objects.bulk_create(new, ignore_conflicts=True)
+    return Response({
+        'imported': len(new),
+        'existing': len(existing),
+        'missing': [pk for pk in ids if pk not in found],
+    })
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([IsAuthenticated])
+@conditional.conditional_itinerary(private=True)
 def itinerary_detail(request, pk):
+    fields = ItinerarySerializer.requested_fields(request.query_params) if request.method == 'GET' else None
     try:
-        itinerary = Itinerary.objects.get(pk=pk)
+        itinerary = Itinerary.objects.with_details(ItinerarySerializer.relations_for(fields)).get(pk=pk)
     except Itinerary.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
     if request.method == 'GET':
-        serializer = ItinerarySerializer(itinerary, context={'request': request})
+        serializer = ItinerarySerializer(itinerary, fields=fields, context={'request': request})
         return Response(serializer.data)
 
     elif request.method == 'PUT':
         if itinerary.user != request.user:
             return Response({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
 
-        logger.info(f"Updating itinerary {pk} for user: {request.user.username}")
+        logger.debug("Updating itinerary %s for user %s", pk, request.user.pk)
         # Copy request data to make it mutable
         data = request.data.copy()
-        logger.info(f"Raw update request data: {data}")
+        payload_logger.debug("Update itinerary %s payload: %s", pk, data)
         
         # Initialize variables to hold parsed days and key
         parsed_days = None
@@ -222,14 +460,12 @@ def itinerary_detail(request, pk):
         if days_key:
             try:
                 parsed_days = json.loads(data[days_key])
-                logger.info(f"Parsed {days_key} data for days update: {parsed_days}")
+                payload_logger.debug("Parsed %s data for days update: %s", days_key, parsed_days)
                 # Remove the raw days string from data before passing to serializer
                 del data[days_key]
             except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error for {days_key} data: {e}")
+                logger.info("JSON decode error for %s data: %s", days_key, e)
                 return Response({days_key: ['Invalid JSON format.']}, status=status.HTTP_400_BAD_REQUEST)
-        else:
-            logger.info(f"No valid days JSON string found in 'days_data' or 'days_json' keys.")
 
         # Prepare context for the serializer, including parsed days data
         serializer_context = {
@@ -238,20 +474,19 @@ def itinerary_detail(request, pk):
         }
 
         # Pass the main data (without raw days string) and context to the serializer
-        logger.info(f"Data being passed to serializer for update: {data}")
-        logger.info(f"Context being passed to serializer: {serializer_context}")
         serializer = ItinerarySerializer(itinerary, data=data, partial=True, context=serializer_context)
         if serializer.is_valid():
-            logger.info(f"Serializer is valid for update. Validated data: {serializer.validated_data}")
             # Save now calls the serializer's update method; pass days_data to trigger nested updates
             serializer.save(days_data=parsed_days)
+            # Reload the nested document so the response reflects the update
+            serializer.instance = Itinerary.objects.with_details().get(pk=itinerary.pk)
             
             # NOTE: Additional photo processing logic was here, removed for clarity as it's separate
             # Re-add if needed, ensuring it doesn't interfere with days processing
             
             return Response(serializer.data)
         
-        logger.error(f"Serializer errors for update: {serializer.errors}")
+        logger.info("Itinerary %s update rejected: %s", pk, serializer.errors)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'DELETE':
@@ -263,12 +498,95 @@ def itinerary_detail(request, pk):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
-def publish_itinerary(request, pk):
+def itinerary_photos(request, pk):
+    """
+    Attach complete chunked uploads to an itinerary as photos.
+    Body: {"uploads": [{"id": "<upload id>", "caption": "..."}]}
+    """
     try:
         itinerary = Itinerary.objects.get(pk=pk, user=request.user)
     except Itinerary.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
+    entries = request.data.get('uploads')
+    if not isinstance(entries, list) or not entries or not all(isinstance(entry, dict) for entry in entries):
+        return Response({'uploads': ['Expected a non-empty list of {"id", "caption"} objects.']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        photos = uploads.attach_photos(itinerary, request.user, entries)
+    except uploads.UploadError as e:
+        return Response({'uploads': [str(e)]}, status=e.status_code)
+    serializer = ItineraryPhotoSerializer(photos, many=True, context={'request': request})
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+def _upload_response(upload, status_code=status.HTTP_200_OK):
+    response = Response({
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'status': upload.status,
+        'max_chunk_size': settings.UPLOAD_MAX_CHUNK_SIZE,
+    }, status=status_code)
+    response['Upload-Offset'] = str(upload.offset)
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_list(request):
+    """Start a chunked upload. Body: {"filename", "size", "content_type"}"""
+    try:
+        upload = uploads.start_upload(
+            request.user, request.data.get('filename'), request.data.get('size'), request.data.get('content_type'))
+    except uploads.UploadError as e:
+        return Response({'error': str(e)}, status=e.status_code)
+    return _upload_response(upload, status.HTTP_201_CREATED)
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_detail(request, upload_id):
+    """
+    GET: current offset, to resume an interrupted upload
+    PUT: raw chunk bytes starting at the offset given in the Upload-Offset header
+    DELETE: abandon the upload
+    """
+    try:
+        upload = Upload.objects.get(pk=upload_id, user=request.user)
+    except Upload.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        return _upload_response(upload)
+
+    if request.method == 'DELETE':
+        uploads.abort(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    try:
+        offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return Response({'error': 'Upload-Offset and Content-Length headers must be integers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        # Read the body straight from the request stream; the parsers are bypassed
+        upload = uploads.append_chunk(upload, offset, request.stream, length)
+    except uploads.OffsetMismatch as e:
+        response = Response({'error': str(e), 'offset': e.expected}, status=e.status_code)
+        response['Upload-Offset'] = str(e.expected)
+        return response
+    except uploads.UploadError as e:
+        return Response({'error': str(e)}, status=e.status_code)
+    return _upload_response(upload)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def publish_itinerary(request, pk):
+    try:
+        itinerary = Itinerary.objects.with_details().get(pk=pk, user=request.user)
+    except Itinerary.DoesNotExist:
+        return Response(status=status.HTTP_404_NOT_FOUND)
+
     # Update the status to published
     itinerary.status = 'published'
     itinerary.save()
@@ -278,6 +596,8 @@ def publish_itinerary(request, pk):
     return Response(serializer.data)
 
 @api_view(['GET', 'POST'])
+@response_cache.cached_response((response_cache.ITINERARY, 'pk'))
+@conditional.conditional_itinerary(children=conditional.REVIEWS)
 def itinerary_reviews(request, pk):
     """
     GET: List all reviews for an itinerary (no authentication required)
@@ -293,12 +613,19 @@ def itinerary_reviews(request, pk):
 
     # GET requests can be unauthenticated
     if request.method == 'GET':
+        fields = ReviewSerializer.requested_fields(request.query_params)
         try:
             reviews = Review.objects.filter(itinerary=itinerary)
-            serializer = ReviewSerializer(reviews, many=True)
-            return Response(serializer.data)
+            if 'user' in ReviewSerializer.relations_for(fields):
+                reviews = reviews.select_related('user')
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(reviews, request)
+            serializer = ReviewSerializer(page, many=True, fields=fields)
+            return paginator.get_paginated_response(serializer.data)
+        except APIException:
+            raise
         except Exception as e:
-            logger.exception(f"Error fetching reviews: {e}")
+            logger.exception("Error fetching reviews for itinerary %s", pk)
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -313,8 +640,7 @@ def itinerary_reviews(request, pk):
                 status=status.HTTP_401_UNAUTHORIZED
             )
             
-        # Log the full request data for debugging
-        logger.info(f"Review POST data: {request.data}")
+        payload_logger.debug("Review payload for itinerary %s: %s", pk, request.data)
             
         # Check if user has already reviewed this itinerary
         existing_review = Review.objects.filter(user=request.user, itinerary=itinerary).first()
@@ -367,7 +693,7 @@ def itinerary_reviews(request, pk):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
         except Exception as e:
-            logger.exception(f"Error creating review: {e}")
+            logger.exception("Error creating review for itinerary %s", pk)
             return Response(
                 {"error": f"Failed to create review: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -411,7 +737,7 @@ def request_password_reset(request):
             user = User.objects.get(email=email)
         except User.DoesNotExist:
             # Don't reveal if user exists or not for security
-            logger.info(f"Password reset requested for non-existent email: {email}")
+            logger.info("Password reset requested for an unknown email")
             return Response({'message': 'If your email exists in our system, you will receive a password reset link shortly.'}, 
                            status=status.HTTP_200_OK)
         
@@ -442,8 +768,8 @@ The Trip Tailor Team
 """
         
         try:
-            logger.info(f"Sending password reset email to {user.email}")
-            logger.info(f"Using SMTP settings: {settings.EMAIL_HOST}, {settings.EMAIL_PORT}, {settings.EMAIL_HOST_USER}")
+            logger.debug("Sending password reset email to user %s via %s:%s",
+                         user.pk, getattr(settings, 'EMAIL_HOST', None), getattr(settings, 'EMAIL_PORT', None))
             
             # Use a more direct approach to catch specific errors
             from django.core.mail import EmailMessage
@@ -455,10 +781,9 @@ The Trip Tailor Team
             )
             email.send(fail_silently=False)
             
-            logger.info(f"Password reset email sent successfully to {user.email}")
+            logger.info("Password reset email sent to user %s", user.pk)
         except Exception as e:
-            logger.error(f"Failed to send password reset email: {str(e)}")
-            logger.exception("Email sending error details:")
+            logger.exception("Failed to send password reset email to user %s", user.pk)
             # For development, you might want to return the actual error for debugging
             if settings.DEBUG:
                 return Response({
@@ -472,7 +797,7 @@ The Trip Tailor Team
                        status=status.HTTP_200_OK)
     
     except Exception as e:
-        logger.exception(f"Error in request_password_reset: {e}")
+        logger.exception("Error in request_password_reset")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
@@ -496,7 +821,7 @@ def validate_reset_token(request, token):
         return Response({'valid': True, 'email': reset_token.user.email}, status=status.HTTP_200_OK)
     
     except Exception as e:
-        logger.exception(f"Error in validate_reset_token: {e}")
+        logger.exception("Error in validate_reset_token")
         return Response({'valid': False, 'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
@@ -551,6 +876,20 @@ def confirm_password_reset(request):
         }, status=status.HTTP_200_OK)
     
     except Exception as e:
-        logger.exception(f"Error in confirm_password_reset: {e}")
+        logger.exception("Error in confirm_password_reset")
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def metrics_view(request):
+    """
+    Request metrics in the Prometheus text format. Readable by staff users and
+    by scrapers sending "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    token_ok = bool(settings.METRICS_TOKEN) and hmac.compare_digest(
+        authorization.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode())
+    if not (token_ok or request.user.is_staff):
+        return Response({'detail': 'You do not have permission to perform this action.'}, status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -12,7 +12,9 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 import dotenv
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -52,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.log.RequestLogMiddleware',
+    'api.metrics.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -70,6 +74,10 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Chunked uploads send and read the byte offset in this header (see api.uploads)
+CORS_ALLOW_HEADERS = (*default_headers, 'upload-offset')
+CORS_EXPOSE_HEADERS = ['Upload-Offset', 'Server-Timing']
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
@@ -151,6 +159,68 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Cache
+# CACHE_BACKEND picks the store for cached API responses: 'locmem' (default,
+# per process), 'file' (per node), 'database' (shared between processes via the
+# api_cache table; run `manage.py createcachetable`) or 'redis' (REDIS_URL).
+# Tests run against a dummy cache; the response cache tests switch to locmem.
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+CACHE_BACKEND = 'dummy' if TESTING else os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'dummy': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tripbackend',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_LOCATION', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'database': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'api_cache',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    },
+}
+CACHES = {'default': CACHE_BACKENDS[CACHE_BACKEND]}
+
+# Seconds a cached API response is kept; writes invalidate entries sooner
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+# Threads generating resized image variants in the background (api.images);
+# 0 generates them inline after the upload commits
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
+# Chunked uploads (api.uploads): partial files are kept outside MEDIA_ROOT
+# until they are attached to an itinerary
+UPLOAD_TEMP_DIR = os.getenv('UPLOAD_TEMP_DIR', os.path.join(BASE_DIR, 'upload_tmp'))
+UPLOAD_MAX_SIZE = 25 * 1024 * 1024
+# Uploads a user may hold at once (in progress, or complete and not attached
+# yet); each keeps a temporary file of up to UPLOAD_MAX_SIZE
+UPLOAD_MAX_OPEN_PER_USER = int(os.getenv('UPLOAD_MAX_OPEN_PER_USER', 20))
+UPLOAD_MAX_CHUNK_SIZE = 5 * 1024 * 1024
+UPLOAD_EXPIRY_HOURS = 24
+
+# Columns of the hashed feature vectors of the similar-itineraries index
+# (api.similar); each published itinerary takes 4 bytes per column in memory
+SIMILAR_INDEX_DIMENSIONS = int(os.getenv('SIMILAR_INDEX_DIMENSIONS', 512))
+
+# Most itineraries returned by one call to /api/itineraries/batch/
+ITINERARY_BATCH_MAX = int(os.getenv('ITINERARY_BATCH_MAX', 50))
+
+# Most favorites accepted by one call to the favorites import endpoint
+FAVORITES_IMPORT_MAX = 500
+
+# Scrapers authenticate to the metrics endpoint (api.metrics) with
+# "Authorization: Bearer <METRICS_TOKEN>"; staff users may always read it
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
 # Email configuration
 if DEBUG and not os.getenv('EMAIL_HOST_PASSWORD'):
     # Use console backend for development if no email password set
@@ -175,43 +245,68 @@ else:
     STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
     STATICFILES_DIRS = []
 
-# Configure logging
+# Logging (see api.log). The development profile logs everything readable to
+# the console and debug.log; the production profile writes one JSON object per
+# line, keeps request handling at one line per request and samples payload dumps.
+LOG_PROFILE = os.getenv('LOG_PROFILE', 'development' if DEBUG else 'production')
+LOG_FILE = os.getenv('LOG_FILE', os.path.join(BASE_DIR, 'debug.log'))
+# Fraction (0..1) of request payload dumps written by the `api.payloads` logger
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', 1 if LOG_PROFILE == 'development' else 0))
+_PRODUCTION_LOGGING = LOG_PROFILE == 'production'
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'formatters': {
         'verbose': {
-            'format': '{levelname} {asctime} {module} {message}',
+            'format': '{levelname} {asctime} {name} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'api.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'redact': {
+            '()': 'api.log.RedactingFilter',
+        },
+        'sample_payloads': {
+            '()': 'api.log.SamplingFilter',
+            'rate': LOG_PAYLOAD_SAMPLE_RATE,
+        },
     },
     'handlers': {
         'console': {
-            'level': 'DEBUG',
+            'level': 'WARNING' if TESTING else 'DEBUG',
             'class': 'logging.StreamHandler',
-            'formatter': 'verbose',
+            'formatter': 'json' if _PRODUCTION_LOGGING else 'verbose',
+            'filters': ['redact'],
         },
         'file': {
             'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'debug.log'),
-            'formatter': 'verbose',
+            '()': 'api.log.QueueFileHandler',
+            'filename': LOG_FILE,
+            'max_bytes': 10 * 1024 * 1024,
+            'backup_count': 5,
+            'formatter': 'json' if _PRODUCTION_LOGGING else 'verbose',
+            'filters': ['redact'],
         },
     },
+    # Handlers are attached to the root logger only, so every record is written once
     'loggers': {
         'django': {
-            'handlers': ['console', 'file'],
-            'level': 'INFO',
-            'propagate': True,
+            'level': 'WARNING' if _PRODUCTION_LOGGING else 'INFO',
         },
         'api': {
-            'handlers': ['console', 'file'],
-            'level': 'DEBUG',
-            'propagate': True,
+            'level': 'INFO' if _PRODUCTION_LOGGING else 'DEBUG',
+        },
+        'api.payloads': {
+            'level': 'DEBUG' if LOG_PAYLOAD_SAMPLE_RATE > 0 else 'INFO',
+            'filters': ['sample_payloads'],
         },
     },
     'root': {
         'handlers': ['console', 'file'],
-        'level': 'DEBUG',
+        'level': 'WARNING' if _PRODUCTION_LOGGING else 'INFO',
     },
 }
@@ -13,6 +13,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@
 import { PlusCircle, Trash2, MapPin, AlertCircle } from "lucide-react"
 import { useJsApiLoader, Autocomplete } from '@react-google-maps/api'
 import { useSession } from "next-auth/react"
+import { attachPhotos, uploadFile } from "@/lib/uploads"
 
 interface Stop {
   id: string
@@ -343,15 +344,8 @@ export default function CreateItineraryPage() {
       }
       // The validateForm() function already checks if image exists before allowing submission
 
-      // Add any additional photos
-      if (additionalPhotos.length > 0) {
-        // We can't directly append an array of files, so we append them individually
-        additionalPhotos.forEach((photo, index) => {
-          formData.append(`additional_photo_${index}`, photo);
-        });
-        // Add a count so the backend knows how many photos to process
-        formData.append('additional_photos_count', additionalPhotos.length.toString());
-      }
+      // Additional photos are sent separately through the chunked upload API
+      // once the itinerary exists, so a large post cannot fail as a whole
 
       // Create days array with nested stops
       const daysData = Array.from({ length: duration }).map((_, index) => {
@@ -426,6 +420,19 @@ export default function CreateItineraryPage() {
           }
       }
 
+      if (additionalPhotos.length > 0) {
+        const created = await response.json()
+        const uploadIds: string[] = []
+        for (const photo of additionalPhotos) {
+          uploadIds.push(await uploadFile(photo, token))
+        }
+        await attachPhotos(
+          created.id,
+          uploadIds.map((id, index) => ({ id, caption: `Photo ${index + 1}` })),
+          token
+        )
+      }
+
       // --- Change: Redirect on success, remove alert and setItineraryId --- 
       console.log("Itinerary created and published successfully!")
       window.location.href = "/search" // Redirect immediately
@@ -5,6 +5,7 @@ import { useParams } from "next/navigation"
 import Link from "next/link"
 import { MapPin } from "lucide-react"
 import { Card, CardContent } from "@/components/ui/card"
+import { imageUrl, type ImageVariants } from "@/lib/utils"
 
 interface Itinerary {
   id: number
@@ -14,6 +15,7 @@ interface Itinerary {
   duration: number
   price: number
   image: string
+  image_variants?: ImageVariants
   user: {
     id: number
     first_name: string
@@ -49,11 +51,12 @@ export default function CreatorItinerariesPage() {
         }
         
         const data = await response.json()
-        setItineraries(data)
+        const results = data.results
+        setItineraries(results)
         
         // Set creator name from the first itinerary if available
-        if (data.length > 0 && data[0].user) {
-          const user = data[0].user
+        if (results.length > 0 && results[0].user) {
+          const user = results[0].user
           setCreatorName(`${user.first_name} ${user.last_name}`)
         }
       } catch (err) {
@@ -106,7 +109,7 @@ export default function CreatorItinerariesPage() {
                 <div className="relative h-48 w-full overflow-hidden">
                   {itinerary.image ? (
                     <img
-                      src={itinerary.image.startsWith('http') ? itinerary.image : `${process.env.NEXT_PUBLIC_API_URL}${itinerary.image}`}
+                      src={imageUrl(itinerary.image, itinerary.image_variants)}
                       alt={itinerary.name}
                       className="object-cover w-full h-full transition-transform group-hover:scale-105"
                       onError={(e) => {
@@ -13,6 +13,7 @@ import Link from "next/link"
 import { useToast } from "@/components/ui/use-toast"
 import dynamic from "next/dynamic"
 import { useSession } from "next-auth/react"
+import { imageUrl, type ImageVariants } from "@/lib/utils"
 
 interface Itinerary {
   id: number
@@ -22,6 +23,7 @@ interface Itinerary {
   duration: number
   price: number
   image: string
+  image_variants?: ImageVariants
   status: string
   user: {
     username: string
@@ -101,7 +103,8 @@ export default function ItineraryDetailPage() {
       try {
         const response = await fetch(
           `${process.env.NEXT_PUBLIC_API_URL}/api/itineraries/${id}/`,
-          { cache: 'no-store' }
+          // Revalidate with the stored ETag; the API answers 304 when nothing changed
+          { cache: 'no-cache' }
         )
         if (!response.ok) {
           throw new Error("Failed to fetch itinerary")
@@ -128,10 +131,6 @@ export default function ItineraryDetailPage() {
         console.log("Itinerary user:", data.user?.username)
         console.log("Should show edit button:", data.user?.id.toString() === localStorage.getItem('userId'))
         setItinerary(data)
-        
-        // Check if this itinerary is in favorites
-        const favorites = JSON.parse(localStorage.getItem('favorites') || '[]')
-        setIsFavorite(favorites.some((fav: Itinerary) => fav.id === data.id))
       } catch (err) {
         console.error("Error fetching itinerary:", err)
         setError(err instanceof Error ? err.message : "An error occurred")
@@ -143,6 +142,20 @@ export default function ItineraryDetailPage() {
     fetchItinerary()
   }, [id])
 
+  useEffect(() => {
+    const token = session?.user?.token
+    if (!token) {
+      setIsFavorite(false)
+      return
+    }
+    // 200 when this itinerary is one of the user's favorites, 404 when not
+    fetch(`${process.env.NEXT_PUBLIC_API_URL}/api/user/favorites/${id}/`, {
+      headers: { 'Authorization': `Token ${token}` }
+    })
+      .then((response) => setIsFavorite(response.ok))
+      .catch((err) => console.error("Error checking favorite:", err))
+  }, [id, session?.user?.token])
+
   useEffect(() => {
     const fetchReviews = async () => {
       try {
@@ -150,7 +163,7 @@ export default function ItineraryDetailPage() {
         // Don't require token for GET requests
         const response = await fetch(
           `${process.env.NEXT_PUBLIC_API_URL}/api/itineraries/${id}/reviews/`,
-          { cache: 'no-store' }
+          { cache: 'no-cache' }
         )
         console.log('Reviews API response status:', response.status)
         
@@ -187,11 +200,11 @@ export default function ItineraryDetailPage() {
 
         const data = await response.json()
         console.log('Reviews data:', data)
-        setReviews(data)
+        setReviews(data.results)
         
         const userId = session?.user?.id
         if (userId) {
-          const userReview = data.find((review: Review) => review.user.id.toString() === userId)
+          const userReview = data.results.find((review: Review) => review.user.id.toString() === userId)
           setHasReviewed(!!userReview)
         }
       } catch (err) {
@@ -223,22 +236,40 @@ export default function ItineraryDetailPage() {
     )
   }
 
-  const toggleFavorite = () => {
+  const toggleFavorite = async () => {
     if (!itinerary) return
+    if (status !== "authenticated" || !session?.user?.token) {
+      toast({
+        title: "Error",
+        description: "You must be logged in to save favorites",
+        variant: "destructive"
+      })
+      return
+    }
 
-    const favorites = JSON.parse(localStorage.getItem('favorites') || '[]')
-    let newFavorites
-
-    if (isFavorite) {
-      // Remove from favorites
-      newFavorites = favorites.filter((fav: Itinerary) => fav.id !== itinerary.id)
+    const response = await fetch(
+      isFavorite
+        ? `${process.env.NEXT_PUBLIC_API_URL}/api/user/favorites/${itinerary.id}/`
+        : `${process.env.NEXT_PUBLIC_API_URL}/api/user/favorites/`,
+      {
+        method: isFavorite ? 'DELETE' : 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Token ${session.user.token}`
+        },
+        body: isFavorite ? undefined : JSON.stringify({ itinerary: itinerary.id })
+      }
+    )
+    // 404 on removal: it was removed already, e.g. from another device
+    if (response.ok || (isFavorite && response.status === 404)) {
+      setIsFavorite(!isFavorite)
     } else {
-      // Add to favorites
-      newFavorites = [...favorites, itinerary]
+      toast({
+        title: "Error",
+        description: "Failed to update your favorites",
+        variant: "destructive"
+      })
     }
-
-    localStorage.setItem('favorites', JSON.stringify(newFavorites))
-    setIsFavorite(!isFavorite)
   }
 
   const handleSubmitReview = async (e: React.FormEvent) => {
@@ -458,7 +489,7 @@ export default function ItineraryDetailPage() {
         <div className="lg:col-span-2">
           <div className="relative h-[400px] w-full rounded-lg overflow-hidden mb-6">
             <img
-              src={itinerary.image}
+              src={imageUrl(itinerary.image, itinerary.image_variants, "full")}
               alt={itinerary.name}
               className="object-cover w-full h-full"
             />
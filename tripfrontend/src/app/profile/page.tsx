@@ -7,6 +7,7 @@ import { Button } from "@/components/ui/button"
 import { Card, CardContent } from "@/components/ui/card"
 import { fetchAPI } from "@/lib/api"
 import { PlusCircle, MapPin } from "lucide-react"
+import { imageUrl, type ImageVariants } from "@/lib/utils"
 
 // Define the structure for an itinerary (consider moving to a shared types file)
 interface Itinerary {
@@ -17,6 +18,7 @@ interface Itinerary {
   duration: number
   price: number
   image: string
+  image_variants?: ImageVariants
   status: 'draft' | 'published'
 }
 
@@ -39,8 +41,8 @@ export default function ProfilePage() {
         setError(null)
         try {
           const data = await fetchAPI("/api/user/itineraries/")
-          if (Array.isArray(data)) {
-            setItineraries(data)
+          if (Array.isArray(data?.results)) {
+            setItineraries(data.results)
           } else {
             throw new Error("Invalid API response format")
           }
@@ -101,7 +103,7 @@ export default function ProfilePage() {
                 <div className="relative h-48 w-full overflow-hidden">
                   {itinerary.image ? (
                     <img
-                      src={`${process.env.NEXT_PUBLIC_API_URL}${itinerary.image}`}
+                      src={imageUrl(itinerary.image, itinerary.image_variants)}
                       alt={itinerary.name}
                       className="object-cover w-full h-full transition-transform group-hover:scale-105"
                       onError={(e) => {
@@ -94,5 +94,5 @@ export async function uploadFormData(endpoint: string, formData: FormData, metho
 
 export async function getItineraries(): Promise<Itinerary[]> {
   const response = await fetchAPI("/api/itineraries/")
-  return response || []
+  return response?.results || []
 }
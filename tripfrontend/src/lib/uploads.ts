@@ -0,0 +1,92 @@
+const API_URL = process.env.NEXT_PUBLIC_API_URL
+
+const MAX_RETRIES = 5
+
+interface UploadState {
+  id: string
+  size: number
+  offset: number
+  status: "pending" | "complete"
+  max_chunk_size: number
+}
+
+async function uploadRequest(path: string, token: string, init: RequestInit = {}) {
+  return fetch(`${API_URL}${path}`, {
+    ...init,
+    headers: { Authorization: `Token ${token}`, ...(init.headers as Record<string, string> || {}) },
+  })
+}
+
+function wait(ms: number) {
+  return new Promise(resolve => setTimeout(resolve, ms))
+}
+
+/**
+ * Upload a file through the chunked upload API and return its upload id.
+ * Each chunk is retried with backoff; after a failure the server is asked for
+ * the stored offset, so an interrupted upload resumes instead of restarting.
+ */
+export async function uploadFile(
+  file: File,
+  token: string,
+  onProgress?: (sent: number, total: number) => void
+): Promise<string> {
+  const start = await uploadRequest("/api/uploads/", token, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, size: file.size, content_type: file.type }),
+  })
+  if (!start.ok) {
+    const error = await start.json().catch(() => ({}))
+    throw new Error(error.error || `Could not start upload of ${file.name}`)
+  }
+  let upload: UploadState = await start.json()
+  let failures = 0
+
+  while (upload.status !== "complete") {
+    const chunk = file.slice(upload.offset, upload.offset + upload.max_chunk_size)
+    try {
+      const response = await uploadRequest(`/api/uploads/${upload.id}/`, token, {
+        method: "PUT",
+        headers: { "Content-Type": "application/octet-stream", "Upload-Offset": String(upload.offset) },
+        body: chunk,
+      })
+      if (response.status === 409) {
+        // The server has a different offset than we thought: continue from there
+        upload = { ...upload, offset: Number(response.headers.get("Upload-Offset")) }
+        continue
+      }
+      if (!response.ok) {
+        const error = await response.json().catch(() => ({}))
+        throw new Error(error.error || `Upload of ${file.name} failed`)
+      }
+      upload = await response.json()
+      failures = 0
+      onProgress?.(upload.offset, upload.size)
+    } catch (error) {
+      if (++failures > MAX_RETRIES) throw error
+      await wait(500 * 2 ** failures)
+      const status = await uploadRequest(`/api/uploads/${upload.id}/`, token).catch(() => null)
+      if (status?.ok) upload = await status.json()
+    }
+  }
+  return upload.id
+}
+
+/** Attach finished uploads to an itinerary as photos. */
+export async function attachPhotos(
+  itineraryId: number | string,
+  uploads: { id: string; caption?: string }[],
+  token: string
+) {
+  const response = await uploadRequest(`/api/user/itineraries/${itineraryId}/photos/`, token, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ uploads }),
+  })
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}))
+    throw new Error(error.uploads?.join(", ") || "Could not attach photos")
+  }
+  return response.json()
+}
@@ -4,3 +4,27 @@ import { twMerge } from "tailwind-merge"
 export function cn(...inputs: ClassValue[]) {
   return twMerge(clsx(inputs))
 }
+
+export interface ImageVariant {
+  width: number
+  height: number
+  webp?: string
+  jpeg?: string
+}
+
+export type ImageVariants = Partial<Record<"thumb" | "card" | "full", ImageVariant>>
+
+function mediaUrl(path: string): string {
+  return path.startsWith("http") ? path : `${process.env.NEXT_PUBLIC_API_URL}${path}`
+}
+
+// Resized copy of an image when the API has generated one, else the original upload
+export function imageUrl(
+  image: string | null | undefined,
+  variants?: ImageVariants | null,
+  size: keyof ImageVariants = "card"
+): string | undefined {
+  const variant = variants?.[size]
+  const path = variant?.webp ?? variant?.jpeg ?? image
+  return path ? mediaUrl(path) : undefined
+}